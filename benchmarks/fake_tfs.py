@@ -0,0 +1,67 @@
+"""Local fake TF Serving answering REST and gRPC ``Predict`` calls with RFCN-shaped outputs.
+
+Every answer holds the 300 detection rows of the RFCN signature, ``--detections`` of them
+valid, after ``--latency`` seconds plus up to ``--jitter`` random seconds of simulated inference.
+
+    python -m benchmarks.fake_tfs [--port 8501] [--grpc-port 8500] [--latency 0.05] [--jitter 0.02]
+"""
+import argparse
+import multiprocessing
+import signal
+
+from counter.adapters.tfs_stub import StubPredictionServer, StubRestServer
+
+
+def serve(port: int, grpc_port: int, detections: int, latency: float, jitter: float, ports=None, stop=None):
+    """Runs both servers until ``stop`` is set (or SIGINT/SIGTERM); reports the bound ports on ``ports``."""
+    rest = StubRestServer(num_detections=detections, port=port, latency=latency, jitter=jitter,
+                          parse_requests=False).start()
+    grpc_server = StubPredictionServer(num_detections=detections, port=grpc_port, max_workers=32,
+                                       latency=latency, jitter=jitter).start()
+    if ports is not None:
+        ports.put((rest.port, grpc_server.port))
+    try:
+        if stop is not None:
+            stop.wait()
+        else:
+            signal.sigwait({signal.SIGINT, signal.SIGTERM})
+    finally:
+        rest.stop()
+        grpc_server.stop(0)
+
+
+def start_in_subprocess(detections: int, latency: float, jitter: float, port: int = 0, grpc_port: int = 0):
+    """Starts the fake TF Serving in its own process, so it does not compete for the GIL of the app under test.
+
+    Returns:
+        tuple: ``(stop, rest_port, grpc_port)``; call ``stop()`` to shut it down
+    """
+    context = multiprocessing.get_context("spawn")
+    ports, stop_event = context.Queue(), context.Event()
+    process = context.Process(target=serve, args=(port, grpc_port, detections, latency, jitter, ports, stop_event),
+                              daemon=True)
+    process.start()
+    rest_port, grpc_port = ports.get(timeout=30)
+
+    def stop():
+        stop_event.set()
+        process.join(timeout=10)
+
+    return stop, rest_port, grpc_port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8501, help="REST port")
+    parser.add_argument("--grpc-port", type=int, default=8500, help="gRPC port")
+    parser.add_argument("--detections", type=int, default=100, help="valid detections per image (out of 300)")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated inference seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="random extra seconds, up to this value")
+    args = parser.parse_args()
+    print(f"Fake TF Serving on REST :{args.port} and gRPC :{args.grpc_port} (Ctrl+C to stop)")
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+    serve(args.port, args.grpc_port, args.detections, args.latency, args.jitter)
+
+
+if __name__ == "__main__":
+    main()
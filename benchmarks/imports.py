@@ -0,0 +1,95 @@
+"""Cold import time of the app, with the cost of every imported module and package.
+
+    python -m benchmarks.imports [--module counter.entrypoints.webapp] [--top 15]
+    python -m benchmarks.imports --save imports.json
+    python -m benchmarks.imports --baseline imports.json --tolerance 0.2
+
+Every measurement imports the module in a fresh interpreter, as a newly started worker does.
+The reported ``cold_import_ms`` is the best wall time of ``--repeat`` imports; the per-module
+table comes from one more run under ``python -X importtime``, whose bookkeeping makes it slower.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from benchmarks.report import add_baseline_arguments, finish
+
+APP_MODULE = "counter.entrypoints.webapp"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TIMED_IMPORT = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> List[ImportTime]:
+    """Parses the ``import time: self | cumulative | module`` lines ``-X importtime`` writes to stderr."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():  # the header line
+            continue
+        module = name.rstrip()
+        depth = (len(module) - len(module.lstrip())) // 2
+        modules.append(ImportTime(module.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def package_totals(modules: List[ImportTime]) -> Dict[str, int]:
+    """Self time of the modules of every top-level package, in microseconds, most expensive first."""
+    totals = {}
+    for module in modules:
+        package = module.module.split(".")[0]
+        totals[package] = totals.get(package, 0) + module.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def _run(args: List[str], env: Optional[Dict[str, str]]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], capture_output=True, text=True, check=True, cwd=ROOT,
+                          env={**os.environ, **(env or {})})
+
+
+def profile_imports(module: str = APP_MODULE, env: Optional[Dict[str, str]] = None) -> List[ImportTime]:
+    """Imports ``module`` in a fresh interpreter under ``-X importtime`` and returns every module it loaded."""
+    return parse_importtime(_run(["-X", "importtime", "-c", f"import {module}"], env).stderr)
+
+
+def cold_import_seconds(module: str = APP_MODULE, repeat: int = 3, env: Optional[Dict[str, str]] = None) -> float:
+    """Best wall time of importing ``module`` in ``repeat`` fresh interpreters."""
+    return min(float(_run(["-c", _TIMED_IMPORT.format(module=module)], env).stdout) for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default=APP_MODULE, help="module imported by a starting worker")
+    parser.add_argument("--top", type=int, default=15, help="modules and packages listed")
+    parser.add_argument("--repeat", type=int, default=5, help="timed imports, the best one is reported")
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    modules = profile_imports(args.module)
+    print(f"{'self ms':>9} {'cumul ms':>9}  module")
+    for module in sorted(modules, key=lambda m: m.self_us, reverse=True)[:args.top]:
+        print(f"{module.self_us / 1000:9.1f} {module.cumulative_us / 1000:9.1f}  {module.module}")
+    print(f"\n{'self ms':>9}  package")
+    for package, self_us in list(package_totals(modules).items())[:args.top]:
+        print(f"{self_us / 1000:9.1f}  {package}")
+
+    results = {"cold_import_ms": cold_import_seconds(args.module, args.repeat) * 1000}
+    print(f"\ncold import of {args.module}: {results['cold_import_ms']:.1f} ms ({len(modules)} modules)")
+    sys.exit(finish(results, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Load test of the real Flask app against a local fake TF Serving.
+
+Starts the fake TF Serving (benchmarks.fake_tfs) in a subprocess, serves ``create_app()`` on a
+local threaded server, and posts the images of ``resources/images`` to ``/v1/object-count``
+from ``--concurrency`` client threads. Reports p50/p95/p99 latency, throughput, and the time
+spent in each stage of a request (from the app's ``counter_stage_duration_seconds`` histogram).
+
+The app is configured from the usual environment variables (``TFS_BATCHING_ENABLED``,
+``PREDICTION_CACHE_ENABLED``, ...); the TF Serving address, ``ENV=prod`` and the count repo are
+set by the benchmark.
+
+    python -m benchmarks.load [--duration 10] [--concurrency 8] [--protocol rest] [--latency 0.05]
+    python -m benchmarks.load --save baseline.json
+    python -m benchmarks.load --baseline baseline.json --tolerance 0.15
+"""
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+IMAGES_DIR = Path(__file__).resolve().parent.parent / "resources" / "images"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def stage_totals(histogram):
+    """``{stage: (sum, count)}`` of the stage histogram, to diff before and after the measurement."""
+    return {key[0]: (total, count) for key, (_, total, count) in histogram.samples().items()}
+
+
+def run_clients(url: str, images, concurrency: int, duration: float, threshold: float):
+    """Posts images from ``concurrency`` threads for ``duration`` seconds; returns the latencies and error count."""
+    import requests
+
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset: int):
+        session = requests.Session()
+        sent = offset
+        while time.perf_counter() < deadline:
+            name, data = images[sent % len(images)]
+            sent += 1
+            start = time.perf_counter()
+            response = session.post(url, files={"file": (name, data, "image/jpeg")},
+                                    data={"threshold": str(threshold)})
+            elapsed = time.perf_counter() - start
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--protocol", choices=("rest", "grpc"), default="rest", help="app to TF Serving protocol")
+    parser.add_argument("--repo", default="in_memory", help="COUNT_REPO of the app")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--detections", type=int, default=100, help="valid detections per image (out of 300)")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated inference seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="random extra inference seconds")
+    from benchmarks.report import add_baseline_arguments
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    # Constants are read at import time: configure the app before anything of counter is imported
+    rest_port, grpc_port = free_port(), free_port()
+    os.environ.update({"ENV": "prod", "TFS_HOST": "127.0.0.1", "TFS_PORT": str(rest_port),
+                       "TFS_GRPC_PORT": str(grpc_port), "TFS_PROTOCOL": args.protocol, "COUNT_REPO": args.repo})
+    os.environ.setdefault("DEBUG_SAMPLE_RATE", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from werkzeug.serving import make_server
+
+    from benchmarks.fake_tfs import start_in_subprocess
+    from benchmarks.report import finish, percentile
+    from counter.config import get_model_registry
+    from counter.entrypoints.webapp import create_app
+    from counter.metrics import STAGE_SECONDS
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log line per request
+    stop_tfs, _, _ = start_in_subprocess(args.detections, args.latency, args.jitter, rest_port, grpc_port)
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    get_model_registry().wait()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/object-count"
+    images = [(path.name, path.read_bytes()) for path in sorted(IMAGES_DIR.glob("*.jpg"))]
+
+    try:
+        run_clients(url, images, args.concurrency, args.warmup, args.threshold)
+        stages_before = stage_totals(STAGE_SECONDS)
+        started = time.perf_counter()
+        latencies, errors = run_clients(url, images, args.concurrency, args.duration, args.threshold)
+        elapsed = time.perf_counter() - started
+        stages = stage_totals(STAGE_SECONDS)
+    finally:
+        server.shutdown()
+        stop_tfs()
+
+    latencies.sort()
+    results = {"load_rps": len(latencies) / elapsed}
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        results[f"load_{name}_ms"] = percentile(latencies, fraction) * 1000
+
+    print(f"{len(latencies)} requests, {errors} errors in {elapsed:.1f}s with {args.concurrency} clients "
+          f"({args.protocol}, {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms simulated inference)")
+    print(f"throughput  {results['load_rps']:8.1f} req/s")
+    print(f"latency     p50 {results['load_p50_ms']:.1f} ms   p95 {results['load_p95_ms']:.1f} ms   "
+          f"p99 {results['load_p99_ms']:.1f} ms")
+    print(f"{'stage':<18}{'calls/request':>14}{'mean ms':>10}")
+    for stage, (total, count) in sorted(stages.items()):
+        total -= stages_before.get(stage, (0, 0))[0]
+        count -= stages_before.get(stage, (0, 0))[1]
+        if count:
+            results[f"stage_{stage}_ms"] = total / count * 1000
+            print(f"{stage:<18}{count / max(len(latencies), 1):>14.2f}{total / count * 1000:>10.2f}")
+
+    # Stage means of short runs are noisy: they are saved for reference, only the load metrics are compared
+    sys.exit(finish(results, args, informational=("stage_",)))
+
+
+if __name__ == "__main__":
+    main()
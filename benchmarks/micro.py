@@ -0,0 +1,85 @@
+"""Microbenchmarks of the counting hot path and of the count repositories.
+
+    python -m benchmarks.micro [--detections 300] [--number 2000]
+    python -m benchmarks.micro --save micro.json
+    python -m benchmarks.micro --baseline micro.json --tolerance 0.2
+
+Repositories that need a server are measured on what runs locally: ``CountPostgresRepo``
+goes through its SQLAlchemy upsert against a temporary SQLite file.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.report import add_baseline_arguments, finish
+from counter.adapters.count_repo import CountInMemoryRepo, CountSharedMemoryRepo
+from counter.adapters.helpers import Helpers
+from counter.adapters.models import Base
+from counter.adapters.postgres_repo import CountPostgresRepo
+from counter.adapters.tfs_detector import TFSObjectDetector
+from counter.adapters.tfs_stub import canned_rfcn_outputs
+from counter.domain.models import ObjectCount
+from counter.domain.predictions import batch_count, batch_over_threshold, count, over_threshold
+
+CLASSES = ["person", "bottle", "cup", "chair", "dining table", "cat"]
+
+
+def prediction_benchmarks(detections: int):
+    class_names = TFSObjectDetector.build_class_names(TFSObjectDetector.build_classes_dict())
+    raw = {name: tensor[0] for name, tensor in canned_rfcn_outputs(detections).items()}
+    batch = TFSObjectDetector.raw_predictions_to_batch(raw, class_names)
+    predictions = batch.to_predictions()
+    return {
+        "parse_raw_outputs": lambda: TFSObjectDetector.raw_predictions_to_batch(raw, class_names),
+        "count_objects": lambda: count(list(over_threshold(predictions, 0.5))),
+        "count_columnar": lambda: batch_count(batch_over_threshold(batch, 0.5)),
+    }
+
+
+def sqlite_postgres_repo(path: str) -> CountPostgresRepo:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with mock.patch.object(Helpers, "create_postgres_session_factory", lambda *_: sessionmaker(engine)):
+        return CountPostgresRepo("user", "password", "localhost", "5432", "benchmark")
+
+
+def repo_benchmarks(directory: str):
+    deltas = [ObjectCount(object_class, 1) for object_class in CLASSES]
+    repos = {"in_memory": CountInMemoryRepo(),
+             "shared_memory": CountSharedMemoryRepo(),
+             "postgres_sqlite": sqlite_postgres_repo(os.path.join(directory, "counts.db"))}
+    benchmarks = {}
+    for name, repo in repos.items():
+        benchmarks[f"repo_{name}_update"] = lambda repo=repo: repo.update_values(deltas)
+        benchmarks[f"repo_{name}_update_and_read"] = lambda repo=repo: repo.update_and_read_values(deltas)
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--detections", type=int, default=300, help="valid detections per image")
+    parser.add_argument("--number", type=int, default=2000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements, the best one is reported")
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = {**prediction_benchmarks(args.detections), **repo_benchmarks(directory)}
+        results = {}
+        for name, benchmark in benchmarks.items():
+            number = max(1, args.number // 20) if "sqlite" in name else args.number
+            seconds = min(timeit.Timer(benchmark).repeat(repeat=args.repeat, number=number)) / number
+            results[f"{name}_us"] = seconds * 1e6
+            print(f"{name:<38} {seconds * 1e6:10.2f} us/call")
+
+    sys.exit(finish(results, args))
+
+
+if __name__ == "__main__":
+    main()
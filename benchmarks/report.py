@@ -0,0 +1,68 @@
+"""Result files and baseline comparison shared by the benchmarks.
+
+Results are flat ``{metric: value}`` dicts. Metrics ending in ``_rps`` are better when higher,
+every other metric (latencies, seconds per call) when lower.
+"""
+import json
+import math
+from typing import Dict, List, Sequence
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values (``fraction`` in [0, 1])."""
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
+
+
+def save_results(path: str, results: Dict[str, float]):
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def compare_to_baseline(results: Dict[str, float], baseline: Dict[str, float], tolerance: float,
+                        informational: Sequence[str] = ()) -> List[str]:
+    """Returns a description of every metric more than ``tolerance`` (e.g. 0.1 = 10%) worse than the baseline.
+
+    Metrics starting with one of the ``informational`` prefixes are saved but never reported.
+    """
+    regressions = []
+    for metric, value in sorted(results.items()):
+        reference = baseline.get(metric)
+        if not reference or metric.startswith(tuple(informational)):
+            continue
+        change = (value - reference) / reference
+        worse = -change if metric.endswith("_rps") else change
+        if worse > tolerance:
+            regressions.append(f"{metric}: {reference:.6g} -> {value:.6g} ({change:+.1%})")
+    return regressions
+
+
+def check_baseline(results: Dict[str, float], baseline_path: str, tolerance: float,
+                   informational: Sequence[str] = ()) -> int:
+    """Prints the regressions against the baseline file; returns the process exit code (1 on regressions)."""
+    with open(baseline_path) as baseline_file:
+        regressions = compare_to_baseline(results, json.load(baseline_file), tolerance, informational)
+    if not regressions:
+        print(f"No regression beyond {tolerance:.0%} against {baseline_path}")
+        return 0
+    print(f"Regressions beyond {tolerance:.0%} against {baseline_path}:")
+    for regression in regressions:
+        print(f"  {regression}")
+    return 1
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument("--save", metavar="PATH", help="write the results to this JSON file (e.g. a new baseline)")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown tolerated before a metric is reported as a regression")
+
+
+def finish(results: Dict[str, float], args, informational: Sequence[str] = ()) -> int:
+    """Saves and/or compares the results as requested on the command line; returns the process exit code."""
+    if args.save:
+        save_results(args.save, results)
+    if args.baseline:
+        return check_baseline(results, args.baseline, args.tolerance, informational)
+    return 0
@@ -0,0 +1,51 @@
+"""Microbenchmark of the ``/v1/object-count`` response serialization.
+
+Compares the previous path (pydantic ``CountResponse`` validation, ``model_dump`` and Flask
+``jsonify``) with ``model_construct`` and the direct encoder of counter.entrypoints.responses.
+
+    python -m benchmarks.serialization [--classes 5] [--number 20000]
+"""
+import argparse
+import timeit
+
+from flask import jsonify
+
+from counter.domain.models import CountResponse, ObjectCount
+from counter.entrypoints.responses import count_response_json
+from counter.entrypoints.webapp import create_app
+
+
+def validated_jsonify(current_objects, total_objects):
+    count_response = CountResponse(current_objects=current_objects, total_objects=total_objects)
+    return jsonify(count_response.model_dump(exclude_none=True)).get_data()
+
+
+def constructed_encoder(current_objects, total_objects):
+    count_response = CountResponse.model_construct(current_objects=current_objects, total_objects=total_objects)
+    return count_response_json(count_response).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--classes", type=int, default=5, help="object classes in the response")
+    parser.add_argument("--number", type=int, default=20000, help="serializations per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements, the best one is reported")
+    args = parser.parse_args()
+
+    current_objects = [ObjectCount(f"class-{i}", i + 1) for i in range(args.classes)]
+    total_objects = [ObjectCount(f"class-{i}", 1000 * (i + 1)) for i in range(args.classes)]
+
+    with create_app().app_context():
+        results = {}
+        for name, serialize in (("validated + jsonify", validated_jsonify),
+                                ("constructed + encoder", constructed_encoder)):
+            timer = timeit.Timer(lambda: serialize(current_objects, total_objects))
+            results[name] = min(timer.repeat(repeat=args.repeat, number=args.number)) / args.number
+
+    baseline = results["validated + jsonify"]
+    for name, seconds in results.items():
+        print(f"{name:<24} {seconds * 1e6:8.2f} us/response   x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
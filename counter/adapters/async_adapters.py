@@ -0,0 +1,43 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import BinaryIO, List
+
+from counter.domain.models import Prediction, ObjectCount, PredictionBatch
+from counter.domain.ports import AsyncObjectDetector, AsyncObjectCountRepo, ObjectDetector, ObjectCountRepo
+
+
+class ThreadedObjectDetector(AsyncObjectDetector):
+    """Exposes a synchronous ObjectDetector through the async port by running it in an executor."""
+
+    def __init__(self, object_detector: ObjectDetector, executor: Executor):
+        self.__object_detector = object_detector
+        self.__executor = executor
+
+    async def predict(self, image: BinaryIO) -> List[Prediction]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__object_detector.predict, image)
+
+    async def predict_columnar(self, image: BinaryIO) -> PredictionBatch:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__object_detector.predict_columnar, image)
+
+
+class ThreadedObjectCountRepo(AsyncObjectCountRepo):
+    """Exposes a synchronous ObjectCountRepo through the async port by running it in an executor."""
+
+    def __init__(self, object_count_repo: ObjectCountRepo, executor: Executor):
+        self.__object_count_repo = object_count_repo
+        self.__executor = executor
+
+    async def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__object_count_repo.read_values, object_classes)
+
+    async def update_values(self, new_values: List[ObjectCount]):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__object_count_repo.update_values, new_values)
+
+    async def update_and_read_values(self, new_values: List[ObjectCount]) -> List[ObjectCount]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, self.__object_count_repo.update_and_read_values,
+                                          new_values)
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import BinaryIO, List
+
+from counter.domain.models import Prediction, PredictionBatch
+from counter.domain.ports import ObjectDetector
+from counter.metrics import REGISTRY
+
+BATCH_SIZE = REGISTRY.histogram("counter_detector_batch_size", "Number of images sent in one batched predict call",
+                                ["model"], buckets=(1, 2, 4, 8, 16, 32, 64))
+BATCH_QUEUE_DEPTH = REGISTRY.gauge("counter_detector_batch_queue_depth",
+                                   "Images waiting to be picked into a batch", ["model"])
+BATCH_REJECTED = REGISTRY.counter("counter_detector_batch_rejected_total",
+                                  "Predict calls rejected because the batching queue was full", ["model"])
+
+
+class DetectorOverloadedError(RuntimeError):
+    """Raised when a predict call cannot be queued because the detector is saturated."""
+
+
+class BatchingObjectDetector(ObjectDetector):
+    """Decorator gathering concurrent predict calls into batched calls to the wrapped detector.
+
+    Callers enqueue their image and block on a future. A worker thread takes the first queued
+    image, then keeps collecting until ``max_batch_size`` images are gathered or ``max_wait``
+    seconds have passed, sends them through ``object_detector.predict_columnar_batch`` (which
+    groups them by shape) and hands every caller its own predictions.
+
+    Args:
+        object_detector (ObjectDetector): The detector the batches are sent to
+        model (str): Model name used to label the batching metrics
+        max_batch_size (int): Maximum number of images per batched call
+        max_wait (float): Maximum seconds the first image of a batch waits for more images
+        max_queue_size (int): Maximum number of images waiting for a batch; further calls
+            raise DetectorOverloadedError instead of queueing without limit
+        workers (int): Number of batches that may be in flight at the same time
+    """
+
+    def __init__(self, object_detector: ObjectDetector, model: str, max_batch_size: int = 8,
+                 max_wait: float = 0.01, max_queue_size: int = 64, workers: int = 1):
+        self.__object_detector = object_detector
+        self.__model = model
+        self.__max_batch_size = max_batch_size
+        self.__max_wait = max_wait
+        self.__queue = queue.Queue(maxsize=max_queue_size)
+        self.__workers = [threading.Thread(target=self.__run, name=f"batcher-{model}-{i}", daemon=True)
+                          for i in range(workers)]
+        for worker in self.__workers:
+            worker.start()
+
+    def predict(self, image: BinaryIO) -> List[Prediction]:
+        return self.predict_columnar_batch([image])[0].to_predictions()
+
+    def predict_batch(self, images: List[BinaryIO]) -> List[List[Prediction]]:
+        return [batch.to_predictions() for batch in self.predict_columnar_batch(images)]
+
+    def predict_columnar_batch(self, images: List[BinaryIO]) -> List[PredictionBatch]:
+        futures = []
+        for image in images:
+            future = Future()
+            try:
+                self.__queue.put_nowait((image, future))
+            except queue.Full:
+                # The images of this call queued already are skipped by the workers, not inferred for nothing
+                for queued in futures:
+                    queued.cancel()
+                BATCH_REJECTED.inc(model=self.__model)
+                raise DetectorOverloadedError(f"Too many pending predictions for model {self.__model}")
+            futures.append(future)
+        BATCH_QUEUE_DEPTH.set(self.__queue.qsize(), model=self.__model)
+        return [future.result() for future in futures]
+
+    def close(self):
+        for _ in self.__workers:
+            self.__queue.put(None)
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.__max_wait
+            while len(batch) < self.__max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.__queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.__queue.put(None)
+                    break
+                batch.append(item)
+
+            BATCH_QUEUE_DEPTH.set(self.__queue.qsize(), model=self.__model)
+            self.__dispatch(batch)
+
+    def __dispatch(self, batch):
+        # Drops the images of rejected calls; the others can no longer be cancelled
+        batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        BATCH_SIZE.observe(len(batch), model=self.__model)
+        try:
+            results = self.__object_detector.predict_columnar_batch([image for image, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), predictions in zip(batch, results):
+            future.set_result(predictions)
+        if len(results) < len(batch):
+            error = RuntimeError(f"Detector returned {len(results)} predictions for {len(batch)} images")
+            for _, future in batch[len(results):]:
+                future.set_exception(error)
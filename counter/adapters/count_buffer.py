@@ -0,0 +1,214 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+from typing import Dict, List
+
+from counter.domain.models import ObjectCount
+from counter.domain.ports import ObjectCountRepo
+from counter.metrics import REGISTRY
+
+BUFFER_FLUSHES = REGISTRY.counter("counter_count_buffer_flushes_total",
+                                  "Buffered count deltas written to the wrapped repository", ["result"])
+BUFFER_PENDING = REGISTRY.gauge("counter_count_buffer_pending_updates",
+                                "update_values calls buffered since the last flush")
+BUFFER_REPLAYED = REGISTRY.counter("counter_count_buffer_replayed_total",
+                                   "Journals of crashed processes replayed into the wrapped repository")
+
+
+class BufferedObjectCountRepo(ObjectCountRepo):
+    """Write-behind decorator that merges count deltas in memory and flushes them in bulk.
+
+    ``update_values`` only adds the deltas to a per-class dict and appends them to a local
+    journal, so the request path never waits for the database. A background thread flushes the
+    merged deltas to the wrapped repository in a single ``update_values`` call every
+    ``flush_interval`` seconds, or as soon as ``max_pending`` updates are buffered.
+    ``read_values`` adds the pending deltas to the stored totals, so totals stay exact.
+
+    Every buffer owns a lock file and journal segments in ``journal_dir``. Journals whose lock
+    file is no longer held belong to a process that died before flushing; they are replayed
+    into the wrapped repository when the next buffer starts. A crash between a flush and the
+    removal of its segment replays those deltas again (at-least-once).
+
+    Args:
+        object_count_repo (ObjectCountRepo): The repository the merged deltas are flushed to
+        journal_dir (str): Directory holding the journals of every buffer on this host
+        max_pending (int): Number of buffered update_values calls that triggers a flush
+        flush_interval (float): Maximum seconds a delta stays buffered
+    """
+
+    def __init__(self, object_count_repo: ObjectCountRepo, journal_dir: str, max_pending: int = 1000,
+                 flush_interval: float = 1.0):
+        self.__object_count_repo = object_count_repo
+        self.__journal_dir = journal_dir
+        self.__max_pending = max_pending
+        self.__flush_interval = flush_interval
+        self.__id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__pending: Dict[str, int] = {}
+        self.__pending_updates = 0
+        self.__flushing: Dict[str, int] = {}
+        self.__generation = 0
+        self.__segments: List[str] = []
+        self.__sequence = 0
+        self.__closed = False
+
+        os.makedirs(journal_dir, exist_ok=True)
+        # Lock the file before it gets its ``.lock`` name so no other process ever sees it unlocked
+        self.__lock_path = os.path.join(journal_dir, f"{self.__id}.lock")
+        self.__lock_file = open(f"{self.__lock_path}.new", "w")
+        fcntl.flock(self.__lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(f"{self.__lock_path}.new", self.__lock_path)
+        self.__journal = self.__open_segment()
+        self.replay_orphaned_journals()
+
+        self.__wakeup = threading.Event()
+        self.__flusher = threading.Thread(target=self.__run, name="count-buffer", daemon=True)
+        self.__flusher.start()
+
+    def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        while True:
+            with self.__lock:
+                generation = self.__generation
+                flush_in_progress = bool(self.__flushing)
+                unstored = self.__merged(self.__pending)
+            if flush_in_progress:
+                with self.__flush_lock:  # wait until the stored totals include the flushed deltas
+                    continue
+            stored = self.__object_count_repo.read_values(object_classes)
+            with self.__lock:
+                if generation == self.__generation:
+                    break
+            # A flush started while reading: the stored totals may already include some of unstored
+        totals = {value.object_class: value.count for value in stored if value is not None}
+        for object_class, delta in unstored.items():
+            if object_classes is None or object_class in object_classes:
+                totals[object_class] = totals.get(object_class, 0) + delta
+        if object_classes is None:
+            return [ObjectCount(object_class, total) for object_class, total in totals.items()]
+        return [ObjectCount(object_class, totals[object_class]) for object_class in object_classes
+                if object_class in totals]
+
+    def update_values(self, new_values: List[ObjectCount]):
+        if not new_values:
+            return
+        deltas = self.__merged({}, {value.object_class: value.count for value in new_values})
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError("The count buffer is closed")
+            self.__journal.write(json.dumps(deltas) + "\n")
+            self.__journal.flush()
+            self.__pending = self.__merged(self.__pending, deltas)
+            self.__pending_updates += 1
+            pending_updates = self.__pending_updates
+        BUFFER_PENDING.set(pending_updates)
+        if pending_updates >= self.__max_pending:
+            self.__wakeup.set()
+
+    def flush(self):
+        """Writes the pending deltas to the wrapped repository in one update_values call."""
+        with self.__flush_lock:
+            with self.__lock:
+                if not self.__pending:
+                    return
+                self.__flushing, self.__pending = self.__pending, {}
+                self.__pending_updates = 0
+                self.__generation += 1
+                segments = self.__segments
+                self.__journal.close()
+                self.__segments = []
+                self.__journal = self.__open_segment()
+            BUFFER_PENDING.set(0)
+
+            batch = [ObjectCount(object_class, delta) for object_class, delta in self.__flushing.items()]
+            try:
+                self.__object_count_repo.update_values(batch)
+            except Exception:
+                BUFFER_FLUSHES.inc(result="error")
+                with self.__lock:
+                    # Keep the deltas (and the segments recording them) for the next flush
+                    self.__pending = self.__merged(self.__flushing, self.__pending)
+                    self.__flushing = {}
+                    self.__segments = segments + self.__segments
+                raise
+
+            with self.__lock:
+                self.__flushing = {}
+            BUFFER_FLUSHES.inc(result="ok")
+            for segment in segments:
+                os.remove(segment)
+
+    def replay_orphaned_journals(self):
+        """Replays the journals of buffers whose process exited without flushing them."""
+        for lock_path in glob.glob(os.path.join(self.__journal_dir, "*.lock")):
+            owner = os.path.basename(lock_path)[:-len(".lock")]
+            if owner == self.__id:
+                continue
+            with open(lock_path, "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # the owning buffer is alive
+                segments = sorted(glob.glob(os.path.join(self.__journal_dir, f"{owner}.*.jsonl")))
+                deltas = {}
+                for segment in segments:
+                    with open(segment) as journal:
+                        for line in journal:
+                            if line.endswith("\n"):  # a torn last line was never acknowledged
+                                deltas = self.__merged(deltas, json.loads(line))
+                if deltas:
+                    self.__object_count_repo.update_values(
+                        [ObjectCount(object_class, delta) for object_class, delta in deltas.items()])
+                    BUFFER_REPLAYED.inc()
+                for segment in segments:
+                    os.remove(segment)
+                os.remove(lock_path)
+
+    def close(self):
+        """Flushes what is pending, stops the flusher, releases the journal and closes the wrapped repository."""
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+        self.__wakeup.set()
+        self.__flusher.join()
+        try:
+            self.flush()
+        except Exception:
+            # Leave the journal behind (unlocked) so the next buffer replays it
+            self.__journal.close()
+            self.__lock_file.close()
+            self.__object_count_repo.close()
+            raise
+        self.__journal.close()
+        for segment in self.__segments:
+            os.remove(segment)
+        os.remove(self.__lock_path)
+        self.__lock_file.close()
+        self.__object_count_repo.close()
+
+    def __open_segment(self):
+        self.__sequence += 1
+        path = os.path.join(self.__journal_dir, f"{self.__id}.{self.__sequence:08d}.jsonl")
+        self.__segments.append(path)
+        return open(path, "a")
+
+    def __run(self):
+        while not self.__closed:
+            self.__wakeup.wait(self.__flush_interval)
+            self.__wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # the deltas are kept and retried on the next tick
+                pass
+
+    @staticmethod
+    def __merged(*deltas: Dict[str, int]) -> Dict[str, int]:
+        merged = {}
+        for delta in deltas:
+            for object_class, count in delta.items():
+                merged[object_class] = merged.get(object_class, 0) + count
+        return merged
@@ -0,0 +1,148 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from counter.constants import StageConstants
+from counter.domain.models import ObjectCount
+from counter.domain.ports import ObjectCountRepo
+from counter.metrics import REGISTRY, STAGE_SECONDS
+
+TOTALS_CACHE_HITS = REGISTRY.counter("counter_totals_cache_hits_total", "Class totals served from the totals cache")
+TOTALS_CACHE_MISSES = REGISTRY.counter("counter_totals_cache_misses_total",
+                                       "Class totals read from the wrapped repository")
+TOTALS_CACHE_HIT_RATIO = REGISTRY.gauge("counter_totals_cache_hit_ratio",
+                                        "Share of class totals served from the totals cache since startup")
+TOTALS_CACHE_STALENESS = REGISTRY.histogram("counter_totals_cache_staleness_seconds",
+                                            "Age of the cached totals when they are served",
+                                            buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+
+# Marks a class the wrapped repository has no row for
+_ABSENT = None
+
+
+class CachingObjectCountRepo(ObjectCountRepo):
+    """Write-through cache of class totals in front of an ObjectCountRepo.
+
+    Totals only change through ``update_values``, so once a class total has been read it is
+    kept up to date in memory by adding this process' deltas to it, and later reads skip the
+    database. With several workers the other workers' increments are not seen; set
+    ``max_staleness`` to re-read totals older than that many seconds.
+
+    Args:
+        object_count_repo (ObjectCountRepo): The repository holding the totals
+        max_staleness (Optional[float]): Seconds after which a cached total is read again, or
+            None to keep it until invalidated (exact when this process is the only writer)
+    """
+
+    def __init__(self, object_count_repo: ObjectCountRepo, max_staleness: Optional[float] = None):
+        self.__object_count_repo = object_count_repo
+        self.__max_staleness = max_staleness
+        self.__lock = threading.Lock()
+        self.__totals: Dict[str, tuple] = {}
+        # Bumped when a write of a class starts, so a read racing with a write never caches its result
+        self.__versions: Dict[str, int] = {}
+
+    def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        if object_classes is None:
+            return self.__object_count_repo.read_values()
+
+        now = time.monotonic()
+        with self.__lock:
+            cached = {object_class: self.__fresh(object_class, now) for object_class in object_classes}
+            missing = [object_class for object_class, entry in cached.items() if entry is None]
+            versions = {object_class: self.__versions.get(object_class, 0) for object_class in missing}
+        self.__record(len(object_classes) - len(missing), len(missing))
+
+        if missing:
+            with STAGE_SECONDS.time(stage=StageConstants.REPO_READ):
+                fetched = self.__object_count_repo.read_values(missing)
+            self.__store(fetched, missing, versions)
+            totals = {value.object_class: value.count for value in fetched if value is not None}
+            for object_class in missing:
+                cached[object_class] = (totals.get(object_class, _ABSENT), now)
+
+        for object_class in object_classes:
+            if object_class not in missing:
+                TOTALS_CACHE_STALENESS.observe(now - cached[object_class][1])
+        return [ObjectCount(object_class, cached[object_class][0]) for object_class in object_classes
+                if cached[object_class][0] is not _ABSENT]
+
+    def update_values(self, new_values: List[ObjectCount]):
+        deltas = {}
+        for value in new_values:
+            deltas[value.object_class] = deltas.get(value.object_class, 0) + value.count
+        with self.__lock:
+            before = {object_class: self.__totals.get(object_class) for object_class in deltas}
+            self.__bump_versions(deltas)
+
+        self.__object_count_repo.update_values(new_values)
+
+        with self.__lock:
+            for object_class, delta in deltas.items():
+                entry = self.__totals.get(object_class)
+                if entry is None:
+                    continue
+                if entry is before[object_class]:
+                    total, fetched_at = entry
+                    self.__totals[object_class] = ((total or 0) + delta, fetched_at)
+                else:
+                    # Re-read or updated by someone else meanwhile: unknown whether it includes the delta
+                    del self.__totals[object_class]
+
+    def update_and_read_values(self, new_values: List[ObjectCount]) -> List[ObjectCount]:
+        object_classes = list(dict.fromkeys(value.object_class for value in new_values))
+        now = time.monotonic()
+        with self.__lock:
+            all_cached = all(self.__fresh(object_class, now) is not None for object_class in object_classes)
+        if all_cached:
+            self.update_values(new_values)
+            return self.read_values(object_classes)
+
+        # Some totals have to be read anyway: let the repository return them with the write
+        with self.__lock:
+            versions = self.__bump_versions(object_classes)
+        totals = self.__object_count_repo.update_and_read_values(new_values)
+        self.__record(0, len(object_classes))
+        self.__store(totals, object_classes, versions)
+        return totals
+
+    def invalidate(self, object_classes: List[str] = None):
+        """Drops the cached totals of the classes (all of them by default), e.g. after an external write."""
+        with self.__lock:
+            if object_classes is None:
+                self.__totals.clear()
+            for object_class in object_classes or ():
+                self.__totals.pop(object_class, None)
+
+    def close(self):
+        self.__object_count_repo.close()
+
+    def __bump_versions(self, object_classes) -> Dict[str, int]:
+        versions = {}
+        for object_class in object_classes:
+            versions[object_class] = self.__versions[object_class] = self.__versions.get(object_class, 0) + 1
+        return versions
+
+    def __fresh(self, object_class: str, now: float) -> Optional[tuple]:
+        entry = self.__totals.get(object_class)
+        if entry is not None and self.__max_staleness is not None and now - entry[1] > self.__max_staleness:
+            return None
+        return entry
+
+    def __store(self, values: List[ObjectCount], object_classes: List[str], versions: Dict[str, int]):
+        now = time.monotonic()
+        totals = {value.object_class: value.count for value in values if value is not None}
+        with self.__lock:
+            for object_class in object_classes:
+                if self.__versions.get(object_class, 0) == versions[object_class]:
+                    self.__totals[object_class] = (totals.get(object_class, _ABSENT), now)
+
+    @staticmethod
+    def __record(hits: int, misses: int):
+        if hits:
+            TOTALS_CACHE_HITS.inc(hits)
+        if misses:
+            TOTALS_CACHE_MISSES.inc(misses)
+        served = TOTALS_CACHE_HITS.value() + TOTALS_CACHE_MISSES.value()
+        if served:
+            TOTALS_CACHE_HIT_RATIO.set(TOTALS_CACHE_HITS.value() / served)
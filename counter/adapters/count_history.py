@@ -0,0 +1,206 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+
+from counter.adapters.helpers import Helpers
+from counter.adapters.models import CountRollupWatermarkDB, ObjectCountDailyDB, ObjectCountHourlyDB, \
+    ObjectCountMinuteDB
+from counter.adapters.postgres_repo import _UPSERT_DIALECTS, _upsert_counts, from_db_time, to_db_time, utc_now
+from counter.constants import GranularityConstants
+from counter.domain.history import GRANULARITIES, aggregate_buckets, floor_time
+from counter.domain.models import CountBucket
+from counter.domain.ports import ObjectCountHistoryRepo
+from counter.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = REGISTRY.counter("counter_count_rollups_total", "Count bucket rollup runs", ["result"])
+ROLLUP_ROWS = REGISTRY.counter("counter_count_rollup_rows_total",
+                               "Count buckets written by rollups or deleted by retention pruning",
+                               ["granularity", "action"])
+
+_BUCKET_TABLES = {
+    GranularityConstants.MINUTE: ObjectCountMinuteDB.__table__,
+    GranularityConstants.HOUR: ObjectCountHourlyDB.__table__,
+    GranularityConstants.DAY: ObjectCountDailyDB.__table__,
+}
+
+# Rows per INSERT statement of a rollup, well under the bind parameter limits of PostgreSQL and SQLite
+_ROLLUP_CHUNK_ROWS = 1000
+
+
+class CountHistoryPostgresRepo(ObjectCountHistoryRepo):
+    """PostgreSQL ObjectCountHistoryRepo over the minute buckets the count repositories write.
+
+    The count repositories add every delta to its minute bucket of ``object_counts_minute``
+    (see CountPostgresRepo), spread over shard rows by the striped repository. ``roll_up`` sums
+    the complete hours of minute buckets into ``object_counts_hourly`` and the complete days of
+    hourly buckets into ``object_counts_daily``, recording in ``count_rollup_watermarks`` up to
+    when each table is complete, then prunes the buckets older than their retention. Only
+    buckets already rolled up are ever pruned.
+
+    ``read_buckets`` answers from the coarsest table that covers each part of the range: the
+    daily table up to its watermark, then the hourly table up to its own, and the minute buckets
+    for the most recent part, which is not rolled up yet, summing their shards. Every table is
+    keyed by ``(bucket_start, object_class)`` first, so each read is a range scan.
+
+    Args:
+        user (str): Database user
+        password (str): Database password
+        host (str): Database host
+        port (str): Database port
+        database (str): Database name
+        rollup_lag (float): Seconds after its end an hour is rolled up, so late writes still land in it
+        minute_retention (Optional[timedelta]): Age after which minute buckets are pruned, None to keep them
+        hour_retention (Optional[timedelta]): Age after which hourly buckets are pruned, None to keep them
+        day_retention (Optional[timedelta]): Age after which daily buckets are pruned, None to keep them
+        clock: Returns the current UTC time
+    """
+
+    def __init__(self, user: str, password: str, host: str, port: str, database: str, rollup_lag: float = 120.0,
+                 minute_retention: Optional[timedelta] = timedelta(hours=48),
+                 hour_retention: Optional[timedelta] = timedelta(days=90),
+                 day_retention: Optional[timedelta] = None, clock: Callable[[], datetime] = None):
+        self.__database_url = f"postgresql://{user}:{password}@{host}:{port}/{database}"
+        self.__session_factory = Helpers.create_postgres_session_factory(self.__database_url)
+        self.__rollup_lag = timedelta(seconds=rollup_lag)
+        self.__retentions = {
+            GranularityConstants.MINUTE: minute_retention,
+            GranularityConstants.HOUR: hour_retention,
+            GranularityConstants.DAY: day_retention,
+        }
+        self.__clock = clock or utc_now
+        self.__rollup = None
+        self.__stop_rollup = threading.Event()
+
+    def read_buckets(self, granularity: str, start: datetime, end: datetime,
+                     object_classes: List[str] = None) -> List[CountBucket]:
+        """Reads the ``granularity`` buckets of [start, end), summing finer buckets where it is not rolled up yet."""
+        with self.__session_factory() as session:
+            watermarks = self.__read_watermarks(session)
+            buckets = []
+            cursor = start
+            for source in GRANULARITIES[GRANULARITIES.index(granularity):]:
+                until = end if source == GranularityConstants.MINUTE else min(end, watermarks.get(source, cursor))
+                if cursor < until:
+                    buckets.extend(self.__read_table(session, source, cursor, until, object_classes))
+                    cursor = until
+        return aggregate_buckets(buckets, granularity)
+
+    def roll_up(self, now: datetime = None) -> Dict[str, int]:
+        """
+        Rolls the complete hours and days up and prunes the expired buckets, in one transaction.
+
+        Concurrent runs (e.g. one per worker) wait on the watermark rows, so each hour is rolled
+        up once; rolling a bucket up again would overwrite it with the same sums anyway.
+
+        Args:
+            now: Current UTC time, defaults to the clock's
+
+        Returns:
+            Dict[str, int]: Buckets written per rolled up granularity and the number of pruned buckets
+        """
+        now = now or self.__clock()
+        with self.__session_factory() as session:
+            try:
+                watermarks = self.__read_watermarks(session, for_update=True)
+                hours = self.__roll_up(session, GranularityConstants.MINUTE, GranularityConstants.HOUR,
+                                       watermarks, floor_time(now - self.__rollup_lag, GranularityConstants.HOUR))
+                days = 0
+                if GranularityConstants.HOUR in watermarks:
+                    days = self.__roll_up(session, GranularityConstants.HOUR, GranularityConstants.DAY, watermarks,
+                                          floor_time(watermarks[GranularityConstants.HOUR], GranularityConstants.DAY))
+                pruned = self.__prune(session, now, watermarks)
+                session.commit()
+            except Exception as e:  # pragma: no cover
+                session.rollback()
+                raise e
+        return {GranularityConstants.HOUR: hours, GranularityConstants.DAY: days, "pruned": pruned}
+
+    def start_rollup(self, interval: float):
+        """Starts a daemon thread running ``roll_up`` every ``interval`` seconds."""
+        if self.__rollup is None:
+            self.__rollup = threading.Thread(target=self.__roll_up_periodically, args=(interval,),
+                                             name="count-rollup", daemon=True)
+            self.__rollup.start()
+
+    def stop_rollup(self):
+        self.__stop_rollup.set()
+        if self.__rollup is not None:
+            self.__rollup.join()
+            self.__rollup = None
+
+    @staticmethod
+    def __read_watermarks(session, for_update: bool = False) -> Dict[str, datetime]:
+        query = select(CountRollupWatermarkDB.granularity, CountRollupWatermarkDB.rolled_up_to)
+        if for_update:
+            query = query.with_for_update()
+        return {granularity: from_db_time(rolled_up_to) for granularity, rolled_up_to in session.execute(query)}
+
+    @staticmethod
+    def __read_table(session, granularity: str, start: datetime, end: datetime,
+                     object_classes: List[str] = None) -> List[CountBucket]:
+        table = _BUCKET_TABLES[granularity]
+        query = select(table.c.bucket_start, table.c.object_class, table.c.count) \
+            .where(table.c.bucket_start >= to_db_time(start), table.c.bucket_start < to_db_time(end))
+        if object_classes:
+            query = query.where(table.c.object_class.in_(object_classes))
+        return [CountBucket(from_db_time(bucket_start), object_class, int(count))
+                for bucket_start, object_class, count in session.execute(query)]
+
+    def __roll_up(self, session, source: str, target: str, watermarks: Dict[str, datetime], until: datetime) -> int:
+        """Sums the ``source`` buckets between the ``target`` watermark and ``until`` into ``target`` buckets."""
+        start = watermarks.get(target)
+        if start is None:
+            first = session.execute(select(func.min(_BUCKET_TABLES[source].c.bucket_start))).scalar()
+            if first is None:
+                return 0
+            start = floor_time(from_db_time(first), target)
+        if start >= until:
+            return 0
+
+        buckets = aggregate_buckets(self.__read_table(session, source, start, until), target)
+        rows = [{"bucket_start": to_db_time(bucket.bucket_start), "object_class": bucket.object_class,
+                 "count": bucket.count} for bucket in buckets]
+        for offset in range(0, len(rows), _ROLLUP_CHUNK_ROWS):
+            session.execute(_upsert_counts(session, _BUCKET_TABLES[target], rows[offset:offset + _ROLLUP_CHUNK_ROWS],
+                                           replace=True))
+
+        insert = _UPSERT_DIALECTS[session.get_bind().dialect.name]
+        statement = insert(CountRollupWatermarkDB.__table__).values(granularity=target, rolled_up_to=to_db_time(until))
+        session.execute(statement.on_conflict_do_update(index_elements=["granularity"],
+                                                        set_={"rolled_up_to": statement.excluded.rolled_up_to}))
+        watermarks[target] = until
+        ROLLUP_ROWS.inc(len(rows), granularity=target, action="rolled_up")
+        return len(rows)
+
+    def __prune(self, session, now: datetime, watermarks: Dict[str, datetime]) -> int:
+        # Buckets are only pruned once the next coarser table holds them
+        rolled_up_by = {GranularityConstants.MINUTE: GranularityConstants.HOUR,
+                        GranularityConstants.HOUR: GranularityConstants.DAY}
+        pruned = 0
+        for granularity, retention in self.__retentions.items():
+            if retention is None:
+                continue
+            cutoff = now - retention
+            if granularity in rolled_up_by:
+                if rolled_up_by[granularity] not in watermarks:
+                    continue
+                cutoff = min(cutoff, watermarks[rolled_up_by[granularity]])
+            table = _BUCKET_TABLES[granularity]
+            deleted = session.execute(delete(table).where(table.c.bucket_start < to_db_time(cutoff))).rowcount
+            ROLLUP_ROWS.inc(deleted, granularity=granularity, action="pruned")
+            pruned += deleted
+        return pruned
+
+    def __roll_up_periodically(self, interval: float):
+        while not self.__stop_rollup.wait(interval):
+            try:
+                self.roll_up()
+                ROLLUPS.inc(result="ok")
+            except Exception:  # pragma: no cover - retried on the next tick
+                ROLLUPS.inc(result="error")
+                logger.warning("count rollup failed", exc_info=True)
@@ -1,12 +1,36 @@
-from typing import List
-
-from pymongo import MongoClient
-
-from counter.adapters.helpers import Helpers
-from counter.adapters.models import ObjectCountDB
+import importlib
+import json
+import mmap
+import multiprocessing
+import os
+import threading
+from datetime import timedelta
+from typing import List, Optional
+
+import numpy as np
+
+from counter.adapters.count_buffer import BufferedObjectCountRepo
+from counter.adapters.count_cache import CachingObjectCountRepo
 from counter.constants import CountRepoConstants, Constants
 from counter.domain.models import ObjectCount
-from counter.domain.ports import ObjectCountRepo
+from counter.domain.ports import ObjectCountHistoryRepo, ObjectCountRepo
+
+# Database repositories live in their own modules, imported (with SQLAlchemy or pymongo) only
+# when count_repo_strategy selects them or when one of these names is first accessed here
+_LAZY_REPOS = {
+    "CountPostgresRepo": "counter.adapters.postgres_repo",
+    "CountStripedPostgresRepo": "counter.adapters.postgres_repo",
+    "CountMongoDBRepo": "counter.adapters.mongo_repo",
+    "CountHistoryPostgresRepo": "counter.adapters.count_history",
+}
+
+_HISTORY_REPOS = (CountRepoConstants.POSTGRES_REPO, CountRepoConstants.STRIPED_POSTGRES_REPO)
+
+
+def __getattr__(name):
+    if name in _LAZY_REPOS:
+        return getattr(importlib.import_module(_LAZY_REPOS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class CountInMemoryRepo(ObjectCountRepo):
@@ -30,95 +54,85 @@ class CountInMemoryRepo(ObjectCountRepo):
                 self.store[key] = ObjectCount(key, new_object_count.count)
 
 
-class CountMongoDBRepo(ObjectCountRepo):  # pragma: no cover
-
-    def __init__(self, host, port, database):
-        self.__host = host
-        self.__port = port
-        self.__database = database
+class CountSharedMemoryRepo(ObjectCountRepo):
+    """In-memory ObjectCountRepo whose totals are shared by every thread and forked worker.
 
-    def __get_counter_col(self):
-        client = MongoClient(self.__host, self.__port)
-        db = client[self.__database]
-        counter_col = db.counter
-        return counter_col
+    Totals live in an int64 array over an anonymous shared mmap, one slot per class of a fixed
+    class table (the COCO label map plus the fake detector's "cat"). Processes forked after the
+    repository is created (e.g. pre-forked workers of a preloaded app) map the same memory, so
+    every worker on the host sees one set of totals. Increments take one of ``lock_stripes``
+    process-shared locks, picked by class index, and allocate no Python objects; reads are
+    lock-free loads of aligned 8-byte slots.
 
-    def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
-        counter_col = self.__get_counter_col()
-        query = {"object_class": {"$in": object_classes}} if object_classes else None
-        counters = counter_col.find(query)
-        object_counts = []
-        for counter in counters:
-            object_counts.append(ObjectCount(counter['object_class'], counter['count']))
-        return object_counts
+    A class that has never been counted (total 0) is omitted from ``read_values``, like a
+    missing row in the database repositories.
 
-    def update_values(self, new_values: List[ObjectCount]):
-        counter_col = self.__get_counter_col()
-        for value in new_values:
-            counter_col.update_one({'object_class': value.object_class}, {'$inc': {'count': value.count}}, upsert=True)
-
-
-class CountPostgresRepo(ObjectCountRepo):
-    """A PostgreSQL implementation of the ObjectCountRepo interface.
-
-    This class provides a concrete implementation of the repository pattern for storing
-    and retrieving object counts using a PostgreSQL database. It manages the persistence
-    of ObjectCount entities through SQLAlchemy ORM.
+    Args:
+        object_classes (List[str]): The fixed class table; defaults to CountSharedMemoryRepo.default_classes()
+        lock_stripes (int): Number of locks the classes are spread over
+    """
 
-    Attributes:
-        __database_url (str): The PostgreSQL connection URL containing credentials and connection details
-        __session_factory: A callable that creates new SQLAlchemy database sessions
+    LABEL_MAP_PATH = os.path.join(os.path.dirname(__file__), "mscoco_label_map.json")
 
-    The class implements two main operations:
-    - read_values: Retrieves object counts from the database
-    - update_values: Updates or creates new object counts in the database
-    """
+    def __init__(self, object_classes: List[str] = None, lock_stripes: int = 16):
+        self.__classes = list(object_classes or self.default_classes())
+        self.__indexes = {object_class: index for index, object_class in enumerate(self.__classes)}
+        self.__memory = mmap.mmap(-1, 8 * len(self.__classes))
+        self.__counts = np.frombuffer(self.__memory, dtype=np.int64)
+        self.__locks = [multiprocessing.Lock() for _ in range(lock_stripes)]
 
-    def __init__(self, user: str, password: str, host: str, port: str, database: str):
-        self.__database_url = f"postgresql://{user}:{password}@{host}:{port}/{database}"
-        self.__session_factory = Helpers.create_postgres_session_factory(self.__database_url)
+    @classmethod
+    def default_classes(cls) -> List[str]:
+        with open(cls.LABEL_MAP_PATH) as json_file:
+            labels = json.load(json_file)
+        classes = [label["display_name"] for label in sorted(labels, key=lambda label: label["id"])]
+        return list(dict.fromkeys(classes + ["cat"]))
 
     def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
-        """Fetches object counts from the database, optionally filtered by object classes."""
         if object_classes is None:
-            object_classes = []
-
-        with self.__session_factory() as session:
-            query = session.query(ObjectCountDB)
-            if object_classes:
-                query = query.filter(ObjectCountDB.object_class.in_(object_classes))
-
-            return [ObjectCount(row.object_class, row.count) for row in query.all()]
+            return [ObjectCount(self.__classes[index], int(self.__counts[index]))
+                    for index in np.flatnonzero(self.__counts)]
+        values = []
+        for object_class in object_classes:
+            index = self.__indexes.get(object_class)
+            if index is not None and self.__counts[index]:
+                values.append(ObjectCount(object_class, int(self.__counts[index])))
+        return values
 
     def update_values(self, new_values: List[ObjectCount]):
-        """Updates or creates new object counts in the database."""
-        with self.__session_factory() as session:
-            try:
-                for value in new_values:
-                    count_obj = session.query(ObjectCountDB).filter_by(object_class=value.object_class).first()
-
-                    if count_obj:
-                        count_obj.count += value.count
-                    else:
-                        count_obj = ObjectCountDB(object_class=value.object_class, count=value.count)
-                        session.add(count_obj)
-
-                session.commit()
-            except Exception as e:  # pragma: no cover
-                session.rollback()
-                raise e
+        indexes = self.__indexes
+        for value in new_values:
+            index = indexes.get(value.object_class)
+            if index is None:
+                raise ValueError(f"Unknown object class: {value.object_class}")
+        counts = self.__counts
+        locks = self.__locks
+        for value in new_values:
+            index = indexes[value.object_class]
+            with locks[index % len(locks)]:
+                counts[index] += value.count
 
 
-def count_repo_strategy(count_repo) -> ObjectCountRepo:
+def count_repo_strategy(count_repo, buffered=Constants.COUNT_BUFFER_ENABLED,
+                        cached=Constants.COUNT_CACHE_ENABLED) -> ObjectCountRepo:
     """Creates and returns the appropriate repository instance based on the specified repository type.
 
     This function implements the Strategy pattern for repository selection, creating
     and configuring the appropriate repository implementation based on the provided
-    repository type constant.
+    repository type constant. Database repositories (and their drivers) are only imported
+    once selected.
+
+    PostgreSQL repositories also count every delta in per-minute buckets when
+    Constants.COUNT_HISTORY_ENABLED is set, and start the process' rollup of those buckets
+    (see count_history_strategy).
 
     Args:
         count_repo: A string constant from CountRepoConstants specifying which
                    repository implementation to use.
+        buffered: If True, database repositories are wrapped in a write-behind
+                  BufferedObjectCountRepo that flushes merged deltas in bulk.
+        cached: If True, database repositories are wrapped (outermost) in a
+                write-through CachingObjectCountRepo serving class totals from memory.
 
     Returns:
         ObjectCountRepo: An instance of the specified repository implementation,
@@ -129,16 +143,116 @@ def count_repo_strategy(count_repo) -> ObjectCountRepo:
     """
 
     if count_repo == CountRepoConstants.POSTGRES_REPO:
-        return CountPostgresRepo(user=Constants.POSTGRES_USER,
-                                 password=Constants.POSTGRES_PASSWORD,
-                                 host=Constants.POSTGRES_HOST,
-                                 port=Constants.POSTGRES_PORT,
-                                 database=Constants.POSTGRES_DB)
+        from counter.adapters.postgres_repo import CountPostgresRepo
+        postgres_repo = CountPostgresRepo(user=Constants.POSTGRES_USER,
+                                          password=Constants.POSTGRES_PASSWORD,
+                                          host=Constants.POSTGRES_HOST,
+                                          port=Constants.POSTGRES_PORT,
+                                          database=Constants.POSTGRES_DB,
+                                          history=Constants.COUNT_HISTORY_ENABLED)
+        count_history_strategy(count_repo)
+        return _with_decorators(postgres_repo, buffered, cached)
+    elif count_repo == CountRepoConstants.STRIPED_POSTGRES_REPO:
+        from counter.adapters.postgres_repo import CountStripedPostgresRepo
+        striped_repo = CountStripedPostgresRepo(user=Constants.POSTGRES_USER,
+                                                password=Constants.POSTGRES_PASSWORD,
+                                                host=Constants.POSTGRES_HOST,
+                                                port=Constants.POSTGRES_PORT,
+                                                database=Constants.POSTGRES_DB,
+                                                shards=Constants.COUNT_SHARDS,
+                                                history=Constants.COUNT_HISTORY_ENABLED)
+        if Constants.COUNT_COMPACTION_INTERVAL > 0:
+            striped_repo.start_compaction(Constants.COUNT_COMPACTION_INTERVAL)
+        count_history_strategy(count_repo)
+        return _with_decorators(striped_repo, buffered, cached)
     elif count_repo == CountRepoConstants.MONGO_REPO:
-        return CountMongoDBRepo(host=Constants.MONGO_HOST,
-                                port=Constants.MONGO_PORT,
-                                database=Constants.MONGO_DB)
+        from counter.adapters.mongo_repo import CountMongoDBRepo
+        return _with_decorators(CountMongoDBRepo(host=Constants.MONGO_HOST,
+                                                 port=Constants.MONGO_PORT,
+                                                 database=Constants.MONGO_DB,
+                                                 max_pool_size=Constants.MONGO_MAX_POOL_SIZE,
+                                                 username=Constants.MONGO_USER,
+                                                 password=Constants.MONGO_PASSWORD), buffered, cached)
     elif count_repo == CountRepoConstants.IN_MEMORY_REPO:
         return CountInMemoryRepo()
+    elif count_repo == CountRepoConstants.SHARED_MEMORY_REPO:
+        return shared_memory_repo()
     else:  # pragma: no cover
         raise ValueError(f"Invalid count repo name: {count_repo}")
+
+
+def shared_memory_repo() -> CountSharedMemoryRepo:
+    """Returns the process-wide CountSharedMemoryRepo, created on first use.
+
+    Create it before forking workers so they all share the same totals.
+    """
+    global _shared_memory_repo
+    with _shared_memory_repo_lock:
+        if _shared_memory_repo is None:
+            _shared_memory_repo = CountSharedMemoryRepo(lock_stripes=Constants.SHARED_MEMORY_LOCK_STRIPES)
+        return _shared_memory_repo
+
+
+_shared_memory_repo = None
+_shared_memory_repo_lock = threading.Lock()
+
+
+def count_history_strategy(count_repo) -> Optional[ObjectCountHistoryRepo]:
+    """Returns the process-wide history repository of a count repository type, or None if it keeps no history.
+
+    Only the PostgreSQL repositories (with Constants.COUNT_HISTORY_ENABLED) count the deltas in
+    time buckets. The history repository is created once per process, and starts rolling the
+    buckets up every Constants.COUNT_ROLLUP_INTERVAL seconds (0 disables the rollup).
+    """
+    if not Constants.COUNT_HISTORY_ENABLED or count_repo not in _HISTORY_REPOS:
+        return None
+    from counter.adapters.count_history import CountHistoryPostgresRepo
+
+    key = os.getpid()  # the rollup thread does not survive a fork
+    with _count_history_repos_lock:
+        if key not in _count_history_repos:
+            history_repo = CountHistoryPostgresRepo(
+                user=Constants.POSTGRES_USER,
+                password=Constants.POSTGRES_PASSWORD,
+                host=Constants.POSTGRES_HOST,
+                port=Constants.POSTGRES_PORT,
+                database=Constants.POSTGRES_DB,
+                rollup_lag=Constants.COUNT_ROLLUP_LAG,
+                minute_retention=_retention(hours=Constants.COUNT_MINUTE_RETENTION_HOURS),
+                hour_retention=_retention(days=Constants.COUNT_HOUR_RETENTION_DAYS),
+                day_retention=_retention(days=Constants.COUNT_DAY_RETENTION_DAYS))
+            if Constants.COUNT_ROLLUP_INTERVAL > 0:
+                history_repo.start_rollup(Constants.COUNT_ROLLUP_INTERVAL)
+            _count_history_repos[key] = history_repo
+        return _count_history_repos[key]
+
+
+def close_count_history():
+    """Stops the rollup of this process' history repository, if it has one."""
+    with _count_history_repos_lock:
+        history_repo = _count_history_repos.pop(os.getpid(), None)
+    if history_repo is not None:
+        history_repo.stop_rollup()
+
+
+def _retention(**age) -> Optional[timedelta]:
+    """A retention of 0 keeps the buckets forever."""
+    retention = timedelta(**age)
+    return retention if retention else None
+
+
+_count_history_repos = {}
+_count_history_repos_lock = threading.Lock()
+
+
+def _with_decorators(object_count_repo: ObjectCountRepo, buffered: bool, cached: bool) -> ObjectCountRepo:
+    """Wraps a database repository in the write-behind buffer and, outermost, the totals cache."""
+    if buffered:
+        object_count_repo = BufferedObjectCountRepo(object_count_repo,
+                                                    journal_dir=Constants.COUNT_BUFFER_JOURNAL_DIR,
+                                                    max_pending=Constants.COUNT_BUFFER_MAX_PENDING,
+                                                    flush_interval=Constants.COUNT_BUFFER_FLUSH_INTERVAL)
+    if cached:
+        object_count_repo = CachingObjectCountRepo(object_count_repo,
+                                                   max_staleness=Constants.COUNT_CACHE_MAX_STALENESS or None)
+    return object_count_repo
@@ -1,15 +1,24 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+import mimetypes
+import os
+import threading
+import zipfile
+from io import BytesIO
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageSequence, UnidentifiedImageError
 from werkzeug.datastructures import FileStorage
 
 from counter.constants import Constants
 
-
-class Base(DeclarativeBase):
-    pass
+if TYPE_CHECKING:  # pragma: no cover
+    from pymongo import MongoClient
 
 
 class Helpers:
+    _mongo_clients = {}
+    _mongo_clients_lock = threading.Lock()
+
     @staticmethod
     def create_postgres_session_factory(database_url: str):  # pragma: no cover
         """
@@ -22,10 +31,37 @@ class Helpers:
         :param database_url: A string containing the PostgreSQL connection URL
         :return: A configured SQLAlchemy sessionmaker instance for creating database sessions
         """
+        # Imported on first use: processes using other repositories never load SQLAlchemy
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from counter.adapters.models import Base
+
         engine = create_engine(database_url)
         Base.metadata.create_all(engine)
         return sessionmaker(engine)
 
+    @classmethod
+    def get_mongo_client(cls, host: str, port: int, max_pool_size: int, **kwargs) -> "MongoClient":  # pragma: no cover
+        """
+        Returns the process-wide pooled MongoClient for the given server.
+
+        A MongoClient owns a connection pool and background server monitoring, so it is created
+        once per process and shared by every repository. Clients are not fork-safe, which is why
+        the cache is keyed by the process id as well.
+
+        :param host: MongoDB host name
+        :param port: MongoDB port
+        :param max_pool_size: Maximum number of pooled connections to the server
+        :param kwargs: Extra MongoClient options (e.g. credentials)
+        :return: The shared MongoClient
+        """
+        key = (os.getpid(), host, port, max_pool_size, tuple(sorted(kwargs.items())))
+        with cls._mongo_clients_lock:
+            if key not in cls._mongo_clients:
+                from pymongo import MongoClient
+                cls._mongo_clients[key] = MongoClient(host, port, maxPoolSize=max_pool_size, **kwargs)
+            return cls._mongo_clients[key]
+
     @staticmethod
     def validate_image_file(file: FileStorage) -> None:
         """
@@ -45,3 +81,132 @@ class Helpers:
             raise ValueError("File is required.")
         if file.mimetype not in Constants.ALLOWED_IMAGE_MIME_TYPES:  # pragma: no cover
             raise ValueError(f"Unsupported image type: {file.mimetype}")
+
+    @staticmethod
+    def read_batch_images(files: List[FileStorage]) -> List[Tuple[str, Union[BytesIO, ValueError]]]:
+        """
+        Reads the images of a batch upload, expanding zip archives into their entries.
+
+        Invalid items do not fail the batch: each one is returned with the ValueError describing
+        it, so it can be reported on its own. The type of a zip entry is guessed from its name.
+
+        The number of images and their total size once inflated are checked on the zip headers
+        of every archive before any entry is read, so a batch of zip bombs is never inflated.
+
+        Args:
+            files (List[FileStorage]): The uploaded images and/or zip archives of images
+
+        Returns:
+            List[Tuple[str, Union[BytesIO, ValueError]]]: The name of every image with either its
+            content or the reason it was rejected
+
+        Raises:
+            ValueError: If there are no images, more than Constants.MAX_BATCH_IMAGES, more than
+                Constants.MAX_BATCH_CONTENT_LENGTH bytes of them, or an archive cannot be read
+        """
+        uploads = []
+        try:
+            count = size = 0
+            for file in files:
+                if file.mimetype in Constants.ZIP_MIME_TYPES:
+                    archive, entries = Helpers.__open_zip(file)
+                    uploads.append((file, archive, entries))
+                    count += len(entries)
+                    size += sum(entry.file_size for entry in entries if Helpers.__zip_entry_error(entry) is None)
+                else:
+                    uploads.append((file, None, None))
+                    count += 1
+                    size += Helpers.__stream_size(file.stream)
+                if count > Constants.MAX_BATCH_IMAGES:
+                    raise ValueError(f"A batch holds at most {Constants.MAX_BATCH_IMAGES} images.")
+            if size > Constants.MAX_BATCH_CONTENT_LENGTH:
+                raise ValueError(f"The images of a batch hold at most {Constants.MAX_BATCH_CONTENT_LENGTH} bytes.")
+
+            images = []
+            for file, archive, entries in uploads:
+                if archive is not None:
+                    images.extend(Helpers.__read_zip_entries(archive, entries))
+                    continue
+                try:
+                    Helpers.validate_image_file(file)
+                except ValueError as e:
+                    images.append((file.filename, e))
+                    continue
+                image = BytesIO()
+                file.save(image)
+                images.append((file.filename, image))
+        finally:
+            for _, archive, _ in uploads:
+                if archive is not None:
+                    archive.close()
+
+        if not images:
+            raise ValueError("At least one file is required.")
+        return images
+
+    @staticmethod
+    def read_frames(file: FileStorage) -> List[np.ndarray]:
+        """
+        Decodes every frame of an uploaded (possibly animated) image into an RGB array.
+
+        Args:
+            file (FileStorage): The uploaded GIF, WebP or single-frame image
+
+        Returns:
+            List[np.ndarray]: The ``(H, W, 3)`` uint8 frames, in order
+
+        Raises:
+            ValueError: If the file cannot be decoded, has more than Constants.MAX_FRAMES frames or
+                its decoded frames would take more than Constants.MAX_FRAMES_DECODED_BYTES
+        """
+        try:
+            image = Image.open(file.stream)
+        except (UnidentifiedImageError, Image.DecompressionBombError):
+            raise ValueError(f"Cannot decode image: {file.filename}")
+        with image:
+            # n_frames comes from the header (or a scan without decoding), so long clips are rejected cheaply
+            n_frames = getattr(image, "n_frames", 1)
+            if n_frames > Constants.MAX_FRAMES:
+                raise ValueError(f"An image holds at most {Constants.MAX_FRAMES} frames.")
+            if image.width * image.height > Constants.MAX_IMAGE_PIXELS:
+                raise ValueError(f"Image too large: {image.width}x{image.height} exceeds "
+                                 f"{Constants.MAX_IMAGE_PIXELS} pixels.")
+            # Every frame is kept decoded as RGB, so the clip as a whole is bounded too
+            if n_frames * image.width * image.height * 3 > Constants.MAX_FRAMES_DECODED_BYTES:
+                raise ValueError(f"Decoded frames too large: {n_frames} frames of "
+                                 f"{image.width}x{image.height} exceed {Constants.MAX_FRAMES_DECODED_BYTES} bytes.")
+            return [np.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(image)]
+
+    @staticmethod
+    def __open_zip(file: FileStorage) -> Tuple[zipfile.ZipFile, List[zipfile.ZipInfo]]:
+        try:
+            archive = zipfile.ZipFile(file.stream)
+        except zipfile.BadZipFile:
+            raise ValueError(f"Invalid zip archive: {file.filename}")
+        return archive, [entry for entry in archive.infolist() if not entry.is_dir()]
+
+    @staticmethod
+    def __zip_entry_error(entry: zipfile.ZipInfo) -> Optional[ValueError]:
+        mimetype, _ = mimetypes.guess_type(entry.filename)
+        if mimetype not in Constants.ALLOWED_IMAGE_MIME_TYPES:
+            return ValueError(f"Unsupported image type: {mimetype}")
+        if entry.file_size > Constants.MAX_CONTENT_LENGTH:
+            # Checked on the header so a zip bomb is never inflated
+            return ValueError("Image exceeds the maximum size.")
+        return None
+
+    @staticmethod
+    def __read_zip_entries(archive: zipfile.ZipFile,
+                           entries: List[zipfile.ZipInfo]) -> List[Tuple[str, Union[BytesIO, ValueError]]]:
+        images = []
+        for entry in entries:
+            error = Helpers.__zip_entry_error(entry)
+            images.append((entry.filename, error if error is not None else BytesIO(archive.read(entry))))
+        return images
+
+    @staticmethod
+    def __stream_size(stream) -> int:
+        position = stream.tell()
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+        return size
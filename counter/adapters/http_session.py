@@ -0,0 +1,73 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.util import Retry
+
+from counter.metrics import REGISTRY
+
+TFS_CONNECTIONS = REGISTRY.counter("counter_tfs_connections_total",
+                                   "TCP connections opened to TF Serving", ["model"])
+TFS_RECONNECTS = REGISTRY.counter("counter_tfs_reconnects_total",
+                                  "Pooled TF Serving connections re-opened after being dropped", ["model"])
+TFS_POOL_HITS = REGISTRY.counter("counter_tfs_pool_hits_total",
+                                 "TF Serving requests sent on an already open pooled connection", ["model"])
+
+
+def _counting_connection_class(base_cls, model: str):
+    class CountingConnection(base_cls):
+        __has_connected = False
+
+        def request(self, *args, **kwargs):
+            if self.sock is None:
+                (TFS_RECONNECTS if self.__has_connected else TFS_CONNECTIONS).inc(model=model)
+                self.__has_connected = True
+            else:
+                TFS_POOL_HITS.inc(model=model)
+            return super().request(*args, **kwargs)
+
+    return CountingConnection
+
+
+class InstrumentedHTTPAdapter(HTTPAdapter):
+    """``HTTPAdapter`` whose pooled connections count new connections, reconnects and pool hits."""
+
+    def __init__(self, model: str, **kwargs):
+        self.__model = model
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        model = self.__model
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CountingHTTPConnectionPool", (HTTPConnectionPool,),
+                         {"ConnectionCls": _counting_connection_class(HTTPConnection, model)}),
+            "https": type("CountingHTTPSConnectionPool", (HTTPSConnectionPool,),
+                          {"ConnectionCls": _counting_connection_class(HTTPSConnection, model)}),
+        }
+
+
+def create_pooled_session(model: str, pool_size: int, max_retries: int, backoff_factor: float) -> requests.Session:
+    """
+    Creates a keep-alive ``requests.Session`` for TF Serving predict calls.
+
+    Up to ``pool_size`` connections are kept open and reused across requests. Connection
+    errors, read errors and 502/503/504 answers are retried ``max_retries`` times with
+    exponential backoff; POST is retried too because a predict call has no side effects.
+
+    :param model: Model name used to label the connection metrics
+    :param pool_size: Maximum number of pooled connections kept open to the TFS host
+    :param max_retries: Maximum number of retries of a single predict call
+    :param backoff_factor: Base of the exponential backoff between retries, in seconds
+    :return: A configured session
+    """
+    retry = Retry(total=max_retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({"GET", "POST"}),
+                  raise_on_status=False)
+    adapter = InstrumentedHTTPAdapter(model, pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
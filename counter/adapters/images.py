@@ -0,0 +1,118 @@
+from io import BytesIO
+from typing import BinaryIO, Union
+
+import numpy as np
+from PIL import Image
+
+from counter.constants import Constants, StageConstants
+from counter.domain.models import DecodedImage
+from counter.metrics import STAGE_SECONDS
+
+
+def decode_image(image: Union[BinaryIO, bytes, np.ndarray, DecodedImage], max_side: int = Constants.DECODE_MAX_SIDE,
+                 max_pixels: int = Constants.MAX_IMAGE_PIXELS) -> DecodedImage:
+    """Decodes an upload into a DecodedImage, exactly once.
+
+    The dimensions are checked on the header, before any pixel is decoded, so oversized images
+    and decompression bombs cost nothing. JPEGs are decoded in draft mode, which lets libjpeg
+    scale by 1/2, 1/4 or 1/8 while decoding, to the smallest size whose sides are still at least
+    ``max_side`` (the detector resizes its input anyway). Pixels are copied out of Pillow with
+    the buffer protocol into a uint8 array. Decoded images and frames are returned as they are.
+
+    Args:
+        image: The image stream or bytes (already decoded images and frames are passed through)
+        max_side: Smallest side length to keep when downscaling JPEGs at decode time, 0 to disable
+        max_pixels: Maximum width * height accepted
+
+    Returns:
+        DecodedImage: The RGB pixels, with the original bytes when the upload is a JPEG
+
+    Raises:
+        ValueError: If the image cannot be decoded or has more than ``max_pixels`` pixels
+    """
+    if isinstance(image, DecodedImage):
+        return image
+    if isinstance(image, np.ndarray):
+        return DecodedImage(image)
+
+    with STAGE_SECONDS.time(stage=StageConstants.DECODE):
+        return _decode(image if isinstance(image, bytes) else _read(image), max_side, max_pixels)
+
+
+def estimate_decoded_bytes(stream: BinaryIO, max_side: int = Constants.DECODE_MAX_SIDE,
+                           max_pixels: int = Constants.MAX_IMAGE_PIXELS) -> int:
+    """Estimates the peak memory ``decode_image`` needs for an image, from its header alone.
+
+    Decoding holds Pillow's RGB image and the uint8 array copied out of it, at the size the
+    JPEG draft mode scales the image down to. The stream is left at its current position.
+
+    Args:
+        stream: The seekable image stream
+        max_side: As for decode_image
+        max_pixels: As for decode_image
+
+    Returns:
+        int: Estimated bytes of decoded pixels
+
+    Raises:
+        ValueError: If the header cannot be read or the image has more than ``max_pixels`` pixels
+    """
+    position = stream.tell()
+    try:
+        with Image.open(stream) as pil_image:
+            width, height = pil_image.size
+            is_jpeg = pil_image.format == "JPEG"
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Image too large: {e}")
+    except OSError as e:
+        raise ValueError(f"Cannot decode image: {e}")
+    finally:
+        stream.seek(position)
+    if width * height > max_pixels:
+        raise ValueError(f"Image too large: {width}x{height} exceeds {max_pixels} pixels.")
+    if is_jpeg and max_side:
+        width, height = _draft_dimensions(width, height, _draft_size(width, height, max_side))
+    return 2 * 3 * width * height
+
+
+def _decode(data: bytes, max_side: int, max_pixels: int) -> DecodedImage:
+    try:
+        pil_image = Image.open(BytesIO(data))
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"Image too large: {e}")
+    except OSError as e:
+        raise ValueError(f"Cannot decode image: {e}")
+    with pil_image:
+        width, height = pil_image.size
+        if width * height > max_pixels:
+            raise ValueError(f"Image too large: {width}x{height} exceeds {max_pixels} pixels.")
+        is_jpeg = pil_image.format == "JPEG"
+        if is_jpeg and max_side:
+            pil_image.draft("RGB", _draft_size(width, height, max_side))
+        try:
+            pixels = np.asarray(pil_image.convert("RGB"), dtype=np.uint8)
+        except OSError as e:
+            raise ValueError(f"Cannot decode image: {e}")
+    return DecodedImage(pixels, data if is_jpeg else None)
+
+
+def _draft_size(width: int, height: int, max_side: int):
+    # draft() picks the largest reduction keeping the image at least as large as the requested size
+    scale = max_side / min(width, height)
+    return (width, height) if scale >= 1 else (int(width * scale), int(height * scale))
+
+
+def _draft_dimensions(width: int, height: int, requested):
+    # The largest of the 1/8, 1/4 and 1/2 libjpeg reductions draft() picks for the requested size
+    reduction = min(width // max(1, requested[0]), height // max(1, requested[1]))
+    scale = next(scale for scale in (8, 4, 2, 1) if reduction >= scale)
+    return -(-width // scale), -(-height // scale)
+
+
+def _read(image: BinaryIO) -> bytes:
+    if hasattr(image, "getvalue"):
+        return image.getvalue()
+    image.seek(0)
+    data = image.read()
+    image.seek(0)
+    return data
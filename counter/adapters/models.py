@@ -1,7 +1,11 @@
-from sqlalchemy import Integer, String
-from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
 
-from counter.adapters.helpers import Base
+from sqlalchemy import BigInteger, DateTime, Index, Integer, String
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+
+class Base(DeclarativeBase):
+    pass
 
 
 class ObjectCountDB(Base):
@@ -16,3 +20,97 @@ class ObjectCountDB(Base):
 
     object_class: Mapped[str] = mapped_column(String, primary_key=True)
     count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ObjectCountShardDB(Base):
+    """SQLAlchemy model of the shard rows used by striped counter storage.
+
+    The total of a class is its ``object_counts`` row plus the sum of its shard rows; spreading
+    the increments over several rows avoids every writer waiting on the same row lock.
+
+    Attributes:
+        object_class (str): The class/type of the detected object.
+        shard (int): Index of the shard row, between 0 and the configured number of shards.
+        count (int): Increments not yet compacted into the ``object_counts`` row, defaults to 0.
+    """
+
+    __tablename__ = "object_count_shards"
+
+    object_class: Mapped[str] = mapped_column(String, primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ObjectCountMinuteDB(Base):
+    """SQLAlchemy model of the per-minute count buckets, incremented with every count update.
+
+    The primary key leads with ``bucket_start`` so time-range queries over every class are range
+    scans of it; the ``(object_class, bucket_start)`` index serves the ones filtered by class.
+    Like ``object_count_shards``, every minute of a class is spread over shard rows, so writers
+    on different shards do not wait on the same row lock; reads and rollups sum the shards.
+    Minute buckets are rolled up into ``object_counts_hourly`` and pruned once older than their
+    retention.
+
+    Attributes:
+        bucket_start (datetime): Start of the minute, UTC.
+        object_class (str): The class/type of the detected object.
+        shard (int): Shard row of the writer, 0 for unsharded counter storage.
+        count (int): Objects of the class counted by the shard's writers during the minute.
+    """
+
+    __tablename__ = "object_counts_minute"
+    __table_args__ = (Index("ix_object_counts_minute_class_bucket", "object_class", "bucket_start"),)
+
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    object_class: Mapped[str] = mapped_column(String, primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True, default=0)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ObjectCountHourlyDB(Base):
+    """SQLAlchemy model of the hourly count buckets, rolled up from the minute buckets.
+
+    Attributes:
+        bucket_start (datetime): Start of the hour, UTC.
+        object_class (str): The class/type of the detected object.
+        count (int): Objects of the class counted during the hour.
+    """
+
+    __tablename__ = "object_counts_hourly"
+    __table_args__ = (Index("ix_object_counts_hourly_class_bucket", "object_class", "bucket_start"),)
+
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    object_class: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class ObjectCountDailyDB(Base):
+    """SQLAlchemy model of the daily count buckets, rolled up from the hourly buckets.
+
+    Attributes:
+        bucket_start (datetime): Midnight UTC of the day.
+        object_class (str): The class/type of the detected object.
+        count (int): Objects of the class counted during the day.
+    """
+
+    __tablename__ = "object_counts_daily"
+    __table_args__ = (Index("ix_object_counts_daily_class_bucket", "object_class", "bucket_start"),)
+
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    object_class: Mapped[str] = mapped_column(String, primary_key=True)
+    count: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class CountRollupWatermarkDB(Base):
+    """SQLAlchemy model of the rollup progress of every bucket granularity.
+
+    Attributes:
+        granularity (str): The rolled up granularity, ``hour`` or ``day``.
+        rolled_up_to (datetime): Every bucket of the granularity before this time is complete
+            and its source buckets may be pruned.
+    """
+
+    __tablename__ = "count_rollup_watermarks"
+
+    granularity: Mapped[str] = mapped_column(String, primary_key=True)
+    rolled_up_to: Mapped[datetime] = mapped_column(DateTime)
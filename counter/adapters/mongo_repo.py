@@ -0,0 +1,57 @@
+import threading
+from typing import List
+
+from pymongo import UpdateOne
+
+from counter.adapters.helpers import Helpers
+from counter.domain.models import ObjectCount
+from counter.domain.ports import ObjectCountRepo
+
+
+class CountMongoDBRepo(ObjectCountRepo):
+    """A MongoDB implementation of the ObjectCountRepo interface.
+
+    Every repository of the process shares one pooled MongoClient. Updates are sent as a single
+    unordered ``bulk_write`` of ``$inc`` upserts, and the unique index on ``object_class`` the
+    upserts rely on is created once, before the first read or write.
+
+    Args:
+        host (str): MongoDB host name
+        port (int): MongoDB port
+        database (str): Name of the database holding the ``counter`` collection
+        max_pool_size (int): Maximum number of pooled connections of the shared client
+        username (str): Optional user name
+        password (str): Optional password
+    """
+
+    def __init__(self, host, port, database, max_pool_size: int = 100, username: str = None, password: str = None):
+        credentials = {"username": username, "password": password} if username else {}
+        self.__client = Helpers.get_mongo_client(host, int(port) if port else None, max_pool_size, **credentials)
+        self.__database = database
+        self.__counter_col = None
+        self.__lock = threading.Lock()
+
+    def ensure_indexes(self):
+        """Creates the unique index on object_class (a no-op when it already exists)."""
+        self.__get_counter_col()
+
+    def __get_counter_col(self):
+        with self.__lock:
+            if self.__counter_col is None:
+                counter_col = self.__client[self.__database].counter
+                counter_col.create_index("object_class", unique=True)
+                self.__counter_col = counter_col
+            return self.__counter_col
+
+    def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        query = {"object_class": {"$in": object_classes}} if object_classes else None
+        counters = self.__get_counter_col().find(query, {"_id": False, "object_class": True, "count": True})
+        return [ObjectCount(counter['object_class'], counter['count']) for counter in counters]
+
+    def update_values(self, new_values: List[ObjectCount]):
+        if not new_values:
+            return
+        self.__get_counter_col().bulk_write(
+            [UpdateOne({'object_class': value.object_class}, {'$inc': {'count': value.count}}, upsert=True)
+             for value in new_values],
+            ordered=False)
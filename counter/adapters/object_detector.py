@@ -1,13 +1,24 @@
-import json
-from typing import List, BinaryIO
+import importlib
+from concurrent.futures import Executor
+from typing import List, BinaryIO, Optional
+
+from counter.adapters.async_adapters import ThreadedObjectDetector
+from counter.adapters.batching import BatchingObjectDetector
+from counter.adapters.prediction_cache import CachingObjectDetector
+from counter.constants import Constants, ModelConstants, TFSProtocolConstants
+from counter.domain.models import Prediction, Box
+from counter.domain.ports import ObjectDetector, AsyncObjectDetector
 
-import numpy as np
-import requests
-from PIL import Image
+# TF Serving detectors live in counter.adapters.tfs_detector, imported (with requests and gRPC)
+# only when object_detector_strategy selects a served model or when one of these names is first
+# accessed here
+_LAZY_DETECTORS = {"TFSObjectDetector", "TFSGrpcObjectDetector", "AsyncTFSGrpcObjectDetector"}
 
-from counter.constants import Constants, ModelConstants
-from counter.domain.models import Prediction, Box
-from counter.domain.ports import ObjectDetector
+
+def __getattr__(name):
+    if name in _LAZY_DETECTORS:
+        return getattr(importlib.import_module("counter.adapters.tfs_detector"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class FakeObjectDetector(ObjectDetector):
@@ -20,82 +31,78 @@ class FakeObjectDetector(ObjectDetector):
                 ]
 
 
-class TFSObjectDetector(ObjectDetector):
-    """TensorFlow Serving (TFS) based object detector implementation.
-
-    This class implements the ObjectDetector interface to perform object detection
-    using a TensorFlow model served via TensorFlow Serving. It communicates with
-    the TFS server via REST API to get predictions.
-
-    Args:
-        host (str): Hostname or IP address of the TensorFlow Serving server
-        port (int): Port number on which TFS server is listening
-        model (str): Name of the model to use for predictions
-
-    Attributes:
-        url (str): Complete REST API URL for model predictions
-        classes_dict (dict): Mapping of class IDs to human-readable class names
-    """
-
-    def __init__(self, host, port, model):
-        self.url = f"http://{host}:{port}/v1/models/{model}:predict"
-        self.classes_dict = self.__build_classes_dict()
-
-    def predict(self, image: BinaryIO) -> List[Prediction]:
-        np_image = self.__to_np_array(image)
-        predict_request = '{"instances" : %s}' % np.expand_dims(np_image, 0).tolist()
-        print(f"Sending request to TFS...{self.url}")
-        response = requests.post(self.url, data=predict_request)
-        predictions = response.json()['predictions'][0]
-        return self.__raw_predictions_to_domain(predictions)
-
-    @staticmethod
-    def __build_classes_dict():
-        with open('counter/adapters/mscoco_label_map.json') as json_file:
-            labels = json.load(json_file)
-            return {label['id']: label['display_name'] for label in labels}
-
-    @staticmethod
-    def __to_np_array(image: BinaryIO):
-        image_ = Image.open(image)
-        (im_width, im_height) = image_.size
-        return np.array(image_.getdata()).reshape((im_height, im_width, 3)).astype(np.uint8)
-
-    def __raw_predictions_to_domain(self, raw_predictions: dict) -> List[Prediction]:
-        print("Parsing raw predictions...")
-        num_detections = int(raw_predictions.get('num_detections'))
-        predictions = []
-        for i in range(0, num_detections):
-            detection_box = raw_predictions['detection_boxes'][i]
-            box = Box(xmin=detection_box[1], ymin=detection_box[0], xmax=detection_box[3], ymax=detection_box[2])
-            detection_score = raw_predictions['detection_scores'][i]
-            detection_class = raw_predictions['detection_classes'][i]
-            class_name = self.classes_dict[detection_class]
-            predictions.append(Prediction(class_name=class_name, score=detection_score, box=box))
-        print(predictions)
-        return predictions
-
-
-def object_detector_strategy(model_name) -> ObjectDetector:
+def object_detector_strategy(model_name, protocol=Constants.TFS_PROTOCOL,
+                             batching=Constants.TFS_BATCHING_ENABLED,
+                             caching=Constants.PREDICTION_CACHE_ENABLED,
+                             version: Optional[int] = None) -> ObjectDetector:
     """Creates and returns an appropriate ObjectDetector instance based on the model name.
 
     Args:
         model_name (str): Name of the model to be used for object detection.
             Must be one of the values defined in ModelConstants.
+        protocol (str): TF Serving API to use for served models, one of TFSProtocolConstants.
+        batching (bool): Whether concurrent predict calls to served models are micro-batched.
+        caching (bool): Whether predictions of served models are cached by image content.
+        version (Optional[int]): Version to pin served models to, or None for the latest version.
 
     Returns:
         ObjectDetector: An instance of ObjectDetector implementation based on the model name.
-            Returns TFSObjectDetector for RFCN model or FakeObjectDetector for fake model.
+            Returns TFSObjectDetector (REST) or TFSGrpcObjectDetector (gRPC) for RFCN model,
+            wrapped in a BatchingObjectDetector when batching is enabled and in a
+            CachingObjectDetector when caching is enabled, or FakeObjectDetector for fake model.
+            TF Serving detectors (and their HTTP and gRPC clients) are only imported once selected.
 
     Raises:
-        ValueError: If the provided model_name is not supported.
+        ValueError: If the provided model_name or protocol is not supported.
     """
-    if model_name == ModelConstants.RFCN_MODEL_NAME:
-        return TFSObjectDetector(host=Constants.TFS_HOST,
-                                 port=Constants.TFS_PORT,
-                                 model=ModelConstants.RFCN_MODEL_NAME
-                                 )
+    if model_name == ModelConstants.RFCN_MODEL_NAME and protocol == TFSProtocolConstants.GRPC:
+        from counter.adapters.tfs_detector import TFSGrpcObjectDetector
+        return _with_decorators(TFSGrpcObjectDetector(host=Constants.TFS_HOST,
+                                                      port=Constants.TFS_GRPC_PORT,
+                                                      model=ModelConstants.RFCN_MODEL_NAME,
+                                                      version=version
+                                                      ), model_name, batching, caching)
+    elif model_name == ModelConstants.RFCN_MODEL_NAME and protocol == TFSProtocolConstants.REST:
+        from counter.adapters.tfs_detector import TFSObjectDetector
+        return _with_decorators(TFSObjectDetector(host=Constants.TFS_HOST,
+                                                  port=Constants.TFS_PORT,
+                                                  model=ModelConstants.RFCN_MODEL_NAME,
+                                                  version=version
+                                                  ), model_name, batching, caching)
     elif model_name == ModelConstants.FAKE_MODEL_NAME:
         return FakeObjectDetector()
     else:  # pragma: no cover
-        raise ValueError(f"Invalid model name: {model_name}")
+        raise ValueError(f"Invalid model name or protocol: {model_name} ({protocol})")
+
+
+def _with_decorators(object_detector: ObjectDetector, model_name: str, batching: bool,
+                     caching: bool) -> ObjectDetector:
+    """Wraps a served-model detector in the batching layer and, outermost, the prediction cache."""
+    if batching:
+        object_detector = BatchingObjectDetector(object_detector, model_name,
+                                                 max_batch_size=Constants.TFS_MAX_BATCH_SIZE,
+                                                 max_wait=Constants.TFS_BATCH_TIMEOUT_MS / 1000,
+                                                 max_queue_size=Constants.TFS_BATCH_QUEUE_SIZE,
+                                                 workers=Constants.TFS_BATCH_WORKERS)
+    if caching:
+        object_detector = CachingObjectDetector(object_detector, model_name,
+                                                max_bytes=Constants.PREDICTION_CACHE_MAX_BYTES,
+                                                ttl=Constants.PREDICTION_CACHE_TTL or None)
+    return object_detector
+
+
+def async_object_detector_strategy(model_name, executor: Executor, protocol=Constants.TFS_PROTOCOL,
+                                   version: Optional[int] = None) -> AsyncObjectDetector:
+    """Creates an AsyncObjectDetector for the model name.
+
+    gRPC served models get the native ``grpc.aio`` detector; every other detector returned by
+    object_detector_strategy is run on ``executor`` through ThreadedObjectDetector.
+    """
+    if model_name == ModelConstants.RFCN_MODEL_NAME and protocol == TFSProtocolConstants.GRPC:
+        from counter.adapters.tfs_detector import AsyncTFSGrpcObjectDetector
+        return AsyncTFSGrpcObjectDetector(host=Constants.TFS_HOST,
+                                          port=Constants.TFS_GRPC_PORT,
+                                          model=ModelConstants.RFCN_MODEL_NAME,
+                                          version=version
+                                          )
+    return ThreadedObjectDetector(object_detector_strategy(model_name, protocol=protocol, version=version), executor)
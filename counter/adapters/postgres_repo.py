@@ -0,0 +1,265 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List
+
+from sqlalchemy import delete, func, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from counter.adapters.helpers import Helpers
+from counter.adapters.models import ObjectCountDB, ObjectCountMinuteDB, ObjectCountShardDB
+from counter.constants import GranularityConstants
+from counter.domain.history import floor_time
+from counter.domain.models import ObjectCount
+from counter.domain.ports import ObjectCountRepo
+from counter.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+COMPACTIONS = REGISTRY.counter("counter_count_compactions_total", "Count shard row compaction runs", ["result"])
+
+
+class CountPostgresRepo(ObjectCountRepo):
+    """A PostgreSQL implementation of the ObjectCountRepo interface.
+
+    This class provides a concrete implementation of the repository pattern for storing
+    and retrieving object counts using a PostgreSQL database. It manages the persistence
+    of ObjectCount entities through SQLAlchemy ORM.
+
+    Attributes:
+        __database_url (str): The PostgreSQL connection URL containing credentials and connection details
+        __session_factory: A callable that creates new SQLAlchemy database sessions
+
+    The class implements three main operations:
+    - read_values: Retrieves object counts from the database
+    - update_values: Updates or creates new object counts in the database
+    - update_and_read_values: Does both in a single statement and returns the new totals
+
+    Updates are applied with one ``INSERT ... ON CONFLICT (object_class) DO UPDATE`` statement, so
+    every delta is added in the database (no read-modify-write) and concurrent workers never
+    lose each other's increments. With ``history``, the same transaction adds the deltas to shard 0
+    of the current minute bucket of ``object_counts_minute`` (see CountHistoryPostgresRepo); the
+    writers already wait on each other's ``object_counts`` row locks, so sharding the bucket would
+    not let them run any more concurrently.
+    """
+
+    def __init__(self, user: str, password: str, host: str, port: str, database: str, history: bool = False,
+                 clock: Callable[[], datetime] = None):
+        self.__database_url = f"postgresql://{user}:{password}@{host}:{port}/{database}"
+        self.__session_factory = Helpers.create_postgres_session_factory(self.__database_url)
+        self.__history = history
+        self.__clock = clock or utc_now
+
+    def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        """Fetches object counts from the database, optionally filtered by object classes."""
+        if object_classes is None:
+            object_classes = []
+
+        with self.__session_factory() as session:
+            query = session.query(ObjectCountDB)
+            if object_classes:
+                query = query.filter(ObjectCountDB.object_class.in_(object_classes))
+
+            return [ObjectCount(row.object_class, row.count) for row in query.all()]
+
+    def update_values(self, new_values: List[ObjectCount]):
+        """Updates or creates new object counts in the database."""
+        self.__upsert(new_values, returning=False)
+
+    def update_and_read_values(self, new_values: List[ObjectCount]) -> List[ObjectCount]:
+        """Adds the deltas and returns the new totals of their classes in a single round trip."""
+        return self.__upsert(new_values, returning=True)
+
+    def __upsert(self, new_values: List[ObjectCount], returning: bool) -> List[ObjectCount]:
+        deltas = _merge_deltas(new_values)
+        if not deltas:
+            return []
+
+        with self.__session_factory() as session:
+            try:
+                table = ObjectCountDB.__table__
+                rows = [{"object_class": object_class, "count": count}
+                        for object_class, count in sorted(deltas.items())]
+                statement = _upsert_counts(session, table, rows)
+                if returning:
+                    statement = statement.returning(table.c.object_class, table.c.count)
+                result = session.execute(statement)
+                rows = result.all() if returning else []
+                if self.__history:
+                    session.execute(_upsert_minute_buckets(session, deltas, self.__clock()))
+                session.commit()
+            except Exception as e:  # pragma: no cover
+                session.rollback()
+                raise e
+
+        totals = {object_class: count for object_class, count in rows}
+        return [ObjectCount(object_class, totals[object_class]) for object_class in deltas] if returning else []
+
+
+class CountStripedPostgresRepo(ObjectCountRepo):
+    """PostgreSQL ObjectCountRepo that spreads the increments of every class over shard rows.
+
+    With one row per class, every request seeing a "person" waits for the row lock of the same
+    row. Here each writer (process and thread) adds its deltas to one of ``shards`` rows of
+    ``object_count_shards`` instead, and reads sum the ``object_counts`` base row with the
+    shard rows, so ``read_values`` returns the same totals as CountPostgresRepo.
+
+    A background job (``start_compaction``) periodically folds the shard rows back into the
+    base rows, keeping reads cheap. With ``history``, the deltas are also added to the writer's
+    shard of the current minute bucket of ``object_counts_minute``, so counting history does not
+    put the writers back on a single row lock per class.
+
+    Args:
+        user (str): Database user
+        password (str): Database password
+        host (str): Database host
+        port (str): Database port
+        database (str): Database name
+        shards (int): Number of shard rows per class
+        history (bool): Whether to also count the deltas in per-minute buckets
+        clock: Returns the current UTC time the minute buckets are picked by
+    """
+
+    def __init__(self, user: str, password: str, host: str, port: str, database: str, shards: int = 8,
+                 history: bool = False, clock: Callable[[], datetime] = None):
+        self.__database_url = f"postgresql://{user}:{password}@{host}:{port}/{database}"
+        self.__session_factory = Helpers.create_postgres_session_factory(self.__database_url)
+        self.__shards = shards
+        self.__history = history
+        self.__clock = clock or utc_now
+        self.__compaction = None
+        self.__stop_compaction = threading.Event()
+
+    def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        """Fetches the object counts (base row plus shard rows), optionally filtered by object classes."""
+        with self.__session_factory() as session:
+            return self.__read_totals(session, object_classes)
+
+    def update_values(self, new_values: List[ObjectCount]):
+        """Adds the deltas to this writer's shard rows."""
+        self.__add_to_shard(new_values, returning=False)
+
+    def update_and_read_values(self, new_values: List[ObjectCount]) -> List[ObjectCount]:
+        """Adds the deltas and reads the new totals of their classes in the same transaction."""
+        return self.__add_to_shard(new_values, returning=True)
+
+    def compact(self) -> int:
+        """Moves the shard counts into the base rows in one transaction; returns the number of shard rows folded."""
+        shard_table = ObjectCountShardDB.__table__
+        with self.__session_factory() as session:
+            try:
+                rows = session.execute(
+                    delete(shard_table).returning(shard_table.c.object_class, shard_table.c.count)).all()
+                deltas = _merge_deltas(ObjectCount(object_class, count) for object_class, count in rows)
+                if deltas:
+                    session.execute(_upsert_counts(session, ObjectCountDB.__table__,
+                                                   [{"object_class": object_class, "count": deltas[object_class]}
+                                                    for object_class in sorted(deltas)]))
+                session.commit()
+            except Exception as e:  # pragma: no cover
+                session.rollback()
+                raise e
+        return len(rows)
+
+    def start_compaction(self, interval: float):
+        """Starts a daemon thread compacting the shard rows every ``interval`` seconds."""
+        if self.__compaction is None:
+            self.__compaction = threading.Thread(target=self.__compact_periodically, args=(interval,),
+                                                 name="count-shard-compaction", daemon=True)
+            self.__compaction.start()
+
+    def stop_compaction(self):
+        self.__stop_compaction.set()
+        if self.__compaction is not None:
+            self.__compaction.join()
+            self.__compaction = None
+
+    def close(self):
+        self.stop_compaction()
+
+    def shard_for_writer(self) -> int:
+        """Shard of the calling process and thread; writers on different threads rarely share a row."""
+        return hash((os.getpid(), threading.get_ident())) % self.__shards
+
+    def __add_to_shard(self, new_values: List[ObjectCount], returning: bool) -> List[ObjectCount]:
+        deltas = _merge_deltas(new_values)
+        if not deltas:
+            return []
+
+        shard = self.shard_for_writer()
+        shard_table = ObjectCountShardDB.__table__
+        with self.__session_factory() as session:
+            try:
+                session.execute(_upsert_counts(session, shard_table,
+                                               [{"object_class": object_class, "shard": shard,
+                                                 "count": deltas[object_class]} for object_class in sorted(deltas)]))
+                if self.__history:
+                    session.execute(_upsert_minute_buckets(session, deltas, self.__clock(), shard))
+                totals = self.__read_totals(session, list(deltas)) if returning else []
+                session.commit()
+            except Exception as e:  # pragma: no cover
+                session.rollback()
+                raise e
+        return totals
+
+    @staticmethod
+    def __read_totals(session, object_classes: List[str] = None) -> List[ObjectCount]:
+        rows = union_all(select(ObjectCountDB.object_class, ObjectCountDB.count),
+                         select(ObjectCountShardDB.object_class, ObjectCountShardDB.count)).subquery()
+        query = select(rows.c.object_class, func.sum(rows.c.count)).group_by(rows.c.object_class)
+        if object_classes:
+            query = query.where(rows.c.object_class.in_(object_classes))
+        return [ObjectCount(object_class, int(total)) for object_class, total in session.execute(query)]
+
+    def __compact_periodically(self, interval: float):
+        while not self.__stop_compaction.wait(interval):
+            try:
+                self.compact()
+                COMPACTIONS.inc(result="ok")
+            except Exception:  # retried on the next tick
+                COMPACTIONS.inc(result="error")
+                logger.warning("count shard compaction failed", exc_info=True)
+
+
+def _merge_deltas(new_values: Iterable[ObjectCount]) -> Dict[str, int]:
+    deltas = {}
+    for value in new_values:
+        deltas[value.object_class] = deltas.get(value.object_class, 0) + value.count
+    return deltas
+
+
+def _upsert_counts(session, table, rows: List[dict], replace: bool = False):
+    """Builds an ``INSERT ... ON CONFLICT DO UPDATE SET count = count + excluded.count`` for the session's dialect.
+
+    With ``replace`` the conflicting rows are overwritten (``SET count = excluded.count``) instead.
+    Rows should be sorted by key so concurrent transactions lock them in the same order (no deadlocks).
+    """
+    insert = _UPSERT_DIALECTS[session.get_bind().dialect.name]
+    statement = insert(table).values(rows)
+    count = statement.excluded.count if replace else table.c.count + statement.excluded.count
+    return statement.on_conflict_do_update(index_elements=list(table.primary_key.columns), set_={"count": count})
+
+
+def _upsert_minute_buckets(session, deltas: Dict[str, int], now: datetime, shard: int = 0):
+    """Builds the upsert adding the deltas to the ``shard`` row of the minute bucket of ``now``."""
+    bucket_start = to_db_time(floor_time(now, GranularityConstants.MINUTE))
+    return _upsert_counts(session, ObjectCountMinuteDB.__table__,
+                          [{"bucket_start": bucket_start, "object_class": object_class, "shard": shard,
+                            "count": deltas[object_class]} for object_class in sorted(deltas)])
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def to_db_time(moment: datetime) -> datetime:
+    """Bucket times are stored as naive UTC timestamps."""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def from_db_time(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc)
+
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import BinaryIO, List, Optional
+
+import numpy as np
+
+from counter.domain.models import DecodedImage, Prediction, PredictionBatch
+from counter.domain.ports import ObjectDetector
+from counter.metrics import REGISTRY
+
+CACHE_HITS = REGISTRY.counter("counter_prediction_cache_hits_total",
+                              "Predictions served from the prediction cache", ["model"])
+CACHE_MISSES = REGISTRY.counter("counter_prediction_cache_misses_total",
+                                "Predictions computed by the detector after a cache miss", ["model"])
+CACHE_COALESCED = REGISTRY.counter("counter_prediction_cache_coalesced_total",
+                                   "Predictions that waited for an identical in-flight request", ["model"])
+CACHE_BYTES = REGISTRY.gauge("counter_prediction_cache_bytes",
+                             "Estimated size of the cached predictions", ["model"])
+
+# Rough footprint of a cached PredictionBatch besides its arrays (dataclass + array headers + cache entry)
+PREDICTION_BATCH_OVERHEAD = 600
+
+
+def image_digest(image: BinaryIO, model: str) -> str:
+    """Hashes the image bytes (or decoded pixels) together with the model name, leaving the stream at position 0."""
+    digest = hashlib.sha256(model.encode())
+    if isinstance(image, DecodedImage):
+        if image.encoded is not None:
+            digest.update(image.encoded)
+            return digest.hexdigest()
+        image = image.pixels
+    if isinstance(image, np.ndarray):  # a decoded frame
+        digest.update(str(image.shape).encode())
+        digest.update(np.ascontiguousarray(image))
+        return digest.hexdigest()
+    image.seek(0)
+    if hasattr(image, "getbuffer"):
+        digest.update(image.getbuffer())
+    else:
+        for chunk in iter(lambda: image.read(1 << 20), b""):
+            digest.update(chunk)
+    image.seek(0)
+    return digest.hexdigest()
+
+
+class CachingObjectDetector(ObjectDetector):
+    """Content-addressed cache of raw (pre-threshold) columnar predictions in front of an ObjectDetector.
+
+    Entries are keyed by the SHA-256 of the image bytes and the model name, so re-uploads of
+    the same image are answered without calling the detector whatever ``threshold`` is asked
+    for. Concurrent requests for an image that is already being predicted wait for that call
+    instead of sending their own. The misses of a batch are sent to the detector in one batch.
+
+    Args:
+        object_detector (ObjectDetector): The detector called on cache misses
+        model (str): Model name, part of the cache key and of the metric labels
+        max_bytes (int): Byte budget of the cache; least recently used entries are evicted first
+        ttl (Optional[float]): Seconds after which an entry expires, or None to keep it until evicted
+    """
+
+    def __init__(self, object_detector: ObjectDetector, model: str, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None):
+        self.__object_detector = object_detector
+        self.__model = model
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        self.__entries = OrderedDict()
+        self.__in_flight = {}
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    def predict(self, image: BinaryIO) -> List[Prediction]:
+        return self.predict_columnar(image).to_predictions()
+
+    def predict_columnar(self, image: BinaryIO) -> PredictionBatch:
+        return self.predict_columnar_batch([image])[0]
+
+    def predict_columnar_batch(self, images: List[BinaryIO]) -> List[PredictionBatch]:
+        """Answers the cache hits, then sends all the misses to the detector in a single batch."""
+        keys = [image_digest(image, self.__model) for image in images]
+        results = [None] * len(images)
+        led = {}  # key of every miss this call predicts -> (its future, index of its first image)
+        followed = []  # (index, future) of the images predicted by another call or earlier in this batch
+        with self.__lock:
+            for index, key in enumerate(keys):
+                predictions = self.__get(key)
+                if predictions is not None:
+                    CACHE_HITS.inc(model=self.__model)
+                    results[index] = predictions
+                elif key in self.__in_flight:
+                    followed.append((index, self.__in_flight[key]))
+                else:
+                    led[key] = (Future(), index)
+                    self.__in_flight[key] = led[key][0]
+
+        if led:
+            self.__predict_misses(images, led, results)
+        for index, future in followed:
+            CACHE_COALESCED.inc(model=self.__model)
+            results[index] = future.result()
+        return results
+
+    def invalidate(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+            CACHE_BYTES.set(0, model=self.__model)
+
+    def __predict_misses(self, images: List[BinaryIO], led: dict, results: List[Optional[PredictionBatch]]):
+        CACHE_MISSES.inc(len(led), model=self.__model)
+        try:
+            batch = self.__object_detector.predict_columnar_batch([images[index] for _, index in led.values()])
+        except Exception as e:
+            with self.__lock:
+                for key in led:
+                    del self.__in_flight[key]
+            for future, _ in led.values():
+                future.set_exception(e)
+            raise
+
+        with self.__lock:
+            for (key, (_, index)), predictions in zip(led.items(), batch):
+                del self.__in_flight[key]
+                self.__put(key, predictions)
+                results[index] = predictions
+        for (future, _), predictions in zip(led.values(), batch):
+            future.set_result(predictions)
+
+    def __get(self, key: str) -> Optional[PredictionBatch]:
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        predictions, size, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.__entries[key]
+            self.__size -= size
+            return None
+        self.__entries.move_to_end(key)
+        return predictions
+
+    def __put(self, key: str, predictions: PredictionBatch):
+        size = PREDICTION_BATCH_OVERHEAD + predictions.nbytes
+        if size > self.__max_bytes:
+            return
+        expires_at = time.monotonic() + self.__ttl if self.__ttl else None
+        self.__entries[key] = (predictions, size, expires_at)
+        self.__size += size
+        while self.__size > self.__max_bytes:
+            _, (_, evicted_size, _) = self.__entries.popitem(last=False)
+            self.__size -= evicted_size
+        CACHE_BYTES.set(self.__size, model=self.__model)
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, List, BinaryIO, Optional, Tuple
+
+import grpc
+import numpy as np
+
+from counter.adapters.http_session import create_pooled_session
+from counter.adapters.images import decode_image
+from counter.adapters.tfs_grpc import PREDICT_METHOD, encode_predict_request, decode_predict_response
+from counter.adapters.tfs_rest import (encode_instances_request, encode_columnar_request, encode_b64_request,
+                                       parse_predict_response)
+from counter.constants import Constants, StageConstants, TFSRestEncodingConstants
+from counter.domain.models import Prediction, PredictionBatch
+from counter.domain.ports import ObjectDetector, AsyncObjectDetector
+from counter.metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LABEL_MAP_PATH = os.path.join(os.path.dirname(__file__), "mscoco_label_map.json")
+
+
+def group_by_shape(np_images: List[np.ndarray]) -> Dict[Tuple[int, ...], List[int]]:
+    """Groups image indexes by array shape, so each group can be stacked into one model batch."""
+    groups = {}
+    for index, np_image in enumerate(np_images):
+        groups.setdefault(np_image.shape, []).append(index)
+    return groups
+
+
+class TFSObjectDetector(ObjectDetector):
+    """TensorFlow Serving (TFS) based object detector implementation.
+
+    This class implements the ObjectDetector interface to perform object detection
+    using a TensorFlow model served via TensorFlow Serving. It communicates with
+    the TFS server via REST API to get predictions.
+
+    Args:
+        host (str): Hostname or IP address of the TensorFlow Serving server
+        port (int): Port number on which TFS server is listening
+        model (str): Name of the model to use for predictions
+        version (Optional[int]): Model version to pin, or None for the latest version TFS serves
+        encoding (str): Request body encoding, one of TFSRestEncodingConstants
+        pool_size (int): Maximum number of keep-alive connections kept open to TFS
+        connect_timeout (float): Seconds to wait for a TCP connection to TFS
+        read_timeout (float): Seconds to wait for a predict response
+        max_retries (int): Retries of a failed predict call (connection errors, 502/503/504)
+        backoff_factor (float): Base of the exponential backoff between retries, in seconds
+
+    Attributes:
+        url (str): Complete REST API URL for model predictions
+        encoding (str): Request body encoding used for every predict call
+        timeout (tuple): ``(connect, read)`` timeouts of every predict call
+        classes_dict (dict): Mapping of class IDs to human-readable class names
+        class_names (np.ndarray): classes_dict as a lookup array indexed by class ID
+    """
+
+    ENCODINGS = (TFSRestEncodingConstants.INSTANCES, TFSRestEncodingConstants.COLUMNAR, TFSRestEncodingConstants.B64)
+
+    def __init__(self, host, port, model, version: Optional[int] = None, encoding=Constants.TFS_REST_ENCODING,
+                 pool_size=Constants.TFS_POOL_SIZE, connect_timeout=Constants.TFS_CONNECT_TIMEOUT,
+                 read_timeout=Constants.TFS_TIMEOUT, max_retries=Constants.TFS_MAX_RETRIES,
+                 backoff_factor=Constants.TFS_RETRY_BACKOFF):
+        if encoding not in self.ENCODINGS:
+            raise ValueError(f"Invalid TFS REST encoding: {encoding}")
+        versioned_model = model if version is None else f"{model}/versions/{version}"
+        self.url = f"http://{host}:{port}/v1/models/{versioned_model}:predict"
+        self.encoding = encoding
+        self.timeout = (connect_timeout, read_timeout)
+        self.classes_dict = self.build_classes_dict()
+        self.class_names = self.build_class_names(self.classes_dict)
+        self.__session = create_pooled_session(model, pool_size, max_retries, backoff_factor)
+
+    def predict(self, image: BinaryIO) -> List[Prediction]:
+        return self.predict_columnar_batch([image])[0].to_predictions()
+
+    def predict_batch(self, images: List[BinaryIO]) -> List[List[Prediction]]:
+        return [batch.to_predictions() for batch in self.predict_columnar_batch(images)]
+
+    def predict_columnar_batch(self, images: List[BinaryIO]) -> List[PredictionBatch]:
+        """Sends one predict call per group of same-shaped images (every image at once for ``b64``)."""
+        if self.encoding == TFSRestEncodingConstants.B64:
+            with STAGE_SECONDS.time(stage=StageConstants.ENCODE):
+                predict_request = encode_b64_request(images)
+            return self.__post(predict_request, len(images))
+
+        np_images = [self.to_np_array(image) for image in images]
+        results = [None] * len(images)
+        for indexes in group_by_shape(np_images).values():
+            with STAGE_SECONDS.time(stage=StageConstants.ENCODE):
+                batch = np.stack([np_images[i] for i in indexes])
+                if self.encoding == TFSRestEncodingConstants.COLUMNAR:
+                    predict_request = encode_columnar_request(batch)
+                else:
+                    predict_request = encode_instances_request(batch)
+            for index, predictions in zip(indexes, self.__post(predict_request, len(indexes))):
+                results[index] = predictions
+        return results
+
+    def __post(self, predict_request, batch_size: int) -> List[PredictionBatch]:
+        logger.debug("TFS predict request", extra={"url": self.url, "batch_size": batch_size,
+                                                   "request_bytes": len(predict_request)})
+        with STAGE_SECONDS.time(stage=StageConstants.TFS_ROUND_TRIP):
+            response = self.__session.post(self.url, data=predict_request, timeout=self.timeout,
+                                           headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+        with STAGE_SECONDS.time(stage=StageConstants.PARSE):
+            return [self.raw_predictions_to_batch(predictions, self.class_names)
+                    for predictions in parse_predict_response(response.json())]
+
+    def close(self):
+        self.__session.close()
+
+    @staticmethod
+    def build_classes_dict():
+        return dict(_load_classes_dict())
+
+    @staticmethod
+    def to_np_array(image: BinaryIO) -> np.ndarray:
+        """Returns the uint8 RGB pixels of an upload, decoding it unless it already is (see decode_image)."""
+        return decode_image(image).pixels
+
+    @staticmethod
+    def build_class_names(classes_dict: dict) -> np.ndarray:
+        """Turns the class ID mapping into an array indexed by class ID (None for unused IDs)."""
+        class_names = np.full(max(classes_dict) + 1, None, dtype=object)
+        for class_id, class_name in classes_dict.items():
+            class_names[class_id] = class_name
+        return class_names
+
+    @staticmethod
+    def raw_predictions_to_batch(raw_predictions: dict, class_names: np.ndarray) -> PredictionBatch:
+        """Slices the first ``num_detections`` rows of the raw model outputs into a PredictionBatch.
+
+        TF object detection models return their detections sorted by descending score.
+        """
+        num_detections = int(raw_predictions['num_detections'])
+        return PredictionBatch(boxes=np.asarray(raw_predictions['detection_boxes'])[:num_detections],
+                               scores=np.asarray(raw_predictions['detection_scores'])[:num_detections],
+                               class_ids=np.asarray(raw_predictions['detection_classes'])[:num_detections]
+                               .astype(np.int64),
+                               class_names=class_names,
+                               scores_sorted=True)
+
+    @staticmethod
+    def raw_predictions_to_domain(raw_predictions: dict, classes_dict: dict) -> List[Prediction]:
+        return TFSObjectDetector.raw_predictions_to_batch(
+            raw_predictions, TFSObjectDetector.build_class_names(classes_dict)).to_predictions()
+
+
+@lru_cache(maxsize=None)
+def _load_classes_dict() -> Dict[int, str]:
+    # Read once per process, from the package directory whatever the working directory is
+    with open(LABEL_MAP_PATH) as json_file:
+        labels = json.load(json_file)
+        return {label['id']: label['display_name'] for label in labels}
+
+
+class TFSGrpcObjectDetector(ObjectDetector):
+    """TensorFlow Serving (TFS) object detector speaking the gRPC ``PredictionService`` API.
+
+    The image is sent as a binary ``uint8`` ``TensorProto`` instead of a JSON list of pixels,
+    and a single long-lived channel is reused for every request.
+
+    Args:
+        host (str): Hostname or IP address of the TensorFlow Serving server
+        port (int): gRPC port of the TFS server (8500 by default)
+        model (str): Name of the model to use for predictions
+        timeout (float): Deadline in seconds for a single Predict call
+        version (Optional[int]): Model version to pin, or None for the latest version TFS serves
+
+    Attributes:
+        target (str): ``host:port`` of the gRPC channel
+        classes_dict (dict): Mapping of class IDs to human-readable class names
+    """
+
+    INPUT_NAME = "inputs"
+
+    def __init__(self, host, port, model, timeout=Constants.TFS_TIMEOUT, version: Optional[int] = None):
+        self.target = f"{host}:{port}"
+        self.model = model
+        self.version = version
+        self.timeout = timeout
+        self.classes_dict = TFSObjectDetector.build_classes_dict()
+        self.class_names = TFSObjectDetector.build_class_names(self.classes_dict)
+        self.__channel = grpc.insecure_channel(self.target, options=[
+            ("grpc.max_send_message_length", -1),
+            ("grpc.max_receive_message_length", -1),
+        ])
+        self.__predict = self.__channel.unary_unary(PREDICT_METHOD)
+
+    def predict(self, image: BinaryIO) -> List[Prediction]:
+        return self.predict_columnar_batch([image])[0].to_predictions()
+
+    def predict_batch(self, images: List[BinaryIO]) -> List[List[Prediction]]:
+        return [batch.to_predictions() for batch in self.predict_columnar_batch(images)]
+
+    def predict_columnar_batch(self, images: List[BinaryIO]) -> List[PredictionBatch]:
+        """Sends one Predict call per group of same-shaped images."""
+        np_images = [TFSObjectDetector.to_np_array(image) for image in images]
+        results = [None] * len(images)
+        for indexes in group_by_shape(np_images).values():
+            with STAGE_SECONDS.time(stage=StageConstants.ENCODE):
+                batch = np.stack([np_images[i] for i in indexes])
+                predict_request = encode_predict_request(self.model, {self.INPUT_NAME: batch}, version=self.version)
+            logger.debug("TFS gRPC predict request", extra={"target": self.target, "batch_size": len(indexes)})
+            with STAGE_SECONDS.time(stage=StageConstants.TFS_ROUND_TRIP):
+                response = self.__predict(predict_request, timeout=self.timeout)
+            with STAGE_SECONDS.time(stage=StageConstants.PARSE):
+                outputs = decode_predict_response(response)
+                for position, index in enumerate(indexes):
+                    results[index] = TFSObjectDetector.raw_predictions_to_batch(
+                        {name: tensor[position] for name, tensor in outputs.items()}, self.class_names)
+        return results
+
+    def close(self):
+        self.__channel.close()
+
+
+class AsyncTFSGrpcObjectDetector(AsyncObjectDetector):
+    """Natively asynchronous variant of TFSGrpcObjectDetector built on ``grpc.aio``.
+
+    Waiting for TF Serving does not hold a thread, so one event loop can keep hundreds of
+    Predict calls in flight. The channel is opened on first use, inside the serving loop.
+
+    Args:
+        host (str): Hostname or IP address of the TensorFlow Serving server
+        port (int): gRPC port of the TFS server (8500 by default)
+        model (str): Name of the model to use for predictions
+        timeout (float): Deadline in seconds for a single Predict call
+        version (Optional[int]): Model version to pin, or None for the latest version TFS serves
+    """
+
+    def __init__(self, host, port, model, timeout=Constants.TFS_TIMEOUT, version: Optional[int] = None):
+        self.target = f"{host}:{port}"
+        self.model = model
+        self.version = version
+        self.timeout = timeout
+        self.classes_dict = TFSObjectDetector.build_classes_dict()
+        self.class_names = TFSObjectDetector.build_class_names(self.classes_dict)
+        self.__channel = None
+        self.__predict = None
+
+    async def predict(self, image: BinaryIO) -> List[Prediction]:
+        return (await self.predict_columnar(image)).to_predictions()
+
+    async def predict_columnar(self, image: BinaryIO) -> PredictionBatch:
+        np_image = await asyncio.to_thread(TFSObjectDetector.to_np_array, image)
+        with STAGE_SECONDS.time(stage=StageConstants.ENCODE):
+            predict_request = encode_predict_request(self.model,
+                                                     {TFSGrpcObjectDetector.INPUT_NAME: np_image[np.newaxis]},
+                                                     version=self.version)
+        logger.debug("TFS gRPC predict request", extra={"target": self.target, "batch_size": 1})
+        with STAGE_SECONDS.time(stage=StageConstants.TFS_ROUND_TRIP):
+            response = await self.__get_predict()(predict_request, timeout=self.timeout)
+        with STAGE_SECONDS.time(stage=StageConstants.PARSE):
+            outputs = decode_predict_response(response)
+            return TFSObjectDetector.raw_predictions_to_batch({name: tensor[0] for name, tensor in outputs.items()},
+                                                              self.class_names)
+
+    def __get_predict(self):
+        if self.__channel is None:
+            self.__channel = grpc.aio.insecure_channel(self.target, options=[
+                ("grpc.max_send_message_length", -1),
+                ("grpc.max_receive_message_length", -1),
+            ])
+            self.__predict = self.__channel.unary_unary(PREDICT_METHOD)
+        return self.__predict
+
+    async def close(self):
+        if self.__channel is not None:
+            await self.__channel.close()
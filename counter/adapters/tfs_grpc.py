@@ -0,0 +1,233 @@
+"""Minimal protobuf wire codec for the TensorFlow Serving ``PredictionService``.
+
+Only the handful of messages needed for ``Predict`` are supported (``PredictRequest``,
+``PredictResponse``, ``ModelSpec`` and ``TensorProto``). Encoding them by hand keeps the
+gRPC client on plain ``grpcio`` instead of pulling the full ``tensorflow`` and
+``tensorflow-serving-api`` packages into the webapp image.
+
+Tensors are always written with ``tensor_content`` (the raw little-endian buffer), so an
+image crosses the wire as its ``uint8`` bytes with no per-element encoding.
+"""
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+PREDICT_METHOD = "/tensorflow.serving.PredictionService/Predict"
+SERVICE_NAME = "tensorflow.serving.PredictionService"
+DEFAULT_SIGNATURE_NAME = "serving_default"
+
+# tensorflow/core/framework/types.proto
+DT_FLOAT = 1
+DT_DOUBLE = 2
+DT_INT32 = 3
+DT_UINT8 = 4
+DT_INT64 = 9
+
+_DTYPE_TO_NUMPY = {
+    DT_FLOAT: np.dtype("<f4"),
+    DT_DOUBLE: np.dtype("<f8"),
+    DT_INT32: np.dtype("<i4"),
+    DT_UINT8: np.dtype("u1"),
+    DT_INT64: np.dtype("<i8"),
+}
+_NUMPY_TO_DTYPE = {dtype: tf_dtype for tf_dtype, dtype in _DTYPE_TO_NUMPY.items()}
+
+# (field number, numpy dtype, wire type of an unpacked element) of the typed value fields
+_TYPED_VALUE_FIELDS = {
+    5: ("<f4", 5),  # float_val
+    6: ("<f8", 1),  # double_val
+    7: ("<i4", 0),  # int_val (also used for uint8)
+    10: ("<i8", 0),  # int64_val
+}
+
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+
+def _varint(value: int) -> bytes:
+    if value < 0:
+        value += 1 << 64
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _tag(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _length_delimited(field: int, payload: bytes) -> bytes:
+    return _tag(field, _LENGTH_DELIMITED) + _varint(len(payload)) + payload
+
+
+def _read_varint(buf: memoryview, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf: memoryview) -> Iterator[Tuple[int, int, object]]:
+    """Yields ``(field, wire_type, value)`` for every field of a serialized message."""
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == _VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == _FIXED64:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == _LENGTH_DELIMITED:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == _FIXED32:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type: {wire_type}")
+        yield field, wire_type, value
+
+
+def encode_tensor(array: np.ndarray) -> bytes:
+    """Serializes a numpy array as a ``TensorProto`` using ``tensor_content``."""
+    array = np.asarray(array)
+    dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder == ">" else array.dtype
+    try:
+        tf_dtype = _NUMPY_TO_DTYPE[np.dtype(dtype)]
+    except KeyError:
+        raise ValueError(f"Unsupported tensor dtype: {array.dtype}")
+
+    shape = b"".join(_length_delimited(2, _tag(1, _VARINT) + _varint(size)) for size in array.shape)
+    return (_tag(1, _VARINT) + _varint(tf_dtype)
+            + _length_delimited(2, shape)
+            + _length_delimited(4, np.ascontiguousarray(array, dtype=dtype).tobytes()))
+
+
+def decode_tensor(data) -> np.ndarray:
+    """Deserializes a ``TensorProto`` into a numpy array."""
+    tf_dtype = DT_FLOAT
+    shape = []
+    content = None
+    values = []
+    for field, wire_type, value in _iter_fields(memoryview(data)):
+        if field == 1:
+            tf_dtype = value
+        elif field == 2:
+            for dim_field, _, dim in _iter_fields(value):
+                if dim_field == 2:
+                    size = next((v for f, _, v in _iter_fields(dim) if f == 1), 0)
+                    shape.append(size)
+        elif field == 4:
+            content = value
+        elif field in _TYPED_VALUE_FIELDS:
+            numpy_dtype, element_wire_type = _TYPED_VALUE_FIELDS[field]
+            if wire_type == _LENGTH_DELIMITED and element_wire_type != _VARINT:
+                values.append(np.frombuffer(value, dtype=numpy_dtype))
+            elif wire_type == _LENGTH_DELIMITED:
+                values.append(np.array(_unpack_varints(value), dtype=numpy_dtype))
+            elif wire_type == _VARINT:
+                values.append(np.array([value], dtype=numpy_dtype))
+            else:
+                values.append(np.frombuffer(value, dtype=numpy_dtype))
+
+    try:
+        dtype = _DTYPE_TO_NUMPY[tf_dtype]
+    except KeyError:
+        raise ValueError(f"Unsupported tensor dtype: {tf_dtype}")
+
+    if content is not None:
+        array = np.frombuffer(content, dtype=dtype)
+    elif values:
+        array = np.concatenate(values).astype(dtype, copy=False)
+    else:
+        array = np.zeros(0, dtype=dtype)
+
+    size = int(np.prod(shape)) if shape else 1
+    if array.size == 1 and size > 1:  # TFS may send a single value for a splat tensor
+        array = np.full(size, array[0], dtype=dtype)
+    return array.reshape(shape)
+
+
+def _unpack_varints(buf: memoryview):
+    values = []
+    pos = 0
+    while pos < len(buf):
+        value, pos = _read_varint(buf, pos)
+        values.append(value - (1 << 64) if value >= 1 << 63 else value)
+    return values
+
+
+def _encode_tensor_map(field: int, tensors: Dict[str, np.ndarray]) -> bytes:
+    return b"".join(
+        _length_delimited(field, _length_delimited(1, key.encode()) + _length_delimited(2, encode_tensor(tensor)))
+        for key, tensor in tensors.items()
+    )
+
+
+def _decode_tensor_map_entry(entry) -> Tuple[str, np.ndarray]:
+    key = ""
+    tensor = np.zeros(0)
+    for field, _, value in _iter_fields(entry):
+        if field == 1:
+            key = bytes(value).decode()
+        elif field == 2:
+            tensor = decode_tensor(value)
+    return key, tensor
+
+
+def _encode_model_spec(model_name: str, signature_name: str, version: Optional[int]) -> bytes:
+    spec = _length_delimited(1, model_name.encode())
+    if version is not None:
+        spec += _length_delimited(2, _tag(1, _VARINT) + _varint(version))
+    spec += _length_delimited(3, signature_name.encode())
+    return spec
+
+
+def encode_predict_request(model_name: str, inputs: Dict[str, np.ndarray],
+                           signature_name: str = DEFAULT_SIGNATURE_NAME, version: Optional[int] = None) -> bytes:
+    """Serializes a ``tensorflow.serving.PredictRequest``."""
+    return _length_delimited(1, _encode_model_spec(model_name, signature_name, version)) + \
+        _encode_tensor_map(2, inputs)
+
+
+def decode_predict_request(data) -> Tuple[str, Dict[str, np.ndarray]]:
+    """Deserializes a ``PredictRequest`` into ``(model_name, inputs)``."""
+    model_name = ""
+    inputs = {}
+    for field, _, value in _iter_fields(memoryview(data)):
+        if field == 1:
+            model_name = next((bytes(v).decode() for f, _, v in _iter_fields(value) if f == 1), "")
+        elif field == 2:
+            key, tensor = _decode_tensor_map_entry(value)
+            inputs[key] = tensor
+    return model_name, inputs
+
+
+def encode_predict_response(outputs: Dict[str, np.ndarray], model_name: str,
+                            signature_name: str = DEFAULT_SIGNATURE_NAME) -> bytes:
+    """Serializes a ``tensorflow.serving.PredictResponse``."""
+    return _encode_tensor_map(1, outputs) + \
+        _length_delimited(2, _encode_model_spec(model_name, signature_name, None))
+
+
+def decode_predict_response(data) -> Dict[str, np.ndarray]:
+    """Deserializes a ``PredictResponse`` into its output tensors."""
+    outputs = {}
+    for field, _, value in _iter_fields(memoryview(data)):
+        if field == 1:
+            key, tensor = _decode_tensor_map_entry(value)
+            outputs[key] = tensor
+    return outputs
@@ -0,0 +1,108 @@
+"""Request encoders and response parsing for the TensorFlow Serving REST ``:predict`` API.
+
+Three request encodings are supported (see ``TFSRestEncodingConstants``):
+
+* ``instances`` - the original row format, built from ``ndarray.tolist()``
+* ``columnar``  - the ``{"inputs": ...}`` format, rendered to JSON text directly from the
+  ``uint8`` buffer with numpy so no Python object is created per pixel
+* ``b64``       - ``{"instances": [{"b64": ...}]}`` carrying the JPEG bytes, for models
+  exported with an encoded-image string input signature
+"""
+import base64
+import json
+from io import BytesIO
+from typing import BinaryIO, List
+
+import numpy as np
+from PIL import Image
+
+from counter.domain.models import DecodedImage
+
+_SPACE = ord(" ")
+_CHUNK_VALUES = 1 << 22
+
+# "  7,", " 42,", "255," - fixed width so every value can be rendered with one fancy-index
+_UINT8_JSON = np.array([list(f"{value:>3},".encode()) for value in range(256)], dtype=np.uint8)
+
+
+def uint8_to_json(array: np.ndarray) -> bytes:
+    """Renders a ``uint8`` array as a (nested) JSON list without going through Python ints."""
+    array = np.asarray(array, dtype=np.uint8)
+    if array.ndim == 0 or array.size == 0:
+        return json.dumps(array.tolist()).encode()
+    return b"[" + _uint8_json_items(array) + b"]"
+
+
+def _uint8_json_items(array: np.ndarray) -> bytes:
+    """Renders the items along axis 0 of ``array`` separated by commas, without the outer brackets."""
+    if array.ndim > 3:
+        return b",".join(uint8_to_json(item) for item in array)
+
+    rows_per_chunk = max(1, _CHUNK_VALUES // max(1, array[0].size))
+    if len(array) > rows_per_chunk:
+        return b",".join(_uint8_json_items(array[start:start + rows_per_chunk])
+                         for start in range(0, len(array), rows_per_chunk))
+
+    text = _UINT8_JSON[array]
+    for _ in range(array.ndim - 1):
+        # Wrap the innermost dimension into "[...]," lists, turning the last comma into padding.
+        *leading, length, width = text.shape
+        flat = text.reshape(*leading, length * width)
+        flat[..., -1] = _SPACE
+        wrapped = np.empty((*leading, flat.shape[-1] + 3), dtype=np.uint8)
+        wrapped[..., 0] = ord("[")
+        wrapped[..., 1:-2] = flat
+        wrapped[..., -2] = ord("]")
+        wrapped[..., -1] = ord(",")
+        text = wrapped
+
+    flat = text.reshape(-1)[:-1]
+    return flat[flat != _SPACE].tobytes()
+
+
+def encode_instances_request(np_images: np.ndarray) -> str:
+    """Encodes a ``(batch, height, width, 3)`` array in the row ``instances`` format (slow, per-element)."""
+    return '{"instances" : %s}' % np_images.tolist()
+
+
+def encode_columnar_request(np_images: np.ndarray) -> bytes:
+    """Encodes a ``(batch, height, width, 3)`` ``uint8`` array in the columnar ``inputs`` format."""
+    return b'{"inputs":' + uint8_to_json(np_images) + b"}"
+
+
+def encode_b64_request(images: List[BinaryIO]) -> bytes:
+    """Encodes the images as base64 JPEG bytes, re-encoding only the uploads that are not JPEGs (and decoded frames)."""
+    return b'{"instances":[' + b",".join(b'{"b64":"' + base64.b64encode(_jpeg_bytes(image)) + b'"}'
+                                         for image in images) + b"]}"
+
+
+def _jpeg_bytes(image: BinaryIO) -> bytes:
+    if isinstance(image, DecodedImage) and image.encoded is not None:
+        return image.encoded
+    if isinstance(image, (DecodedImage, np.ndarray)):  # decoded upload or frame
+        buffer = BytesIO()
+        Image.fromarray(image.pixels if isinstance(image, DecodedImage) else image).save(buffer, "JPEG", quality=95)
+        return buffer.getvalue()
+    image.seek(0)
+    pil_image = Image.open(image)
+    if pil_image.format == "JPEG":
+        image.seek(0)
+        return image.read()
+    buffer = BytesIO()
+    pil_image.convert("RGB").save(buffer, "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def parse_predict_response(payload: dict) -> List[dict]:
+    """Returns the raw predictions of every image in the batch, whatever the request format was.
+
+    Row (``instances``) requests are answered with ``{"predictions": [...]}`` and columnar
+    (``inputs``) requests with ``{"outputs": {name: [...]}}``.
+    """
+    if "predictions" in payload:
+        return payload["predictions"]
+    if "outputs" in payload:
+        outputs = payload["outputs"]
+        batch_size = len(next(iter(outputs.values())))
+        return [{name: values[i] for name, values in outputs.items()} for i in range(batch_size)]
+    raise RuntimeError(f"Unexpected TFS response: {payload.get('error', payload)}")
@@ -0,0 +1,78 @@
+import logging
+import time
+from typing import List, Optional
+
+import requests
+
+from counter.constants import Constants
+
+logger = logging.getLogger(__name__)
+
+
+class TFSModelStatus:
+    """
+    Client for the TF Serving model status and metadata REST API.
+
+    Args:
+        host (str): Hostname of the TF Serving REST API
+        port (str): Port of the TF Serving REST API
+        model (str): Name of the served model
+        timeout (float): Timeout in seconds of a single status or metadata call
+    """
+    AVAILABLE = "AVAILABLE"
+
+    def __init__(self, host, port, model, timeout=Constants.TFS_CONNECT_TIMEOUT):
+        self.url = f"http://{host}:{port}/v1/models/{model}"
+        self.model = model
+        self.timeout = timeout
+
+    def available_versions(self) -> List[int]:
+        """
+        Returns the versions of the model TF Serving reports as AVAILABLE, latest first.
+
+        Raises:
+            requests.RequestException: If TF Serving cannot be reached or does not know the model
+        """
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return sorted((int(status["version"]) for status in response.json().get("model_version_status", [])
+                       if status.get("state") == self.AVAILABLE), reverse=True)
+
+    def metadata(self, version: Optional[int] = None) -> dict:
+        """
+        Returns the signature metadata of a model version, or of the latest version when None.
+
+        Raises:
+            requests.RequestException: If TF Serving cannot be reached or does not know the version
+        """
+        url = self.url if version is None else f"{self.url}/versions/{version}"
+        response = requests.get(f"{url}/metadata", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def wait_until_available(self, version: Optional[int] = None, timeout: float = 60.0,
+                             interval: float = 1.0) -> int:
+        """
+        Polls the model status until the version, or any version when None, is AVAILABLE.
+
+        Returns:
+            int: The requested version, or the latest AVAILABLE version when None was requested
+
+        Raises:
+            TimeoutError: If no matching version became AVAILABLE within ``timeout`` seconds
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                versions = self.available_versions()
+                if version is None and versions:
+                    return versions[0]
+                if version in versions:
+                    return version
+                logger.info("model not available yet", extra={"model": self.model, "versions": versions})
+            except requests.RequestException as e:
+                logger.info("model status unavailable", extra={"model": self.model, "error": str(e)})
+            if time.monotonic() + interval > deadline:
+                wanted = "any version" if version is None else f"version {version}"
+                raise TimeoutError(f"{wanted} of model {self.model} not AVAILABLE after {timeout}s")
+            time.sleep(interval)
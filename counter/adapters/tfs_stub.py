@@ -0,0 +1,232 @@
+import json
+import random
+import re
+import threading
+import time
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+import grpc
+import numpy as np
+
+from counter.adapters.tfs_grpc import (PREDICT_METHOD, SERVICE_NAME, decode_predict_request,
+                                       encode_predict_response)
+
+RFCN_MAX_DETECTIONS = 300
+
+
+def canned_rfcn_outputs(num_detections: int = 3, batch_size: int = 1,
+                        max_detections: int = RFCN_MAX_DETECTIONS) -> Dict[str, np.ndarray]:
+    """Builds deterministic outputs shaped like the RFCN ``serving_default`` signature.
+
+    Detections are sorted by descending score, as TF Serving returns them, and the
+    padding rows past ``num_detections`` are zeroed.
+
+    Args:
+        num_detections: Number of valid detections per image
+        batch_size: Size of the leading batch dimension
+        max_detections: Number of detection rows (valid + padding) per image
+
+    Returns:
+        dict: Output tensors keyed by output name
+    """
+    rng = np.random.default_rng(seed=42)
+    boxes = np.zeros((max_detections, 4), dtype=np.float32)
+    scores = np.zeros(max_detections, dtype=np.float32)
+    classes = np.zeros(max_detections, dtype=np.float32)
+
+    mins = rng.uniform(0.0, 0.5, size=(num_detections, 2))
+    boxes[:num_detections, :2] = mins
+    boxes[:num_detections, 2:] = mins + rng.uniform(0.1, 0.5, size=(num_detections, 2))
+    scores[:num_detections] = np.linspace(0.99, 0.05, num=num_detections)
+    classes[:num_detections] = np.array([1, 44, 1, 47, 62, 17, 18, 3])[np.arange(num_detections) % 8]
+
+    return {
+        "detection_boxes": np.repeat(boxes[np.newaxis], batch_size, axis=0),
+        "detection_scores": np.repeat(scores[np.newaxis], batch_size, axis=0),
+        "detection_classes": np.repeat(classes[np.newaxis], batch_size, axis=0),
+        "num_detections": np.full(batch_size, num_detections, dtype=np.float32),
+    }
+
+
+def _simulate_inference(latency: float, jitter: float):
+    delay = latency + (random.uniform(0, jitter) if jitter else 0)
+    if delay:
+        time.sleep(delay)
+
+
+class StubPredictionServer:
+    """In-process gRPC ``PredictionService`` that answers every ``Predict`` with canned RFCN outputs.
+
+    It lets the gRPC detector be exercised end to end without a real TF Serving. The outputs
+    are repeated along the batch dimension to match the size of the received ``inputs`` tensor,
+    and every decoded request is kept in ``requests`` for assertions. Each answer is delayed by
+    ``latency`` seconds plus up to ``jitter`` random seconds.
+
+    Usage:
+        with StubPredictionServer() as server:
+            detector = TFSGrpcObjectDetector("127.0.0.1", server.port, "rfcn")
+    """
+
+    def __init__(self, num_detections: int = 3, host: str = "127.0.0.1", port: int = 0, max_workers: int = 4,
+                 latency: float = 0.0, jitter: float = 0.0):
+        self.num_detections = num_detections
+        self.latency = latency
+        self.jitter = jitter
+        self.requests: List[tuple] = []
+        self.__server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                                    options=[("grpc.max_receive_message_length", -1),
+                                             ("grpc.max_send_message_length", -1)])
+        handler = grpc.method_handlers_generic_handler(SERVICE_NAME, {
+            PREDICT_METHOD.rsplit("/", 1)[1]: grpc.unary_unary_rpc_method_handler(self.__predict),
+        })
+        self.__server.add_generic_rpc_handlers((handler,))
+        self.host = host
+        self.port = self.__server.add_insecure_port(f"{host}:{port}")
+
+    def __predict(self, request: bytes, context) -> bytes:
+        model_name, inputs = decode_predict_request(request)
+        self.requests.append((model_name, inputs))
+        batch_size = next(iter(inputs.values())).shape[0] if inputs else 1
+        _simulate_inference(self.latency, self.jitter)
+        return encode_predict_response(canned_rfcn_outputs(self.num_detections, batch_size), model_name)
+
+    def start(self) -> "StubPredictionServer":
+        self.__server.start()
+        return self
+
+    def stop(self, grace: Optional[float] = None):
+        self.__server.stop(grace)
+
+    def __enter__(self) -> "StubPredictionServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _request_shape(body: bytes):
+    """``(columnar, batch_size)`` of a predict body, from its raw bytes (see StubRestServer)."""
+    columnar = body.lstrip().startswith(b'{"inputs"')
+    if b'"b64"' in body:
+        return columnar, body.count(b'"b64"')
+    # Images are (H, W, 3) lists: only the separator between two images closes three levels
+    return columnar, body.count(b"]]],[[[") + body.count(b"]]], [[[") + 1
+
+
+class StubRestServer:
+    """In-process TF Serving REST server answering ``:predict`` with canned RFCN outputs.
+
+    Row (``instances``) requests get a ``predictions`` body and columnar (``inputs``) requests an
+    ``outputs`` body, as TF Serving does. ``GET`` model status and metadata calls report
+    ``versions`` as AVAILABLE. Connections are kept alive (HTTP/1.1), every
+    request is recorded in ``requests`` as ``(model_name, body_format, batch_size)`` and
+    each answer is delayed by ``latency`` seconds plus up to ``jitter`` random seconds.
+
+    With ``parse_requests=False`` the request body is not decoded (TF Serving parses it in C++,
+    a Python JSON parser would dominate a benchmark): the format and batch size are read from
+    the raw bytes instead.
+
+    Usage:
+        with StubRestServer() as server:
+            detector = TFSObjectDetector("127.0.0.1", server.port, "rfcn")
+    """
+
+    PREDICT_PATH = re.compile(r"^/v1/models/(?P<model>[^/:]+)(/versions/\d+)?:predict$")
+    STATUS_PATH = re.compile(r"^/v1/models/(?P<model>[^/:]+)(/versions/(?P<version>\d+))?(?P<metadata>/metadata)?$")
+
+    def __init__(self, num_detections: int = 3, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 jitter: float = 0.0, parse_requests: bool = True, versions: Sequence[int] = (1,)):
+        self.num_detections = num_detections
+        self.versions = list(versions)
+        self.parse_requests = parse_requests
+        self.latency = latency
+        self.jitter = jitter
+        self.requests: List[tuple] = []
+        self.__bodies: Dict[tuple, bytes] = {}
+        self.__server = ThreadingHTTPServer((host, port), self.__handler_class())
+        self.__server.daemon_threads = True
+        self.host, self.port = self.__server.server_address[:2]
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    def __handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                match = stub.PREDICT_PATH.match(self.path)
+                if not match:
+                    return self.__reply(404, {"error": f"Unknown path {self.path}"})
+                if stub.parse_requests:
+                    payload = json.loads(body)
+                    columnar = "inputs" in payload
+                    batch_size = len(payload["inputs"] if columnar else payload["instances"])
+                else:
+                    columnar, batch_size = _request_shape(body)
+                stub.requests.append((match.group("model"), "inputs" if columnar else "instances", batch_size))
+                _simulate_inference(stub.latency, stub.jitter)
+                return self.__reply(200, stub.response_body(columnar, batch_size))
+
+            def do_GET(self):
+                match = stub.STATUS_PATH.match(self.path)
+                if not match:
+                    return self.__reply(404, {"error": f"Unknown path {self.path}"})
+                version = int(match.group("version") or max(stub.versions, default=0))
+                if version not in stub.versions:
+                    return self.__reply(404, {"error": f"Servable not found for request: {self.path}"})
+                if match.group("metadata"):
+                    return self.__reply(200, {
+                        "model_spec": {"name": match.group("model"), "signature_name": "", "version": str(version)},
+                        "metadata": {"signature_def": {"signature_def": {"serving_default": {}}}},
+                    })
+                return self.__reply(200, {"model_version_status": [
+                    {"version": str(v), "state": "AVAILABLE", "status": {"error_code": "OK", "error_message": ""}}
+                    for v in ([version] if match.group("version") else sorted(stub.versions, reverse=True))
+                ]})
+
+            def __reply(self, status, body):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):  # the client gave up (e.g. timed out)
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def response_body(self, columnar: bool, batch_size: int) -> bytes:
+        """The JSON answer for a batch, encoded once per format and batch size."""
+        key = (columnar, batch_size)
+        if key not in self.__bodies:
+            outputs = canned_rfcn_outputs(self.num_detections, batch_size)
+            lists = {name: tensor.tolist() for name, tensor in outputs.items()}
+            if columnar:
+                body = {"outputs": lists}
+            else:
+                body = {"predictions": [{name: values[i] for name, values in lists.items()} for i in range(batch_size)]}
+            self.__bodies[key] = json.dumps(body).encode()
+        return self.__bodies[key]
+
+    def start(self) -> "StubRestServer":
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self) -> "StubRestServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
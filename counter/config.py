@@ -1,20 +1,95 @@
+import asyncio
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from counter.adapters.count_repo import count_repo_strategy
+from counter.adapters.async_adapters import ThreadedObjectCountRepo, ThreadedObjectDetector
+from counter.adapters.count_repo import close_count_history, count_history_strategy, count_repo_strategy, \
+    shared_memory_repo
 from counter.adapters.object_detector import object_detector_strategy
-from counter.constants import CountRepoConstants, ModelConstants, EnvironmentConstants
-from counter.domain.actions import CountDetectedObjects
+from counter.constants import Constants, CountRepoConstants, ModelConstants, EnvironmentConstants, \
+    TFSModelVersionConstants
+from counter.debug import DebugSink
+from counter.domain.actions import CountDetectedObjects, AsyncCountDetectedObjects, ReadCountHistory
+from counter.registry import ModelRegistry
 
-_cached_actions = {}
+logger = logging.getLogger(__name__)
+
+_registries = {}
+_cached_async_actions = {}
+_async_executor = None
+_batch_executor = None
+_debug_sinks = {}
+_lock = threading.Lock()
+
+
+def get_debug_sink(env) -> DebugSink:
+    """
+    Returns the process-wide DebugSink for the environment.
+
+    The sample rate comes from Constants.DEBUG_SAMPLE_RATE when set; otherwise every request is
+    rendered in dev and none in prod.
+    """
+    if env not in _debug_sinks:
+        if Constants.DEBUG_SAMPLE_RATE is not None:
+            sample_rate = float(Constants.DEBUG_SAMPLE_RATE)
+        else:
+            sample_rate = 1.0 if env == EnvironmentConstants.DEV else 0.0
+        _debug_sinks[env] = DebugSink(sample_rate, max_queue_size=Constants.DEBUG_QUEUE_SIZE)
+    return _debug_sinks[env]
+
+
+def get_model_registry() -> ModelRegistry:
+    """
+    Returns the process-wide ModelRegistry of the current environment.
+
+    Its startup models are all the models in ModelConstants. In a development environment every
+    model name is served by the fake model and the in-memory repository selected by
+    Constants.DEV_COUNT_REPO, while in production it uses the actual specified model and the
+    repository selected by Constants.COUNT_REPO (PostgreSQL by default). Batch requests run
+    their detector calls on a shared pool of Constants.BATCH_WORKERS threads.
+
+    Returns:
+        ModelRegistry: The registry of CountDetectedObjects actions of the current environment
+    """
+    env = os.environ.get('ENV', 'dev').lower()
+    if env not in _registries:
+        with _lock:
+            if env not in _registries:
+                _registries[env] = ModelRegistry(
+                    lambda model_name, version: _build_count_action(env, model_name, version),
+                    lambda model_name: _resolve_model_version(_actual_model(env, model_name)),
+                    ModelConstants.get_allowed_models()
+                )
+    return _registries[env]
+
+
+def preload_models():
+    """
+    Loads what the models of the current environment need and forked workers can share, without building them.
+
+    Resolves the version of every startup model (see ModelRegistry.resolve_versions), creates the
+    shared memory repository when selected, so forked workers share its totals, and imports the
+    TF Serving detectors and reads their label map unless in a development environment. No
+    thread is started and no connection is left open, so the process can fork afterwards.
+    """
+    env = os.environ.get('ENV', 'dev').lower()
+    get_model_registry().resolve_versions()
+    if _count_repo(env) == CountRepoConstants.SHARED_MEMORY_REPO:
+        shared_memory_repo()
+    if env != EnvironmentConstants.DEV:
+        from counter.adapters.tfs_detector import TFSObjectDetector
+        TFSObjectDetector.build_classes_dict()
 
 
 def get_count_action(model_name) -> CountDetectedObjects:
     """
-    Retrieves or creates a cached CountDetectedObjects action instance based on the environment and model name.
+    Retrieves the CountDetectedObjects action of the model from the current environment's registry.
 
-    This function manages a cache of CountDetectedObjects instances to avoid recreating them unnecessarily.
-    In a development environment, it uses fake models and in-memory repositories, while in production
-    it uses the actual specified model and PostgreSQL repository.
+    Actions are built once per process, normally at startup by ModelRegistry.start, see
+    get_model_registry for how the environment selects the detector and the repository.
 
     Args:
         model_name (str): The name of the object detection model to use
@@ -23,17 +98,149 @@ def get_count_action(model_name) -> CountDetectedObjects:
         CountDetectedObjects: An instance of CountDetectedObjects configured with appropriate
         object detector and repository implementations based on the current environment
     """
+    return get_model_registry().get(model_name)
+
+
+async def get_async_count_action(model_name) -> AsyncCountDetectedObjects:
+    """
+    Retrieves the AsyncCountDetectedObjects action of the model for the ASGI entrypoint.
+
+    It runs the detector and the repository of the action the registry built and warmed up for
+    the model (see get_count_action) on a shared thread pool of Constants.ASYNC_THREAD_POOL_SIZE
+    threads, so both entrypoints share one TF Serving session, one repository and its threads.
+    The action is wrapped again once the registry replaces it, e.g. pinned to a new version.
+    A model the registry has not built yet is built on a thread, as that resolves its version
+    and opens its repository, so the event loop never waits for it.
+
+    Args:
+        model_name (str): The name of the object detection model to use
+
+    Returns:
+        AsyncCountDetectedObjects: An async action configured for the current environment
+    """
+    global _async_executor
+
+    env = os.environ.get('ENV', 'dev').lower()
+    registry = get_model_registry()
+    action = registry.built(model_name) or await asyncio.to_thread(registry.get, model_name)
+    cache_key = (env, model_name)
+    cached = _cached_async_actions.get(cache_key)
+    if cached is None or cached[0] is not action:
+        with _lock:
+            cached = _cached_async_actions.get(cache_key)
+            if cached is None or cached[0] is not action:
+                if _async_executor is None:
+                    _async_executor = ThreadPoolExecutor(max_workers=Constants.ASYNC_THREAD_POOL_SIZE,
+                                                         thread_name_prefix="async-adapter")
+                cached = _cached_async_actions[cache_key] = (action, AsyncCountDetectedObjects(
+                    ThreadedObjectDetector(action.object_detector, _async_executor),
+                    ThreadedObjectCountRepo(action.object_count_repo, _async_executor),
+                    action.debug_sink
+                ))
+    return cached[1]
+
+
+def get_count_history_action() -> Optional[ReadCountHistory]:
+    """
+    Retrieves the ReadCountHistory action of the current environment's count repository.
+
+    Returns:
+        Optional[ReadCountHistory]: The action, or None when the selected repository keeps no
+        count history (only the PostgreSQL repositories do, see count_history_strategy)
+    """
+    env = os.environ.get('ENV', 'dev').lower()
+    history_repo = count_history_strategy(count_repo=_count_repo(env))
+    if history_repo is None:
+        return None
+    return ReadCountHistory(history_repo, max_buckets=Constants.COUNT_HISTORY_MAX_BUCKETS)
+
+
+def close_count_actions():
+    """
+    Closes the count actions built by this process before it exits.
+
+    The write-behind buffers of their repositories are flushed, and the shard compaction and
+    count history rollup threads are stopped.
+    """
+    for registry in list(_registries.values()):
+        registry.close()
+    close_count_history()
+
+
+def close_async_count_actions():
+    """
+    Closes the count actions of the ASGI entrypoint when it stops serving.
+
+    The async actions are dropped and their thread pool shut down once the calls in progress
+    are done, then the registry actions they ran are closed, see close_count_actions.
+    """
+    global _async_executor
+
+    with _lock:
+        _cached_async_actions.clear()
+        executor, _async_executor = _async_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    close_count_actions()
+
+
+def _reset_after_fork():
+    """Drops what a forked worker inherited but cannot use: the parent's executor threads and connections."""
+    global _async_executor, _batch_executor, _lock
+    _lock = threading.Lock()
+    _async_executor = None
+    _batch_executor = None
+    _debug_sinks.clear()
+    _cached_async_actions.clear()
+    for registry in _registries.values():
+        registry.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _build_count_action(env, model_name, version: Optional[int]) -> CountDetectedObjects:
+    global _batch_executor
+
+    with _lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(max_workers=Constants.BATCH_WORKERS, thread_name_prefix="batch")
+    return CountDetectedObjects(
+        object_detector_strategy(model_name=_actual_model(env, model_name), version=version),
+        count_repo_strategy(count_repo=_count_repo(env)),
+        get_debug_sink(env),
+        _batch_executor
+    )
+
+
+def _resolve_model_version(actual_model) -> Optional[int]:
+    """
+    Waits until TF Serving reports the model AVAILABLE and returns the version to pin it to.
+
+    Constants.TFS_MODEL_VERSION selects the version: empty leaves the model unpinned (TF Serving
+    answers with its latest version), ``latest`` pins the latest version available at startup
+    and a number pins that version. The fake model and gRPC-only deployments (no
+    Constants.TFS_PORT to query) are not checked.
+    """
+    requested = Constants.TFS_MODEL_VERSION
+    pinned = None if requested in (TFSModelVersionConstants.UNPINNED, TFSModelVersionConstants.LATEST) \
+        else int(requested)
+    if actual_model == ModelConstants.FAKE_MODEL_NAME:
+        return None
+    if not Constants.TFS_PORT:
+        return pinned
+    from counter.adapters.tfs_status import TFSModelStatus
+    status = TFSModelStatus(Constants.TFS_HOST, Constants.TFS_PORT, actual_model)
+    version = status.wait_until_available(pinned, timeout=Constants.TFS_STATUS_TIMEOUT)
+    signatures = status.metadata(version).get("metadata", {}).get("signature_def", {}).get("signature_def", {})
+    logger.info("model available", extra={"model": actual_model, "version": version,
+                                          "signatures": sorted(signatures)})
+    return None if requested == TFSModelVersionConstants.UNPINNED else version
 
-    env = os.environ.get('ENV', 'dev')
-    cache_key = (env.lower(), model_name)
 
-    if cache_key not in _cached_actions:
-        actual_model = ModelConstants.FAKE_MODEL_NAME if env.lower() == EnvironmentConstants.DEV else model_name
-        count_repo = CountRepoConstants.IN_MEMORY_REPO if env.lower() == EnvironmentConstants.DEV else CountRepoConstants.POSTGRES_REPO
+def _actual_model(env, model_name):
+    return ModelConstants.FAKE_MODEL_NAME if env == EnvironmentConstants.DEV else model_name
 
-        _cached_actions[cache_key] = CountDetectedObjects(
-            object_detector_strategy(model_name=actual_model),
-            count_repo_strategy(count_repo=count_repo)
-        )
 
-    return _cached_actions[cache_key]
+def _count_repo(env):
+    return Constants.DEV_COUNT_REPO if env == EnvironmentConstants.DEV else Constants.COUNT_REPO
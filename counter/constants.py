@@ -1,13 +1,68 @@
-import inspect
 import os
 
 
 class Constants:
     DEFAULT_THRESHOLD = 0.5
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(40 * 1000 * 1000)))
+    DECODE_MAX_SIDE = int(os.environ.get("DECODE_MAX_SIDE", "1024"))
+    MAX_BATCH_CONTENT_LENGTH = int(os.environ.get("MAX_BATCH_CONTENT_LENGTH", str(256 * 1024 * 1024)))
+    MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "64"))
+    BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "4"))
+    MAX_FRAMES = int(os.environ.get("MAX_FRAMES", "300"))
+    MAX_FRAMES_DECODED_BYTES = int(os.environ.get("MAX_FRAMES_DECODED_BYTES", str(512 * 1024 * 1024)))
+    FRAME_DIFFERENCE_THRESHOLD = float(os.environ.get("FRAME_DIFFERENCE_THRESHOLD", "0.02"))
+    FRAME_MAX_GAP = int(os.environ.get("FRAME_MAX_GAP", "30"))
 
     TFS_HOST = os.environ.get("TFS_HOST")
     TFS_PORT = os.environ.get("TFS_PORT")
+    TFS_GRPC_PORT = os.environ.get("TFS_GRPC_PORT", "8500")
+    TFS_PROTOCOL = os.environ.get("TFS_PROTOCOL", "rest")
+    TFS_REST_ENCODING = os.environ.get("TFS_REST_ENCODING", "columnar")
+    TFS_TIMEOUT = float(os.environ.get("TFS_TIMEOUT", "30"))
+    TFS_CONNECT_TIMEOUT = float(os.environ.get("TFS_CONNECT_TIMEOUT", "3.05"))
+    TFS_POOL_SIZE = int(os.environ.get("TFS_POOL_SIZE", "10"))
+    TFS_MAX_RETRIES = int(os.environ.get("TFS_MAX_RETRIES", "2"))
+    TFS_RETRY_BACKOFF = float(os.environ.get("TFS_RETRY_BACKOFF", "0.1"))
+
+    TFS_MODEL_VERSION = os.environ.get("TFS_MODEL_VERSION", "")
+    TFS_STATUS_TIMEOUT = float(os.environ.get("TFS_STATUS_TIMEOUT", "60"))
+
+    WARMUP_REQUESTS = int(os.environ.get("WARMUP_REQUESTS", "1"))
+    WARMUP_IN_BACKGROUND = os.environ.get("WARMUP_IN_BACKGROUND", "true").lower() == "true"
+    WARMUP_RETRY_INTERVAL = float(os.environ.get("WARMUP_RETRY_INTERVAL", "10"))
+
+    TFS_BATCHING_ENABLED = os.environ.get("TFS_BATCHING_ENABLED", "false").lower() == "true"
+    TFS_MAX_BATCH_SIZE = int(os.environ.get("TFS_MAX_BATCH_SIZE", "8"))
+    TFS_BATCH_TIMEOUT_MS = float(os.environ.get("TFS_BATCH_TIMEOUT_MS", "10"))
+    TFS_BATCH_QUEUE_SIZE = int(os.environ.get("TFS_BATCH_QUEUE_SIZE", "64"))
+    TFS_BATCH_WORKERS = int(os.environ.get("TFS_BATCH_WORKERS", "1"))
+
+    PREDICTION_CACHE_ENABLED = os.environ.get("PREDICTION_CACHE_ENABLED", "false").lower() == "true"
+    PREDICTION_CACHE_MAX_BYTES = int(os.environ.get("PREDICTION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", "0"))
+
+    COUNT_BUFFER_ENABLED = os.environ.get("COUNT_BUFFER_ENABLED", "false").lower() == "true"
+    COUNT_BUFFER_MAX_PENDING = int(os.environ.get("COUNT_BUFFER_MAX_PENDING", "1000"))
+    COUNT_BUFFER_FLUSH_INTERVAL = float(os.environ.get("COUNT_BUFFER_FLUSH_INTERVAL", "1"))
+    COUNT_BUFFER_JOURNAL_DIR = os.environ.get("COUNT_BUFFER_JOURNAL_DIR", "tmp/count_journal")
+
+    COUNT_CACHE_ENABLED = os.environ.get("COUNT_CACHE_ENABLED", "false").lower() == "true"
+    COUNT_CACHE_MAX_STALENESS = float(os.environ.get("COUNT_CACHE_MAX_STALENESS", "0"))
+
+    COUNT_REPO = os.environ.get("COUNT_REPO", "postgres")
+    DEV_COUNT_REPO = os.environ.get("DEV_COUNT_REPO", "in_memory")
+    SHARED_MEMORY_LOCK_STRIPES = int(os.environ.get("SHARED_MEMORY_LOCK_STRIPES", "16"))
+    COUNT_SHARDS = int(os.environ.get("COUNT_SHARDS", "8"))
+    COUNT_COMPACTION_INTERVAL = float(os.environ.get("COUNT_COMPACTION_INTERVAL", "60"))
+
+    COUNT_HISTORY_ENABLED = os.environ.get("COUNT_HISTORY_ENABLED", "false").lower() == "true"
+    COUNT_ROLLUP_INTERVAL = float(os.environ.get("COUNT_ROLLUP_INTERVAL", "60"))
+    COUNT_ROLLUP_LAG = float(os.environ.get("COUNT_ROLLUP_LAG", "120"))
+    COUNT_MINUTE_RETENTION_HOURS = float(os.environ.get("COUNT_MINUTE_RETENTION_HOURS", "48"))
+    COUNT_HOUR_RETENTION_DAYS = float(os.environ.get("COUNT_HOUR_RETENTION_DAYS", "90"))
+    COUNT_DAY_RETENTION_DAYS = float(os.environ.get("COUNT_DAY_RETENTION_DAYS", "0"))
+    COUNT_HISTORY_MAX_BUCKETS = int(os.environ.get("COUNT_HISTORY_MAX_BUCKETS", "10000"))
 
     POSTGRES_HOST = os.environ.get("POSTGRES_HOST")
     POSTGRES_PORT = os.environ.get("POSTGRES_PORT")
@@ -20,8 +75,39 @@ class Constants:
     MONGO_USER = os.environ.get("MONGO_USER")
     MONGO_PASSWORD = os.environ.get("MONGO_PASSWORD")
     MONGO_DB = os.environ.get("MONGO_DB")
+    MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+
+    DEBUG_SAMPLE_RATE = os.environ.get("DEBUG_SAMPLE_RATE")
+    DEBUG_QUEUE_SIZE = int(os.environ.get("DEBUG_QUEUE_SIZE", "16"))
+
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+    SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+    SERVER_PORT = int(os.environ.get("SERVER_PORT", "5000"))
+    SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "0"))
+    SERVER_THREADS = int(os.environ.get("SERVER_THREADS", "8"))
+    SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", "2048"))
+    SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", "10000"))
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get("SERVER_MAX_REQUESTS_JITTER", "1000"))
+    SERVER_MAX_WORKER_MEMORY_MB = int(os.environ.get("SERVER_MAX_WORKER_MEMORY_MB", "0"))
+    SERVER_GRACEFUL_TIMEOUT = float(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30"))
+    SERVER_ACCESS_LOG = os.environ.get("SERVER_ACCESS_LOG", "false").lower() == "true"
+    SERVER_METRICS_INTERVAL = float(os.environ.get("SERVER_METRICS_INTERVAL", "1"))
+
+    ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MEMORY_BUDGET_MB = int(os.environ.get("ADMISSION_MEMORY_BUDGET_MB", "512"))
+    # A pre-fork worker runs at most SERVER_THREADS requests: by default half of them infer and the others may wait
+    ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", str(max(1, SERVER_THREADS // 2))))
+    ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING",
+                                               str(max(1, SERVER_THREADS - ADMISSION_MAX_IN_FLIGHT))))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "2"))
+    ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "1"))
+
+    ASYNC_THREAD_POOL_SIZE = int(os.environ.get("ASYNC_THREAD_POOL_SIZE", "64"))
 
     ALLOWED_IMAGE_MIME_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+    ZIP_MIME_TYPES = {"application/zip", "application/x-zip-compressed"}
 
 
 class ModelConstants:
@@ -30,18 +116,59 @@ class ModelConstants:
 
     @classmethod
     def get_allowed_models(cls):
-        return [
-            value for key, value in cls.__dict__.items()
-            if not key.startswith("__") and not inspect.isroutine(value) and not isinstance(value, classmethod)
-        ]
+        return [value for key, value in vars(cls).items() if not key.startswith("_") and isinstance(value, str)]
+
+
+class TFSProtocolConstants:
+    REST = "rest"
+    GRPC = "grpc"
+
+
+class TFSModelVersionConstants:
+    UNPINNED = ""
+    LATEST = "latest"
+
+
+class TFSRestEncodingConstants:
+    INSTANCES = "instances"
+    COLUMNAR = "columnar"
+    B64 = "b64"
 
 
 class CountRepoConstants:
     POSTGRES_REPO = "postgres"
+    STRIPED_POSTGRES_REPO = "striped_postgres"
     MONGO_REPO = "mongo"
     IN_MEMORY_REPO = "in_memory"
+    SHARED_MEMORY_REPO = "shared_memory"
+
+
+class GranularityConstants:
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+    AUTO = "auto"
+
+
+class AdmissionRejectionConstants:
+    QUEUE_FULL = "queue_full"
+    TIMEOUT = "timeout"
+    DEADLINE = "deadline"
 
 
 class EnvironmentConstants:
     DEV = "dev"
     PROD = "prod"
+
+
+class StageConstants:
+    ADMISSION_WAIT = "admission_wait"
+    UPLOAD_READ = "upload_read"
+    DECODE = "decode"
+    ENCODE = "encode"
+    TFS_ROUND_TRIP = "tfs_round_trip"
+    PARSE = "parse"
+    THRESHOLD = "threshold"
+    REPO_WRITE = "repo_write"
+    REPO_WRITE_READ = "repo_write_read"
+    REPO_READ = "repo_read"
@@ -1,15 +1,40 @@
+import logging
 import os
+import queue
+import random
+import threading
+import uuid
+from functools import lru_cache
+from io import BytesIO
 
-from PIL import ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont
 
+from counter.domain.models import DecodedImage, PredictionBatch
+from counter.metrics import REGISTRY
 
-def draw(predictions, image, image_name):
+logger = logging.getLogger(__name__)
+
+DEBUG_DIR = "tmp/debug"
+FONT_PATH = os.path.join(os.path.dirname(__file__), "resources", "arial.ttf")
+
+DEBUG_IMAGES_RENDERED = REGISTRY.counter("counter_debug_images_rendered_total", "Debug images written to disk")
+DEBUG_IMAGES_DROPPED = REGISTRY.counter("counter_debug_images_dropped_total",
+                                        "Sampled debug images dropped because the render queue was full")
+DEBUG_IMAGES_FAILED = REGISTRY.counter("counter_debug_images_failed_total",
+                                       "Sampled requests whose debug images could not be rendered")
+
+
+@lru_cache(maxsize=None)
+def _font(size=20):
+    return ImageFont.truetype(FONT_PATH, size)
+
+
+def draw(predictions, image, image_name, directory=DEBUG_DIR):
     draw_image = ImageDraw.Draw(image, "RGBA")
 
     image_width, image_height = image.size
 
-    font = ImageFont.truetype("counter/resources/arial.ttf", 20)
-    i = 0
+    font = _font()
     for prediction in predictions:
         box = prediction.box
         draw_image.rectangle(
@@ -20,9 +45,97 @@ def draw(predictions, image, image_name):
         draw_image.text(
             (box.xmin * image_width, box.ymin * image_height - font.getlength(class_name)),
             f"{class_name}: {prediction.score}", font=font, fill='black')
-        i += 1
-    try:
-        os.mkdir('tmp/debug')
-    except OSError:
-        pass
-    image.save(f"tmp/debug/{image_name}", "JPEG")
+    os.makedirs(directory, exist_ok=True)
+    image.convert("RGB").save(os.path.join(directory, image_name), "JPEG")
+
+
+class DebugSink:
+    """Renders debug images of a sample of requests on a background thread.
+
+    ``submit`` only takes a copy of the upload and enqueues it, so rendering adds no latency to
+    the request. When the bounded queue is full the item is dropped (and counted) rather than
+    slowing the request down. Every sampled request gets unique file names, so concurrent
+    requests never overwrite each other's images.
+
+    Args:
+        sample_rate (float): Fraction of requests rendered, between 0.0 (off) and 1.0 (all)
+        max_queue_size (int): Maximum number of requests waiting to be rendered
+        directory (str): Directory the debug images are written to
+    """
+
+    def __init__(self, sample_rate: float, max_queue_size: int = 16, directory: str = DEBUG_DIR):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.__queue = queue.Queue(maxsize=max_queue_size)
+        self.__worker = None
+        self.__lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def submit(self, image, predictions, valid_predictions, threshold) -> bool:
+        """Queues the request for rendering if it is sampled; returns whether it was queued."""
+        if image is None or not self.enabled or random.random() >= self.sample_rate:
+            return False
+        item = (self.__snapshot(image), self.__frozen(predictions), self.__frozen(valid_predictions), threshold)
+        try:
+            self.__queue.put_nowait(item)
+        except queue.Full:
+            DEBUG_IMAGES_DROPPED.inc()
+            return False
+        self.__ensure_worker()
+        return True
+
+    def join(self):
+        """Blocks until every queued item has been rendered."""
+        self.__queue.join()
+
+    @staticmethod
+    def __frozen(predictions):
+        # Columnar batches are never modified in place; Prediction objects are only built when rendering
+        return predictions if isinstance(predictions, PredictionBatch) else list(predictions)
+
+    @staticmethod
+    def __snapshot(image):
+        if isinstance(image, DecodedImage):  # never modified in place
+            return image
+        if hasattr(image, "getvalue"):
+            return image.getvalue()
+        image.seek(0)
+        data = image.read()
+        image.seek(0)
+        return data
+
+    def __ensure_worker(self):
+        with self.__lock:
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, name="debug-sink", daemon=True)
+                self.__worker.start()
+
+    def __run(self):
+        while True:
+            data, predictions, valid_predictions, threshold = self.__queue.get()
+            try:
+                self.__render(data, predictions, valid_predictions, threshold)
+            except Exception:  # debug output must never take the worker down
+                DEBUG_IMAGES_FAILED.inc()
+                logger.warning("debug image rendering failed", exc_info=True)
+            finally:
+                self.__queue.task_done()
+
+    def __render(self, data, predictions, valid_predictions, threshold):
+        if isinstance(predictions, PredictionBatch):
+            predictions = predictions.to_predictions()
+        if isinstance(valid_predictions, PredictionBatch):
+            valid_predictions = valid_predictions.to_predictions()
+        request_id = uuid.uuid4().hex[:12]
+        if isinstance(data, DecodedImage):
+            image = Image.fromarray(data.pixels)
+        else:
+            image = Image.open(BytesIO(data))
+            image.load()
+        draw(predictions, image.copy(), f"{request_id}_all_predictions.jpg", self.directory)
+        draw(valid_predictions, image, f"{request_id}_valid_predictions_with_threshold_{threshold}.jpg",
+             self.directory)
+        DEBUG_IMAGES_RENDERED.inc(2)
@@ -1,15 +1,38 @@
-from PIL import Image
+from concurrent.futures import Executor, as_completed
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple, Union
 
-from counter.debug import draw
-from counter.domain.models import CountResponse
-from counter.domain.ports import ObjectDetector, ObjectCountRepo
-from counter.domain.predictions import over_threshold, count
+from counter.constants import GranularityConstants, StageConstants
+from counter.debug import DebugSink
+from counter.domain.frames import aggregate_counts, select_frames
+from counter.domain.history import GRANULARITY_STEPS, bucket_totals, ceil_time, coarsest_granularity, floor_time
+from counter.domain.models import CountHistoryResponse, CountResponse, FrameCount, FrameCountResponse, ObjectCount, \
+    PredictionBatch
+from counter.domain.ports import ObjectDetector, ObjectCountRepo, AsyncObjectDetector, AsyncObjectCountRepo, \
+    ObjectCountHistoryRepo
+from counter.domain.predictions import batch_over_threshold, batch_count
+from counter.metrics import STAGE_SECONDS
 
 
 class CountDetectedObjects:
-    def __init__(self, object_detector: ObjectDetector, object_count_repo: ObjectCountRepo):
+    def __init__(self, object_detector: ObjectDetector, object_count_repo: ObjectCountRepo,
+                 debug_sink: Optional[DebugSink] = None, executor: Optional[Executor] = None):
         self.__object_detector = object_detector
         self.__object_count_repo = object_count_repo
+        self.__debug_sink = debug_sink
+        self.__executor = executor
+
+    @property
+    def object_detector(self) -> ObjectDetector:
+        return self.__object_detector
+
+    @property
+    def object_count_repo(self) -> ObjectCountRepo:
+        return self.__object_count_repo
+
+    @property
+    def debug_sink(self) -> Optional[DebugSink]:
+        return self.__debug_sink
 
     def execute(self, image, threshold, return_total=False) -> CountResponse:
         """
@@ -23,27 +46,243 @@ class CountDetectedObjects:
         Returns:
             CountResponse: Contains current object counts and optionally total counts
         """
-        predictions = self.__find_valid_predictions(image, threshold)
-        object_counts = count(predictions)
-        self.__object_count_repo.update_values(object_counts)
+        object_counts = self.__count(image, self.__object_detector.predict_columnar(image), threshold)
+        total_objects = self.__store(object_counts, return_total)
 
-        total_objects = self.__object_count_repo.read_values(
-            [oc.object_class for oc in object_counts]) if return_total else None
-
-        return CountResponse(
+        return CountResponse.model_construct(
             current_objects=object_counts,
             total_objects=total_objects
         )
 
-    def __find_valid_predictions(self, image, threshold):
-        predictions = self.__object_detector.predict(image)
-        self.__debug_image(image, predictions, "all_predictions.jpg")
-        valid_predictions = list(over_threshold(predictions, threshold=threshold))
-        self.__debug_image(image, valid_predictions, f"valid_predictions_with_threshold_{threshold}.jpg")
-        return valid_predictions
-
-    @staticmethod
-    def __debug_image(image, predictions, image_name):
-        if __debug__ and image is not None:
-            image = Image.open(image)
-            draw(predictions, image, image_name)
+    def warm_up(self, image, threshold, requests=1):
+        """
+        Runs detection and counting on a sample image without storing or rendering anything.
+
+        Every detection goes through the same detector stack as real requests, so the model,
+        connection pools and caches are warm afterwards. The repository is only read.
+
+        Args:
+            image: The sample image to detect objects in
+            threshold: Confidence threshold for object detection
+            requests: Number of warmup detections to run
+        """
+        for _ in range(requests):
+            batch_count(batch_over_threshold(self.__object_detector.predict_columnar(image), threshold=threshold))
+        self.__object_count_repo.read_values()
+
+    def close(self):
+        """Writes the counts the repository still buffers and stops its threads."""
+        self.__object_count_repo.close()
+
+    def execute_batch(self, images: List, threshold, return_total=False,
+                      batch_size=8) -> Iterator[Tuple[Optional[int], Union[CountResponse, Exception]]]:
+        """
+        Executes object detection and counting on many images, yielding each result as soon as it is ready.
+
+        Images are sent to the detector in chunks of ``batch_size``; with an executor the chunks
+        (including their decoding) run in parallel. The count deltas of every image are written
+        to the repository in a single update once all images are processed.
+
+        Args:
+            images: The input images to process
+            threshold: Confidence threshold for object detection
+            return_total: If True, includes total object counts in the final summary
+            batch_size: Number of images per detector call
+
+        Yields:
+            Tuple: ``(index, CountResponse)`` for each counted image, ``(index, Exception)`` for each
+            image that failed, in completion order, then ``(None, CountResponse)`` summarizing the
+            counts of all images (and the totals when requested)
+        """
+        chunks = [list(range(start, min(start + batch_size, len(images))))
+                  for start in range(0, len(images), batch_size)]
+        deltas = {}
+        completed = False
+        try:
+            for indexes, results in self.__predict_chunks(images, chunks):
+                for index, predictions in zip(indexes, results):
+                    if isinstance(predictions, Exception):
+                        yield index, predictions
+                        continue
+                    object_counts = self.__count(images[index], predictions, threshold)
+                    for object_count in object_counts:
+                        object_class = object_count.object_class
+                        deltas[object_class] = deltas.get(object_class, 0) + object_count.count
+                    yield index, CountResponse.model_construct(current_objects=object_counts)
+            completed = True
+        finally:
+            if not completed and deltas:
+                # The caller stopped early: still record the objects that were counted
+                self.__object_count_repo.update_values([ObjectCount(k, v) for k, v in deltas.items()])
+
+        object_counts = [ObjectCount(object_class, count) for object_class, count in deltas.items()]
+        total_objects = self.__store(object_counts, return_total)
+        yield None, CountResponse.model_construct(current_objects=object_counts, total_objects=total_objects)
+
+    def execute_frames(self, frames: List, threshold, return_total=False, difference_threshold=0.02,
+                       max_gap=30, batch_size=8) -> FrameCountResponse:
+        """
+        Executes object detection and counting on the frames of an animated image or clip.
+
+        Only the frames that differ enough from the last inferred one (see select_frames) go to
+        the detector, in batches of ``batch_size``; the other frames reuse its counts. The peak
+        count of every class over the frames is what gets added to the repository, so objects
+        staying in view are counted once per clip rather than once per frame.
+
+        Args:
+            frames: The decoded ``(H, W, 3)`` RGB frames, in order
+            threshold: Confidence threshold for object detection
+            return_total: If True, includes total object counts in the response
+            difference_threshold: Mean absolute thumbnail difference (0-1) above which a frame is inferred
+            max_gap: Maximum number of frames reusing the counts of one inferred frame
+            batch_size: Number of frames per detector call
+
+        Returns:
+            FrameCountResponse: Per-frame counts, max/mean per class and optionally total counts
+        """
+        selected = select_frames(frames, difference_threshold, max_gap)
+        inferred = {}
+        for start in range(0, len(selected), batch_size):
+            indexes = selected[start:start + batch_size]
+            results = self.__object_detector.predict_columnar_batch([frames[index] for index in indexes])
+            for index, predictions in zip(indexes, results):
+                inferred[index] = self.__count(None, predictions, threshold)
+
+        frame_counts = []
+        source = None
+        for index in range(len(frames)):
+            source = index if index in inferred else source
+            frame_counts.append(FrameCount(index, source, inferred[source]))
+        objects = aggregate_counts([frame_count.current_objects for frame_count in frame_counts])
+
+        peaks = [ObjectCount(stats.object_class, stats.max) for stats in objects]
+        total_objects = self.__store(peaks, return_total)
+        return FrameCountResponse.model_construct(frames=frame_counts, objects=objects, inferred_frames=len(selected),
+                                                  total_objects=total_objects)
+
+    def __count(self, image, predictions: PredictionBatch, threshold) -> List[ObjectCount]:
+        with STAGE_SECONDS.time(stage=StageConstants.THRESHOLD):
+            valid_predictions = batch_over_threshold(predictions, threshold=threshold)
+            object_counts = batch_count(valid_predictions)
+        if self.__debug_sink is not None:
+            self.__debug_sink.submit(image, predictions, valid_predictions, threshold)
+        return object_counts
+
+    def __store(self, object_counts: List[ObjectCount], return_total: bool) -> Optional[List[ObjectCount]]:
+        if return_total:
+            with STAGE_SECONDS.time(stage=StageConstants.REPO_WRITE_READ):
+                return self.__object_count_repo.update_and_read_values(object_counts)
+        with STAGE_SECONDS.time(stage=StageConstants.REPO_WRITE):
+            self.__object_count_repo.update_values(object_counts)
+        return None
+
+    def __predict_chunks(self, images, chunks):
+        if self.__executor is None:
+            for indexes in chunks:
+                yield indexes, self.__predict_chunk(images, indexes)
+            return
+
+        futures = {self.__executor.submit(self.__predict_chunk, images, indexes): indexes for indexes in chunks}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def __predict_chunk(self, images, indexes) -> List[Union[PredictionBatch, Exception]]:
+        try:
+            return self.__object_detector.predict_columnar_batch([images[index] for index in indexes])
+        except Exception as e:
+            if len(indexes) == 1:
+                return [e]
+        # Retry the images one by one so a single bad image only fails its own item
+        results = []
+        for index in indexes:
+            try:
+                results.append(self.__object_detector.predict_columnar_batch([images[index]])[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class ReadCountHistory:
+    def __init__(self, object_count_history_repo: ObjectCountHistoryRepo, max_buckets: int = 10000):
+        self.__object_count_history_repo = object_count_history_repo
+        self.__max_buckets = max_buckets
+
+    def execute(self, start: datetime, end: datetime, granularity=GranularityConstants.AUTO,
+                object_classes: List[str] = None) -> CountHistoryResponse:
+        """
+        Reads the counts of every class per time bucket over a range.
+
+        Args:
+            start: Start of the range (timezone aware), rounded down to a whole bucket
+            end: End of the range, exclusive, rounded up to a whole bucket
+            granularity: Size of the buckets, ``auto`` for the coarsest one start and end are aligned to
+            object_classes: Classes to return, all of them when None
+
+        Returns:
+            CountHistoryResponse: The counts of every bucket and the totals over the range
+
+        Raises:
+            ValueError: If the range holds more than ``max_buckets`` buckets of the granularity
+        """
+        if granularity == GranularityConstants.AUTO:
+            granularity = coarsest_granularity(start, end)
+        start, end = floor_time(start, granularity), ceil_time(end, granularity)
+        buckets = (end - start) // GRANULARITY_STEPS[granularity]
+        if buckets > self.__max_buckets:
+            raise ValueError(f"The range holds {buckets} {granularity} buckets, at most {self.__max_buckets} "
+                             f"can be returned: use a coarser granularity or a shorter range.")
+
+        with STAGE_SECONDS.time(stage=StageConstants.REPO_READ):
+            count_buckets = self.__object_count_history_repo.read_buckets(granularity, start, end, object_classes)
+        return CountHistoryResponse.model_construct(granularity=granularity, start=start, end=end,
+                                                    buckets=count_buckets, totals=bucket_totals(count_buckets))
+
+
+class AsyncCountDetectedObjects:
+    """Asyncio counterpart of CountDetectedObjects, built on the async ports.
+
+    The event loop is only held while awaiting the detector and the repository, so a single
+    process can keep many inferences in flight.
+    """
+
+    def __init__(self, object_detector: AsyncObjectDetector, object_count_repo: AsyncObjectCountRepo,
+                 debug_sink: Optional[DebugSink] = None):
+        self.__object_detector = object_detector
+        self.__object_count_repo = object_count_repo
+        self.__debug_sink = debug_sink
+
+    async def execute(self, image, threshold, return_total=False) -> CountResponse:
+        """
+        Executes object detection and counting on the provided image.
+
+        Args:
+            image: The input image to process
+            threshold: Confidence threshold for object detection
+            return_total: If True, includes total object counts in response
+
+        Returns:
+            CountResponse: Contains current object counts and optionally total counts
+        """
+        predictions = await self.__object_detector.predict_columnar(image)
+        with STAGE_SECONDS.time(stage=StageConstants.THRESHOLD):
+            valid_predictions = batch_over_threshold(predictions, threshold=threshold)
+            object_counts = batch_count(valid_predictions)
+        if self.__debug_sink is not None:
+            self.__debug_sink.submit(image, predictions, valid_predictions, threshold)
+
+        if return_total:
+            with STAGE_SECONDS.time(stage=StageConstants.REPO_WRITE_READ):
+                total_objects = await self.__object_count_repo.update_and_read_values(object_counts)
+        else:
+            with STAGE_SECONDS.time(stage=StageConstants.REPO_WRITE):
+                await self.__object_count_repo.update_values(object_counts)
+            total_objects = None
+
+        return CountResponse.model_construct(
+            current_objects=object_counts,
+            total_objects=total_objects
+        )
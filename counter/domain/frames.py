@@ -0,0 +1,47 @@
+from typing import List
+
+import numpy as np
+
+from counter.domain.models import ObjectCount, ObjectCountStats
+
+
+def thumbnail(frame: np.ndarray, size: int = 32) -> np.ndarray:
+    """Downsamples an ``(H, W, C)`` frame to a grayscale thumbnail of about ``size`` pixels per side, in [0, 1]."""
+    step = max(1, min(frame.shape[0], frame.shape[1]) // size)
+    small = frame[::step, ::step]
+    if small.ndim == 3:
+        small = small.mean(axis=2)
+    return small.astype(np.float32) / 255.0
+
+
+def select_frames(frames: List[np.ndarray], difference_threshold: float, max_gap: int) -> List[int]:
+    """Picks the frames worth running the detector on.
+
+    A frame is picked when the mean absolute difference between its thumbnail and the one of
+    the last picked frame exceeds ``difference_threshold``, or when ``max_gap`` frames went by
+    since the last pick, which bounds how long a slow drift can go unnoticed. The first frame is
+    always picked.
+
+    Returns:
+        List[int]: Indexes of the picked frames, in order
+    """
+    selected = []
+    reference = None
+    for index, frame in enumerate(frames):
+        small = thumbnail(frame)
+        if (reference is None or small.shape != reference.shape or index - selected[-1] >= max_gap
+                or float(np.abs(small - reference).mean()) > difference_threshold):
+            selected.append(index)
+            reference = small
+    return selected
+
+
+def aggregate_counts(frame_counts: List[List[ObjectCount]]) -> List[ObjectCountStats]:
+    """Summarizes per-frame counts into the max and mean count of every class over all frames."""
+    totals = {}
+    for object_counts in frame_counts:
+        for object_count in object_counts:
+            maximum, total = totals.get(object_count.object_class, (0, 0))
+            totals[object_count.object_class] = (max(maximum, object_count.count), total + object_count.count)
+    return [ObjectCountStats(object_class, maximum, total / len(frame_counts))
+            for object_class, (maximum, total) in totals.items()]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List
+
+from counter.constants import GranularityConstants
+from counter.domain.models import CountBucket, ObjectCount
+
+GRANULARITY_STEPS = {
+    GranularityConstants.MINUTE: timedelta(minutes=1),
+    GranularityConstants.HOUR: timedelta(hours=1),
+    GranularityConstants.DAY: timedelta(days=1),
+}
+
+# Coarsest first
+GRANULARITIES = [GranularityConstants.DAY, GranularityConstants.HOUR, GranularityConstants.MINUTE]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def floor_time(moment: datetime, granularity: str) -> datetime:
+    """Start of the ``granularity`` bucket holding the (timezone aware) moment; days start at midnight UTC."""
+    return moment - (moment - _EPOCH) % GRANULARITY_STEPS[granularity]
+
+
+def ceil_time(moment: datetime, granularity: str) -> datetime:
+    """Start of the first ``granularity`` bucket at or after the moment."""
+    start = floor_time(moment, granularity)
+    return start if start == moment else start + GRANULARITY_STEPS[granularity]
+
+
+def coarsest_granularity(start: datetime, end: datetime) -> str:
+    """Coarsest granularity both ends of the range fall on a bucket boundary of, minute when none does."""
+    for granularity in GRANULARITIES:
+        if floor_time(start, granularity) == start and floor_time(end, granularity) == end:
+            return granularity
+    return GranularityConstants.MINUTE
+
+
+def aggregate_buckets(buckets: Iterable[CountBucket], granularity: str) -> List[CountBucket]:
+    """Sums finer buckets into ``granularity`` buckets, sorted by bucket start then class."""
+    counts = {}
+    for bucket in buckets:
+        key = (floor_time(bucket.bucket_start, granularity), bucket.object_class)
+        counts[key] = counts.get(key, 0) + bucket.count
+    return [CountBucket(bucket_start, object_class, count)
+            for (bucket_start, object_class), count in sorted(counts.items())]
+
+
+def bucket_totals(buckets: Iterable[CountBucket]) -> List[ObjectCount]:
+    """Count of every class over all the buckets, sorted by class."""
+    totals = {}
+    for bucket in buckets:
+        totals[bucket.object_class] = totals.get(bucket.object_class, 0) + bucket.count
+    return [ObjectCount(object_class, count) for object_class, count in sorted(totals.items())]
@@ -1,12 +1,15 @@
 from dataclasses import dataclass
-from typing import List, Optional, Literal
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, Field
+import numpy as np
+from pydantic import BaseModel, Field, field_validator, model_validator
+from pydantic_core import PydanticCustomError
 
-from counter.constants import Constants, ModelConstants
+from counter.constants import Constants, GranularityConstants, ModelConstants
 
 
-@dataclass
+@dataclass(slots=True)
 class Box:
     xmin: float
     ymin: float
@@ -14,19 +17,100 @@ class Box:
     ymax: float
 
 
-@dataclass
+@dataclass(slots=True)
 class Prediction:
     class_name: str
     score: float
     box: Box
 
 
-@dataclass
+@dataclass(slots=True)
+class DecodedImage:
+    """An upload decoded once and shared by every consumer (detector, cache, debug output).
+
+    Attributes:
+        pixels (np.ndarray): ``(H, W, 3)`` uint8 RGB pixels, possibly downscaled at decode time
+        encoded (Optional[bytes]): The original JPEG bytes, for consumers that can send them as is
+    """
+    pixels: np.ndarray
+    encoded: Optional[bytes] = None
+
+
+@dataclass(slots=True)
+class PredictionBatch:
+    """Columnar predictions of one image: one NumPy array per field instead of one object per detection.
+
+    Attributes:
+        boxes (np.ndarray): ``(N, 4)`` boxes in TF order ``[ymin, xmin, ymax, xmax]``
+        scores (np.ndarray): ``(N,)`` detection scores
+        class_ids (np.ndarray): ``(N,)`` integer class ids
+        class_names (np.ndarray): Lookup array of class names indexed by class id
+        scores_sorted (bool): Whether ``scores`` are in descending order (as TF detection models return them)
+    """
+    boxes: np.ndarray
+    scores: np.ndarray
+    class_ids: np.ndarray
+    class_names: np.ndarray
+    scores_sorted: bool = False
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @property
+    def nbytes(self) -> int:
+        return self.boxes.nbytes + self.scores.nbytes + self.class_ids.nbytes
+
+    def select(self, selection) -> "PredictionBatch":
+        """Returns the detections picked by a slice or a boolean mask."""
+        return PredictionBatch(self.boxes[selection], self.scores[selection], self.class_ids[selection],
+                               self.class_names, self.scores_sorted)
+
+    def to_predictions(self) -> List["Prediction"]:
+        names = self.class_names[self.class_ids]
+        return [Prediction(class_name=name, score=score, box=Box(xmin=box[1], ymin=box[0], xmax=box[3], ymax=box[2]))
+                for name, score, box in zip(names.tolist(), self.scores.tolist(), self.boxes.tolist())]
+
+    @classmethod
+    def from_predictions(cls, predictions: List["Prediction"]) -> "PredictionBatch":
+        class_ids = {}
+        for prediction in predictions:
+            class_ids.setdefault(prediction.class_name, len(class_ids))
+        return cls(boxes=np.array([[p.box.ymin, p.box.xmin, p.box.ymax, p.box.xmax] for p in predictions],
+                                  dtype=np.float64).reshape(-1, 4),
+                   scores=np.array([p.score for p in predictions], dtype=np.float64),
+                   class_ids=np.array([class_ids[p.class_name] for p in predictions], dtype=np.int64),
+                   class_names=np.array(list(class_ids), dtype=object))
+
+
+@dataclass(slots=True)
 class ObjectCount:
     object_class: str
     count: int
 
 
+@dataclass(slots=True)
+class ObjectCountStats:
+    object_class: str
+    max: int
+    mean: float
+
+
+@dataclass(slots=True)
+class CountBucket:
+    """Objects of one class counted during the time bucket starting at ``bucket_start`` (UTC)."""
+    bucket_start: datetime
+    object_class: str
+    count: int
+
+
+@dataclass(slots=True)
+class FrameCount:
+    """Counts of one frame; ``source_frame`` is the frame whose detections they come from."""
+    frame: int
+    source_frame: int
+    current_objects: List[ObjectCount]
+
+
 class CountResponse(BaseModel):
     """Response model for object counting operations.
 
@@ -40,6 +124,9 @@ class CountResponse(BaseModel):
 
     Configuration:
         exclude_none: Excludes None values from JSON serialization
+
+    The actions build it with ``model_construct``: its content is produced by the service itself,
+    so it is not validated again on every request.
     """
     current_objects: List[ObjectCount]
     total_objects: Optional[List[ObjectCount]] = None
@@ -48,6 +135,40 @@ class CountResponse(BaseModel):
         exclude_none = True
 
 
+class FrameCountResponse(BaseModel):
+    """Response model for counting objects in the frames of an animated image or clip.
+
+    Attributes:
+        frames (List[FrameCount]): Counts of every frame, in order. Frames that were too similar
+            to the previous inferred frame reuse its counts (see ``source_frame``).
+        objects (List[ObjectCountStats]): Max and mean count of every class over all frames.
+        inferred_frames (int): Number of frames sent to the detector.
+        total_objects (Optional[List[ObjectCount]]): Optional list of total historical object counts.
+    """
+    frames: List[FrameCount]
+    objects: List[ObjectCountStats]
+    inferred_frames: int
+    total_objects: Optional[List[ObjectCount]] = None
+
+
+class CountHistoryResponse(BaseModel):
+    """Response model for count history queries.
+
+    Attributes:
+        granularity (str): Size of the buckets: minute, hour or day.
+        start (datetime): Start of the first bucket of the range (UTC).
+        end (datetime): End of the last bucket of the range, exclusive (UTC).
+        buckets (List[CountBucket]): Count of every class in every bucket, by bucket start then class.
+            Buckets in which a class was not counted are omitted.
+        totals (List[ObjectCount]): Count of every class over the whole range.
+    """
+    granularity: str
+    start: datetime
+    end: datetime
+    buckets: List[CountBucket]
+    totals: List[ObjectCount]
+
+
 class ObjectCountInput(BaseModel):
     """Input model for object counting requests.
 
@@ -61,5 +182,45 @@ class ObjectCountInput(BaseModel):
     """
 
     threshold: float = Field(default=Constants.DEFAULT_THRESHOLD, ge=0.0, le=1.0)
-    model_name: Literal[*ModelConstants.get_allowed_models()] = ModelConstants.RFCN_MODEL_NAME
+    model_name: str = ModelConstants.RFCN_MODEL_NAME
     return_total: bool = False
+
+    @field_validator("model_name")
+    @classmethod
+    def validate_model_name(cls, model_name: str) -> str:
+        # Checked here rather than typed as a Literal, so the allowed models are not resolved at import
+        allowed_models = ModelConstants.get_allowed_models()
+        if model_name not in allowed_models:
+            raise PydanticCustomError("literal_error", "Input should be {expected}",
+                                      {"expected": " or ".join(repr(model) for model in allowed_models)})
+        return model_name
+
+
+class CountHistoryInput(BaseModel):
+    """Input model for count history queries.
+
+    Times without a timezone are taken as UTC.
+
+    Attributes:
+        start (datetime): Start of the range, rounded down to a whole bucket.
+        end (datetime): End of the range, exclusive, rounded up to a whole bucket.
+        granularity (str): Size of the buckets, ``auto`` for the coarsest one start and end are aligned to.
+        object_class (Optional[List[str]]): Classes to return, all of them when omitted.
+    """
+
+    start: datetime
+    end: datetime
+    granularity: Literal[GranularityConstants.AUTO, GranularityConstants.MINUTE, GranularityConstants.HOUR,
+                         GranularityConstants.DAY] = GranularityConstants.AUTO
+    object_class: Optional[List[str]] = None
+
+    @field_validator("start", "end")
+    @classmethod
+    def to_utc(cls, moment: datetime) -> datetime:
+        return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+    @model_validator(mode="after")
+    def validate_range(self) -> "CountHistoryInput":
+        if self.end <= self.start:
+            raise PydanticCustomError("value_error", "end must be after start")
+        return self
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
+from datetime import datetime
 from typing import BinaryIO, List
 
-from counter.domain.models import Prediction, ObjectCount
+from counter.domain.models import CountBucket, Prediction, ObjectCount, PredictionBatch
 
 
 class ObjectDetector(ABC):  # pragma: no cover
@@ -9,6 +10,17 @@ class ObjectDetector(ABC):  # pragma: no cover
     def predict(self, image: BinaryIO) -> List[Prediction]:
         raise NotImplementedError
 
+    def predict_batch(self, images: List[BinaryIO]) -> List[List[Prediction]]:
+        """Predicts several images at once; implementations backed by a batched model should override it."""
+        return [self.predict(image) for image in images]
+
+    def predict_columnar(self, image: BinaryIO) -> PredictionBatch:
+        return self.predict_columnar_batch([image])[0]
+
+    def predict_columnar_batch(self, images: List[BinaryIO]) -> List[PredictionBatch]:
+        """Columnar predict_batch; detectors parsing model outputs should override it to skip Prediction objects."""
+        return [PredictionBatch.from_predictions(predictions) for predictions in self.predict_batch(images)]
+
 
 class ObjectCountRepo(ABC):  # pragma: no cover
     @abstractmethod
@@ -18,3 +30,43 @@ class ObjectCountRepo(ABC):  # pragma: no cover
     @abstractmethod
     def update_values(self, new_values: List[ObjectCount]):
         raise NotImplementedError
+
+    def update_and_read_values(self, new_values: List[ObjectCount]) -> List[ObjectCount]:
+        """Applies the deltas and returns the new totals of their classes; override it to do both in one round trip."""
+        self.update_values(new_values)
+        return self.read_values([value.object_class for value in new_values])
+
+    def close(self):
+        """Writes what is pending and stops the repository's threads; override it when it has any."""
+
+
+class ObjectCountHistoryRepo(ABC):  # pragma: no cover
+    @abstractmethod
+    def read_buckets(self, granularity: str, start: datetime, end: datetime,
+                     object_classes: List[str] = None) -> List[CountBucket]:
+        """Returns the counts of the ``granularity`` buckets starting in [start, end), both aligned to it."""
+        raise NotImplementedError
+
+
+class AsyncObjectDetector(ABC):  # pragma: no cover
+    @abstractmethod
+    async def predict(self, image: BinaryIO) -> List[Prediction]:
+        raise NotImplementedError
+
+    async def predict_columnar(self, image: BinaryIO) -> PredictionBatch:
+        return PredictionBatch.from_predictions(await self.predict(image))
+
+
+class AsyncObjectCountRepo(ABC):  # pragma: no cover
+    @abstractmethod
+    async def read_values(self, object_classes: List[str] = None) -> List[ObjectCount]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_values(self, new_values: List[ObjectCount]):
+        raise NotImplementedError
+
+    async def update_and_read_values(self, new_values: List[ObjectCount]) -> List[ObjectCount]:
+        """Applies the deltas and returns the new totals of their classes; override it to do both in one round trip."""
+        await self.update_values(new_values)
+        return await self.read_values([value.object_class for value in new_values])
@@ -1,7 +1,9 @@
 from functools import reduce
 from typing import List
 
-from counter.domain.models import Prediction, ObjectCount
+import numpy as np
+
+from counter.domain.models import Prediction, ObjectCount, PredictionBatch
 
 
 def over_threshold(predictions: List[Prediction], threshold: float):
@@ -17,3 +19,18 @@ def count(predictions: List[Prediction]) -> List[ObjectCount]:
 def __count_object_classes(class_counter: dict, object_class: str):
     class_counter[object_class] = class_counter.get(object_class, 0) + 1
     return class_counter
+
+
+def batch_over_threshold(batch: PredictionBatch, threshold: float) -> PredictionBatch:
+    """Vectorized over_threshold: a binary search on sorted scores, a mask otherwise."""
+    if batch.scores_sorted:
+        return batch.select(slice(0, int(np.searchsorted(-batch.scores, -threshold, side='right'))))
+    return batch.select(batch.scores >= threshold)
+
+
+def batch_count(batch: PredictionBatch) -> List[ObjectCount]:
+    """Vectorized count: one bincount over the class ids, in class id order."""
+    occurrences = np.bincount(batch.class_ids, minlength=len(batch.class_names))
+    class_ids = np.flatnonzero(occurrences)
+    return [ObjectCount(object_class, count) for object_class, count in
+            zip(batch.class_names[class_ids].tolist(), occurrences[class_ids].tolist())]
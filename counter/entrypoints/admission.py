@@ -0,0 +1,212 @@
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from counter.constants import AdmissionRejectionConstants, StageConstants
+from counter.metrics import REGISTRY, STAGE_SECONDS
+
+ADMISSION_MEMORY_BYTES = REGISTRY.gauge("counter_admission_memory_bytes",
+                                        "Estimated memory held by the admitted count requests")
+ADMISSION_MEMORY_BUDGET = REGISTRY.gauge("counter_admission_memory_budget_bytes",
+                                         "Estimated memory the admitted count requests may hold")
+ADMISSION_IN_FLIGHT = REGISTRY.gauge("counter_admission_in_flight", "Count requests admitted and not finished")
+ADMISSION_WAITING = REGISTRY.gauge("counter_admission_waiting",
+                                   "Count requests waiting for memory or an inference slot")
+ADMISSION_REJECTED = REGISTRY.counter("counter_admission_rejected_total",
+                                      "Count requests turned away by admission control", ["reason"])
+
+
+class AdmissionRejectedError(RuntimeError):
+    """Raised when a request is not admitted; clients should retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, reason: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _AdmissionBudget:
+    """Memory and inference slots held by the admitted requests, see AdmissionController."""
+
+    def __init__(self, memory_budget: int, max_in_flight: int, max_waiting: int = 32, queue_timeout: float = 2.0,
+                 retry_after: int = 1):
+        self._memory_budget = memory_budget
+        self._max_in_flight = max_in_flight
+        self._max_waiting = max_waiting
+        self._queue_timeout = queue_timeout
+        self._retry_after = retry_after
+        self._memory = 0
+        self._in_flight = 0
+        self._waiting = 0
+        ADMISSION_MEMORY_BUDGET.set(memory_budget)
+
+    def _deadline(self, started: float, queued_since: Optional[float]) -> float:
+        deadline = (started if queued_since is None else queued_since) + self._queue_timeout
+        if started >= deadline:
+            self._reject(AdmissionRejectionConstants.DEADLINE,
+                         f"Request queued for more than {self._queue_timeout:g}s before reaching the service.")
+        return deadline
+
+    def _fits(self, cost: int) -> bool:
+        return self._in_flight < self._max_in_flight and \
+            (self._in_flight == 0 or self._memory + cost <= self._memory_budget)
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._reject(AdmissionRejectionConstants.TIMEOUT, "Too many requests in progress, retry later.")
+        return remaining
+
+    def _start_waiting(self):
+        if self._waiting >= self._max_waiting:
+            self._reject(AdmissionRejectionConstants.QUEUE_FULL, "Too many requests in progress, retry later.")
+        self._waiting += 1
+        self._update_gauges()
+
+    def _stop_waiting(self):
+        self._waiting -= 1
+        self._update_gauges()
+
+    def _acquire(self, cost: int, started: float):
+        self._memory += cost
+        self._in_flight += 1
+        self._update_gauges()
+        STAGE_SECONDS.observe(time.monotonic() - started, stage=StageConstants.ADMISSION_WAIT)
+
+    def _release(self, cost: int):
+        self._memory -= cost
+        self._in_flight -= 1
+        self._update_gauges()
+
+    def _reject(self, reason: str, message: str):
+        ADMISSION_REJECTED.inc(reason=reason)
+        raise AdmissionRejectedError(message, reason, self._retry_after)
+
+    def _update_gauges(self):
+        ADMISSION_MEMORY_BYTES.set(self._memory)
+        ADMISSION_IN_FLIGHT.set(self._in_flight)
+        ADMISSION_WAITING.set(self._waiting)
+
+
+class AdmissionController(_AdmissionBudget):
+    """
+    Bounds the estimated memory and the number of inferences of the requests a process serves at once.
+
+    Every request declares the memory it is estimated to need (upload plus decoded pixels)
+    before reading its upload. It is admitted once that fits in ``memory_budget`` next to the
+    admitted requests and one of ``max_in_flight`` slots is free. Otherwise it waits, but at
+    most ``max_waiting`` requests wait at a time and none longer than ``queue_timeout`` seconds
+    after it was queued, so a burst of large images is turned away early instead of queueing
+    without limit or running the worker out of memory.
+
+    A request larger than the whole budget is admitted alone. AsyncAdmissionController is the
+    variant for requests served on an event loop.
+
+    Args:
+        memory_budget (int): Bytes the admitted requests may hold together
+        max_in_flight (int): Requests admitted at the same time
+        max_waiting (int): Requests waiting for admission at the same time, others are rejected at once
+        queue_timeout (float): Seconds a request may wait, counted from when it was queued
+        retry_after (int): Seconds rejected clients are told to wait before retrying
+    """
+
+    def __init__(self, memory_budget: int, max_in_flight: int, max_waiting: int = 32, queue_timeout: float = 2.0,
+                 retry_after: int = 1):
+        super().__init__(memory_budget, max_in_flight, max_waiting, queue_timeout, retry_after)
+        self.__condition = threading.Condition()
+
+    @contextmanager
+    def admit(self, estimated_bytes: int, queued_since: Optional[float] = None):
+        """
+        Holds the memory and an inference slot of a request for the duration of the ``with`` block.
+
+        Args:
+            estimated_bytes: Memory the request is estimated to need
+            queued_since: ``time.monotonic()`` at which the request was queued, e.g. by a load
+                balancer (see ``queued_at``), defaults to now
+
+        Raises:
+            AdmissionRejectedError: If the request was not admitted within the queue timeout or
+                too many requests are waiting already
+        """
+        cost = estimated_bytes
+        started = time.monotonic()
+        deadline = self._deadline(started, queued_since)
+        with self.__condition:
+            if not self._fits(cost):
+                self._start_waiting()
+                try:
+                    while not self._fits(cost):
+                        self.__condition.wait(self._remaining(deadline))
+                finally:
+                    self._stop_waiting()
+            self._acquire(cost, started)
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self._release(cost)
+                self.__condition.notify_all()
+
+
+class AsyncAdmissionController(_AdmissionBudget):
+    """
+    AdmissionController for the requests of one event loop: waiting requests await instead of blocking a thread.
+
+    Takes the same arguments as AdmissionController and enforces the same limits.
+    """
+
+    def __init__(self, memory_budget: int, max_in_flight: int, max_waiting: int = 32, queue_timeout: float = 2.0,
+                 retry_after: int = 1):
+        super().__init__(memory_budget, max_in_flight, max_waiting, queue_timeout, retry_after)
+        self.__condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def admit(self, estimated_bytes: int, queued_since: Optional[float] = None):
+        """Holds the memory and an inference slot of a request for the duration of the ``async with`` block."""
+        cost = estimated_bytes
+        started = time.monotonic()
+        deadline = self._deadline(started, queued_since)
+        async with self.__condition:
+            if not self._fits(cost):
+                self._start_waiting()
+                try:
+                    while not self._fits(cost):
+                        remaining = self._remaining(deadline)
+                        try:
+                            await asyncio.wait_for(self.__condition.wait(), remaining)
+                        except asyncio.TimeoutError:
+                            pass  # rejected by _remaining unless the request fits now
+                finally:
+                    self._stop_waiting()
+            self._acquire(cost, started)
+        try:
+            yield
+        finally:
+            async with self.__condition:
+                self._release(cost)
+                self.__condition.notify_all()
+
+
+def queued_at(request_start: Optional[str]) -> Optional[float]:
+    """
+    Converts an ``X-Request-Start`` header set by a proxy into the ``time.monotonic()`` it was queued at.
+
+    Accepts the usual ``t=<seconds.fraction>`` form as well as bare seconds, milliseconds or
+    microseconds since the epoch. Returns None when the header is missing or malformed, and
+    never a time in the future (clocks of the proxy and the service may differ slightly).
+    """
+    if not request_start:
+        return None
+    try:
+        value = float(request_start.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    if not math.isfinite(value) or value <= 0:
+        return None
+    # Bare milliseconds or microseconds since the epoch
+    seconds = value / 1e6 if value > 1e14 else value / 1e3 if value > 1e11 else value
+    return time.monotonic() - max(0.0, time.time() - seconds)
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from http import HTTPStatus
+
+from pydantic import ValidationError
+from quart import Quart, Response, g, request, jsonify
+
+from counter.adapters.batching import DetectorOverloadedError
+from counter.adapters.helpers import Helpers
+from counter.adapters.images import decode_image, estimate_decoded_bytes
+from counter.config import close_async_count_actions, get_async_count_action, get_model_registry
+from counter.constants import Constants, StageConstants
+from counter.domain.models import ObjectCountInput
+from counter.entrypoints.admission import AdmissionRejectedError, AsyncAdmissionController, queued_at
+from counter.entrypoints.responses import count_response_json
+from counter.logs import configure_logging
+from counter.metrics import REQUEST_ERRORS, REQUESTS_IN_FLIGHT, STAGE_SECONDS, collect_metrics, render_text
+
+
+def create_app():
+    """
+    Creates the asyncio (ASGI) variant of the object counting API.
+
+    It exposes the same ``/health`` and ``/v1/object-count`` contract as the Flask app in
+    counter.entrypoints.webapp, but requests only hold the event loop while they await
+    TF Serving and the repository. Serve it with any ASGI server, e.g.:
+
+        hypercorn "counter.entrypoints.asgi:create_app()" --bind 0.0.0.0:5000
+    """
+    configure_logging()
+    registry = get_model_registry()
+    registry.start(background=Constants.WARMUP_IN_BACKGROUND)
+    app = Quart(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = Constants.MAX_CONTENT_LENGTH
+    admission = AsyncAdmissionController(memory_budget=Constants.ADMISSION_MEMORY_BUDGET_MB * 1024 * 1024,
+                                         max_in_flight=Constants.ADMISSION_MAX_IN_FLIGHT,
+                                         max_waiting=Constants.ADMISSION_MAX_WAITING,
+                                         queue_timeout=Constants.ADMISSION_QUEUE_TIMEOUT,
+                                         retry_after=Constants.ADMISSION_RETRY_AFTER) \
+        if Constants.ADMISSION_ENABLED else None
+
+    @app.after_serving
+    async def close_count_actions():
+        # Writes the counts the repositories still buffer and stops their threads
+        await asyncio.to_thread(close_async_count_actions)
+
+    @app.after_request
+    async def count_errors(response):
+        if response.status_code >= 400 and request.path.startswith('/v1/'):
+            REQUEST_ERRORS.inc(model=g.get('model_name', 'unknown'), status=response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    async def metrics():
+        """
+        Endpoint exposing the process metrics in the Prometheus text format.
+        """
+        return Response(render_text(collect_metrics()), status=HTTPStatus.OK,
+                        content_type="text/plain; version=0.0.4")
+
+    @app.route('/health', methods=['GET'])
+    async def health_check():
+        """
+        Endpoint to check the health status of the application.
+
+        Returns:
+            tuple: JSON response with 'status' and 'timestamp' fields and HTTP status code 200
+        """
+        return jsonify({'status': 'healthy', 'timestamp': time.time()}), HTTPStatus.OK
+
+    @app.route('/ready', methods=['GET'])
+    async def readiness_check():
+        """
+        Endpoint answering 200 once every model has been built and warmed up, 503 before that.
+
+        Returns:
+            tuple: JSON response with 'status' and per-model 'models' fields and the HTTP status code
+        """
+        ready = registry.ready
+        return jsonify({'status': 'ready' if ready else 'starting', 'models': registry.status()}), \
+            HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE
+
+    @app.route('/v1/object-count', methods=['POST'])
+    async def object_detection():
+        """
+        Endpoint to detect and count objects in an uploaded image.
+
+        Accepts the same multipart/form-data fields and answers with the same status codes
+        as the Flask endpoint (200, 400, 422, 429, 500, 503), under the same admission control.
+        """
+        queued_since = queued_at(request.headers.get('X-Request-Start'))
+        try:
+            # Validate file
+            files = await request.files
+            uploaded_file = files.get('file')
+            Helpers.validate_image_file(uploaded_file)
+
+            # Validate form data using Pydantic
+            form = await request.form
+            data = ObjectCountInput(**form)
+            g.model_name = data.model_name
+
+            # Size the upload up from its header before reading it
+            admitted = nullcontext() if admission is None else admission.admit(
+                (request.content_length or 0) + estimate_decoded_bytes(uploaded_file.stream),
+                queued_since=queued_since)
+            async with admitted:
+                with REQUESTS_IN_FLIGHT.track_inprogress(model=data.model_name):
+                    # Decode once, rejecting oversized images before any pixel is decoded
+                    with STAGE_SECONDS.time(stage=StageConstants.UPLOAD_READ):
+                        upload = uploaded_file.read()
+                    image = await asyncio.to_thread(decode_image, upload)
+
+                    # Process
+                    count_action = await get_async_count_action(model_name=data.model_name)
+                    count_response = await count_action.execute(image, data.threshold, data.return_total)
+            return app.response_class(count_response_json(count_response), status=HTTPStatus.OK,
+                                      mimetype="application/json")
+
+        except ValidationError as ve:
+            return jsonify({"error": ve.errors()}), HTTPStatus.UNPROCESSABLE_ENTITY
+        except ValueError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.BAD_REQUEST
+        except AdmissionRejectedError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": str(e.retry_after)}
+        except DetectorOverloadedError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.SERVICE_UNAVAILABLE
+        except Exception as e:  # pragma: no cover
+            return jsonify({"error": "Internal server error", "details": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    return app
+
+
+if __name__ == '__main__':  # pragma: no cover
+    app = create_app()
+    app.run('0.0.0.0', debug=True)
@@ -0,0 +1,47 @@
+from json.encoder import encode_basestring_ascii
+from typing import List, Optional
+
+from counter.domain.models import CountResponse, ObjectCount
+
+
+def _object_counts_json(object_counts: List[ObjectCount]) -> str:
+    return ",".join([f'{{"count":{int(object_count.count)},"object_class":'
+                     f'{encode_basestring_ascii(object_count.object_class)}}}' for object_count in object_counts])
+
+
+def count_response_json(count_response: CountResponse) -> str:
+    """Encodes a CountResponse to the JSON body of ``/v1/object-count``.
+
+    The body is written straight from the domain objects instead of going through pydantic's
+    ``model_dump`` and ``jsonify``. It matches the bytes ``jsonify`` produces for the dumped
+    model: sorted keys, compact separators, ASCII-escaped strings, ``total_objects`` omitted
+    when it is None and a trailing newline.
+    """
+    body = '{"current_objects":[' + _object_counts_json(count_response.current_objects) + ']'
+    if count_response.total_objects is not None:
+        body += ',"total_objects":[' + _object_counts_json(count_response.total_objects) + ']'
+    return body + '}\n'
+
+
+def batch_item_json(index: int, filename: Optional[str], count_response: CountResponse) -> str:
+    """Encodes the NDJSON line of one counted image of ``/v1/object-count/batch``."""
+    return f'{{"current_objects":[{_object_counts_json(count_response.current_objects)}],' \
+           f'"filename":{_filename_json(filename)},"index":{index}}}\n'
+
+
+def batch_error_json(index: int, filename: Optional[str], error: str) -> str:
+    """Encodes the NDJSON line of an image of ``/v1/object-count/batch`` that could not be counted."""
+    return f'{{"error":{encode_basestring_ascii(error)},"filename":{_filename_json(filename)},"index":{index}}}\n'
+
+
+def batch_summary_json(count_response: CountResponse, images: int, errors: int) -> str:
+    """Encodes the last NDJSON line of ``/v1/object-count/batch``: the counts of the whole batch."""
+    body = f'"current_objects":[{_object_counts_json(count_response.current_objects)}],"errors":{errors},' \
+           f'"images":{images}'
+    if count_response.total_objects is not None:
+        body += ',"total_objects":[' + _object_counts_json(count_response.total_objects) + ']'
+    return '{"summary":{' + body + '}}\n'
+
+
+def _filename_json(filename: Optional[str]) -> str:
+    return "null" if filename is None else encode_basestring_ascii(filename)
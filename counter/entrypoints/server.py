@@ -0,0 +1,355 @@
+"""Pre-fork production server of the Flask app.
+
+    python -m counter.entrypoints.server      (or the ``webapp`` console script)
+
+The master process imports the app, resolves the model versions (waiting until TF Serving serves
+them) and reads the label maps before it forks the workers, so workers share those pages
+copy-on-write. It starts no thread and opens no connection, which would not survive the fork (or
+would leave locks held in the workers): every worker builds its own detectors and repositories
+and warms them up before it accepts connections. Every worker handles SERVER_THREADS requests at a time and
+only accepts a connection from the shared listening socket when one of its threads is free.
+
+Workers are recycled after SERVER_MAX_REQUESTS requests (plus a random jitter, so they do not all
+restart together) or once their resident memory goes over SERVER_MAX_WORKER_MEMORY_MB. SIGTERM
+(or SIGINT) drains: workers stop accepting, finish their requests within SERVER_GRACEFUL_TIMEOUT
+seconds, flush the counts their repositories buffer and exit. SIGHUP replaces every worker the same way.
+
+Workers share their metrics through snapshot files in a temporary directory of the master (see
+counter.metrics.SharedMetrics), so ``/metrics`` covers every worker whichever one answers.
+"""
+import logging
+import os
+import random
+import resource
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from counter.config import close_count_actions, get_model_registry, preload_models
+from counter.constants import Constants
+from counter.logs import configure_logging
+from counter.metrics import SharedMetrics, share_metrics
+
+# Not __name__, which is __main__ under python -m
+logger = logging.getLogger("counter.entrypoints.server")
+
+# A worker that dies quicker than this after being forked is respawned with a delay, not in a tight loop
+_MIN_WORKER_LIFETIME = 1.0
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # One request per connection: an idle kept-alive connection would hold one of the worker's threads
+    protocol_version = "HTTP/1.0"
+
+    def log_request(self, code="-", size="-"):
+        if Constants.SERVER_ACCESS_LOG:
+            super().log_request(code, size)
+
+
+class WorkerServer(BaseWSGIServer):
+    """
+    WSGI server of one worker process, handling up to ``threads`` requests at a time.
+
+    It takes a connection off the shared listening socket only when a thread is free, so busy
+    workers leave new connections in the backlog for idle ones. Once ``max_requests`` requests
+    were handled or the resident memory went over ``max_memory`` bytes (0 disables either), it
+    stops accepting and drains.
+
+    Args:
+        app: The WSGI application
+        listener (socket.socket): Listening socket shared by every worker, non-blocking
+        threads (int): Requests handled at the same time
+        max_requests (int): Requests after which the worker drains and exits, 0 for no limit
+        max_memory (int): Resident memory in bytes above which the worker drains and exits, 0 for no limit
+    """
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, listener: socket.socket, threads: int, max_requests: int = 0, max_memory: int = 0):
+        host, port = listener.getsockname()[:2]
+        super().__init__(host, port, app, handler=_RequestHandler, fd=listener.fileno())
+        self.socket.setblocking(False)
+        self.requests = 0
+        self.__threads = threads
+        self.__max_requests = max_requests
+        self.__max_memory = max_memory
+        self.__slots = threading.BoundedSemaphore(threads)
+        self.__executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+        self.__lock = threading.Lock()
+        self.__draining = False
+
+    def get_request(self):
+        self.__slots.acquire()
+        try:
+            if self.__draining:
+                # Leave the connection to the other workers until serve_forever notices the shutdown
+                raise BlockingIOError("worker draining")
+            return super().get_request()
+        except BaseException:
+            # Another worker took the connection (EAGAIN) or accept failed
+            self.__slots.release()
+            raise
+
+    def process_request(self, request, client_address):
+        self.__executor.submit(self.__process_request, request, client_address)
+
+    def drain(self, reason: str):
+        """Stops accepting connections; ``serve`` returns once the requests in flight are done."""
+        with self.__lock:
+            if self.__draining:
+                return
+            self.__draining = True
+        logger.info("worker draining", extra={"pid": os.getpid(), "reason": reason, "requests": self.requests})
+        # shutdown() waits for the serve_forever loop, which may be running on the calling thread
+        threading.Thread(target=self.shutdown, name="drain", daemon=True).start()
+
+    def serve(self, graceful_timeout: float) -> bool:
+        """Serves until drained; returns whether every request in flight finished within ``graceful_timeout``."""
+        self.serve_forever(poll_interval=0.5)
+        deadline = time.monotonic() + graceful_timeout
+        for _ in range(self.__threads):
+            if not self.__slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        self.__executor.shutdown(wait=False)
+        return True
+
+    def __process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.__slots.release()
+            self.__after_request()
+
+    def __after_request(self):
+        with self.__lock:
+            self.requests += 1
+            requests = self.requests
+        if self.__max_requests and requests >= self.__max_requests:
+            self.drain("max_requests")
+        elif self.__max_memory and rss_bytes() > self.__max_memory:
+            self.drain("max_memory")
+
+
+class PreforkServer:
+    """
+    Master process of the pre-fork server: binds the socket, forks the workers and keeps them running.
+
+    The app is created (and its models preloaded) by the caller before ``run``; every worker
+    builds and warms up the models before serving. A worker that exits, e.g. when recycled, is replaced.
+
+    Args:
+        app: The WSGI application, created in the master
+        host (str): Interface to listen on
+        port (int): Port to listen on, 0 for any free port
+        workers (int): Number of worker processes
+        threads (int): Requests handled at the same time by every worker
+        backlog (int): Connections waiting to be accepted before the kernel refuses new ones
+        max_requests (int): Requests after which a worker is recycled, 0 for no limit
+        max_requests_jitter (int): Up to this many extra requests, drawn per worker
+        max_memory (int): Resident memory in bytes after which a worker is recycled, 0 for no limit
+        graceful_timeout (float): Seconds a draining worker gets to finish its requests
+        metrics_interval (float): Seconds between two snapshots of the metrics of a worker
+    """
+
+    def __init__(self, app, host: str, port: int, workers: int, threads: int, backlog: int = 2048,
+                 max_requests: int = 0, max_requests_jitter: int = 0, max_memory: int = 0,
+                 graceful_timeout: float = 30.0, metrics_interval: float = 1.0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.backlog = backlog
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_memory = max_memory
+        self.graceful_timeout = graceful_timeout
+        self.metrics_interval = metrics_interval
+        self.__metrics_dir = None
+        self.__children: Dict[int, float] = {}
+        self.__stopping = False
+        self.__restarting = False
+
+    def run(self) -> int:
+        """Serves until SIGTERM or SIGINT; returns the exit code of the master."""
+        listener = socket.create_server((self.host, self.port), backlog=self.backlog)
+        listener.setblocking(False)
+        self.port = listener.getsockname()[1]
+        self.__metrics_dir = tempfile.mkdtemp(prefix="counter-metrics-")
+        signal.signal(signal.SIGTERM, self.__stop)
+        signal.signal(signal.SIGINT, self.__stop)
+        signal.signal(signal.SIGHUP, self.__restart)
+        logger.info("server listening", extra={"host": self.host, "port": self.port, "workers": self.workers,
+                                               "threads": self.threads})
+        try:
+            while not self.__stopping:
+                self.__reap()
+                if self.__restarting:
+                    self.__restarting = False
+                    self.__signal_workers(signal.SIGTERM)
+                while len(self.__children) < self.workers and not self.__stopping:
+                    self.__spawn(listener)
+                time.sleep(0.1)
+            self.__signal_workers(signal.SIGTERM)
+            deadline = time.monotonic() + self.graceful_timeout + 5
+            while self.__children and time.monotonic() < deadline:
+                self.__reap()
+                time.sleep(0.1)
+            if self.__children:
+                logger.warning("killing workers still running after the graceful timeout",
+                               extra={"pids": sorted(self.__children)})
+                self.__signal_workers(signal.SIGKILL)
+                while self.__children:
+                    self.__reap(block=True)
+        finally:
+            listener.close()
+            shutil.rmtree(self.__metrics_dir, ignore_errors=True)
+        logger.info("server stopped")
+        return 0
+
+    def __spawn(self, listener: socket.socket):
+        max_requests = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else 0
+        pid = os.fork()
+        if pid:
+            self.__children[pid] = time.monotonic()
+            logger.info("worker started", extra={"pid": pid, "max_requests": max_requests})
+            return
+        code = 1
+        try:
+            code = self.__run_worker(listener, max_requests)
+        except BaseException:
+            logger.exception("worker failed", extra={"pid": os.getpid()})
+        finally:
+            logging.shutdown()
+            # Leave without the master's atexit handlers and finalizers
+            os._exit(code)
+
+    def __run_worker(self, listener: socket.socket, max_requests: int) -> int:
+        for signum in (signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_IGN)
+        # A SIGTERM received while the worker is still starting drains it as soon as it serves
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+        # Builds this worker's connections and threads, pinned to the versions the master resolved
+        get_model_registry().start(background=False)
+        metrics = share_metrics(self.__metrics_dir, self.metrics_interval)
+        server = WorkerServer(self.app, listener, self.threads, max_requests, self.max_memory)
+        signal.signal(signal.SIGTERM, lambda *_: server.drain("sigterm"))
+        if stopped.is_set():
+            server.drain("sigterm")
+        drained = server.serve(self.graceful_timeout)
+        # os._exit skips every finalizer: buffered counts are flushed and background threads stopped here
+        try:
+            close_count_actions()
+        except Exception:
+            logger.exception("closing the count actions failed", extra={"pid": os.getpid()})
+            drained = False
+        metrics.stop()
+        logger.info("worker exiting", extra={"pid": os.getpid(), "requests": server.requests, "drained": drained})
+        return 0 if drained else 1
+
+    def __reap(self, block: bool = False):
+        while self.__children:
+            try:
+                pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                self.__children.clear()
+                return
+            if not pid:
+                return
+            started = self.__children.pop(pid, None)
+            code = os.waitstatus_to_exitcode(status)
+            SharedMetrics.retire(self.__metrics_dir, pid)
+            logger.info("worker exited", extra={"pid": pid, "code": code})
+            if code and started is not None and time.monotonic() - started < _MIN_WORKER_LIFETIME \
+                    and not self.__stopping:
+                time.sleep(_MIN_WORKER_LIFETIME)
+            if block:
+                return
+
+    def __signal_workers(self, signum):
+        for pid in list(self.__children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def __stop(self, *_):
+        self.__stopping = True
+
+    def __restart(self, *_):
+        self.__restarting = True
+
+
+def cpu_count() -> int:
+    """CPUs this process may run on (its affinity mask, which containers restrict), at least 1."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1  # pragma: no cover
+
+
+def rss_bytes() -> int:
+    """Current resident memory of this process, or its peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # pragma: no cover
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def check_admission_limits(threads: int) -> List[str]:
+    """
+    Returns what the admission control limits cannot do in a worker running ``threads`` requests at a time.
+
+    The pre-fork server only hands a worker as many requests as it has threads, the others wait in
+    the listen backlog, so limits at or above it never apply.
+    """
+    if not Constants.ADMISSION_ENABLED:
+        return []
+    problems = []
+    if Constants.ADMISSION_MAX_IN_FLIGHT >= threads:
+        problems.append(f"ADMISSION_MAX_IN_FLIGHT={Constants.ADMISSION_MAX_IN_FLIGHT} is not below "
+                        f"SERVER_THREADS={threads}: requests never wait for an inference slot")
+    if Constants.ADMISSION_MAX_IN_FLIGHT + Constants.ADMISSION_MAX_WAITING > threads:
+        problems.append(f"ADMISSION_MAX_IN_FLIGHT + ADMISSION_MAX_WAITING exceed SERVER_THREADS={threads}: "
+                        f"requests are never rejected for a full admission queue")
+    return problems
+
+
+def main() -> int:
+    """Preloads the models in the master and serves the app with Constants.SERVER_* settings."""
+    from counter.entrypoints.webapp import create_app
+
+    configure_logging()
+    logging.getLogger("werkzeug").setLevel(logging.INFO if Constants.SERVER_ACCESS_LOG else logging.WARNING)
+    for problem in check_admission_limits(Constants.SERVER_THREADS):
+        logger.warning("admission limit never reached", extra={"problem": problem})
+    preload_models()
+    server = PreforkServer(create_app(warm_up=False),
+                           host=Constants.SERVER_HOST,
+                           port=Constants.SERVER_PORT,
+                           workers=Constants.SERVER_WORKERS or cpu_count(),
+                           threads=Constants.SERVER_THREADS,
+                           backlog=Constants.SERVER_BACKLOG,
+                           max_requests=Constants.SERVER_MAX_REQUESTS,
+                           max_requests_jitter=Constants.SERVER_MAX_REQUESTS_JITTER,
+                           max_memory=Constants.SERVER_MAX_WORKER_MEMORY_MB * 1024 * 1024,
+                           graceful_timeout=Constants.SERVER_GRACEFUL_TIMEOUT,
+                           metrics_interval=Constants.SERVER_METRICS_INTERVAL)
+    return server.run()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -1,19 +1,59 @@
+import sys
 import time
+from contextlib import nullcontext
 from http import HTTPStatus
-from io import BytesIO
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from pydantic import ValidationError
 
+from counter.adapters.batching import DetectorOverloadedError
 from counter.adapters.helpers import Helpers
-from counter.config import get_count_action
-from counter.constants import Constants
-from counter.domain.models import ObjectCountInput
+from counter.adapters.images import decode_image, estimate_decoded_bytes
+from counter.config import get_count_action, get_count_history_action, get_model_registry
+from counter.constants import Constants, StageConstants
+from counter.domain.models import CountHistoryInput, ObjectCountInput
+from counter.entrypoints.admission import AdmissionController, AdmissionRejectedError, queued_at
+from counter.entrypoints.responses import batch_error_json, batch_item_json, batch_summary_json, \
+    count_response_json
+from counter.logs import configure_logging
+from counter.metrics import REQUEST_ERRORS, REQUESTS_IN_FLIGHT, STAGE_SECONDS, collect_metrics, render_text
 
 
-def create_app():
+def create_app(warm_up: bool = True):
+    """
+    Creates the Flask app of the object-count API.
+
+    Args:
+        warm_up: Whether to build and warm up the models now (in the background unless
+            Constants.WARMUP_IN_BACKGROUND is false); the pre-fork server leaves it to its workers
+    """
+    configure_logging()
+    registry = get_model_registry()
+    if warm_up:
+        registry.start(background=Constants.WARMUP_IN_BACKGROUND)
     app = Flask(__name__)
     app.config['MAX_CONTENT_LENGTH'] = Constants.MAX_CONTENT_LENGTH
+    admission = AdmissionController(memory_budget=Constants.ADMISSION_MEMORY_BUDGET_MB * 1024 * 1024,
+                                    max_in_flight=Constants.ADMISSION_MAX_IN_FLIGHT,
+                                    max_waiting=Constants.ADMISSION_MAX_WAITING,
+                                    queue_timeout=Constants.ADMISSION_QUEUE_TIMEOUT,
+                                    retry_after=Constants.ADMISSION_RETRY_AFTER) \
+        if Constants.ADMISSION_ENABLED else None
+
+    @app.after_request
+    def count_errors(response):
+        if response.status_code >= 400 and request.path.startswith('/v1/'):
+            REQUEST_ERRORS.inc(model=g.get('model_name', 'unknown'), status=response.status_code)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """
+        Endpoint exposing the metrics (stage latencies, in-flight requests, errors, caches) in the
+        Prometheus text format, those of every worker under the pre-fork server.
+        """
+        return Response(render_text(collect_metrics()), status=HTTPStatus.OK,
+                        content_type="text/plain; version=0.0.4")
 
     @app.route('/health', methods=['GET'])
     def health_check():
@@ -27,6 +67,23 @@ def create_app():
         """
         return jsonify({'status': 'healthy', 'timestamp': time.time()}), HTTPStatus.OK  # pragma: no cover
 
+    @app.route('/ready', methods=['GET'])
+    def readiness_check():
+        """
+        Endpoint to check whether the application is ready to serve requests.
+
+        Models are built and warmed up at startup (see counter.registry.ModelRegistry), so load
+        balancers should only route traffic to the instance once this answers 200.
+
+        Returns:
+            tuple: A tuple containing:
+                - JSON response with 'status' and the version, readiness and warmup time of every model
+                - HTTP status code 200 once every model is warm, 503 before that
+        """
+        ready = registry.ready
+        return jsonify({'status': 'ready' if ready else 'starting', 'models': registry.status()}), \
+            HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE
+
     @app.route('/v1/object-count', methods=['POST'])
     def object_detection():
         """
@@ -43,9 +100,12 @@ def create_app():
                 - JSON response with detected object counts
                 - HTTP status code:
                     * 200: Successful detection and counting
-                    * 400: Invalid request (e.g., missing/invalid file)
+                    * 400: Invalid request (e.g., missing/invalid file, image too large to decode)
                     * 422: Invalid form data
+                    * 429: Over the memory or inference budget of the worker, retry after the
+                      ``Retry-After`` header's seconds (see counter.entrypoints.admission)
                     * 500: Internal server error
+                    * 503: Detector saturated (batching queue full)
 
         Raises:
             ValidationError: If form data validation fails
@@ -59,15 +119,179 @@ def create_app():
 
             # Validate form data using Pydantic
             data = ObjectCountInput(**request.form)
+            g.model_name = data.model_name
+
+            # The upload is still spooled by the form parser: size it up from its header before reading it
+            admitted = nullcontext() if admission is None else admission.admit(
+                (request.content_length or 0) + estimate_decoded_bytes(uploaded_file.stream),
+                queued_since=queued_at(request.headers.get('X-Request-Start')))
+            with admitted, REQUESTS_IN_FLIGHT.track_inprogress(model=data.model_name):
+                # Decode once, rejecting oversized images before any pixel is decoded
+                with STAGE_SECONDS.time(stage=StageConstants.UPLOAD_READ):
+                    upload = uploaded_file.stream.read()
+                image = decode_image(upload)
+
+                # Process
+                count_action = get_count_action(model_name=data.model_name)
+                count_response = count_action.execute(image, data.threshold, data.return_total)
+            return app.response_class(count_response_json(count_response), status=HTTPStatus.OK,
+                                      mimetype="application/json")
+
+        except ValidationError as ve:
+            return jsonify({"error": ve.errors()}), HTTPStatus.UNPROCESSABLE_ENTITY
+        except ValueError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.BAD_REQUEST
+        except AdmissionRejectedError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": str(e.retry_after)}
+        except DetectorOverloadedError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.SERVICE_UNAVAILABLE
+        except Exception as e:  # pragma: no cover
+            return jsonify({"error": "Internal server error", "details": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @app.route('/v1/object-count/batch', methods=['POST'])
+    def batch_object_detection():
+        """
+        Endpoint to detect and count objects in many uploaded images at once.
+
+        Expects a multipart/form-data POST request with:
+            - files: Image files and/or zip archives of images :: Required[At most MAX_BATCH_IMAGES images]
+            - model_name, threshold, return_total: As for /v1/object-count
+
+        The images are sent to the detector in model-sized batches and the count deltas of the
+        whole batch are written to the repository at once. Results are streamed as newline
+        delimited JSON, one line per image as soon as it is counted (in completion order):
+            - {"current_objects": [...], "filename": ..., "index": i} for a counted image
+            - {"error": "...", "filename": ..., "index": i} for an image that could not be counted
+        followed by a last {"summary": {"current_objects": [...], "errors": e, "images": n}} line
+        holding the counts of the whole batch, and the totals when return_total is set.
+
+        Returns:
+            Response: A streamed application/x-ndjson response with HTTP status code:
+                * 200: The batch was accepted (per-image errors are reported in the stream)
+                * 400: Invalid request (e.g., no files, too many images, invalid zip archive)
+                * 422: Invalid form data
+        """
+        # Only the batch endpoint accepts bodies above the single image limit
+        request.max_content_length = Constants.MAX_BATCH_CONTENT_LENGTH
+        try:
+            data = ObjectCountInput(**request.form)
+            g.model_name = data.model_name
+            with STAGE_SECONDS.time(stage=StageConstants.UPLOAD_READ):
+                uploads = Helpers.read_batch_images(request.files.getlist('files') + request.files.getlist('file'))
+        except ValidationError as ve:
+            return jsonify({"error": ve.errors()}), HTTPStatus.UNPROCESSABLE_ENTITY
+        except ValueError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.BAD_REQUEST
+
+        count_action = get_count_action(model_name=data.model_name)
+        valid = [index for index, (_, image) in enumerate(uploads) if not isinstance(image, ValueError)]
+
+        def generate():
+            with REQUESTS_IN_FLIGHT.track_inprogress(model=data.model_name):
+                errors = 0
+                for index, (filename, image) in enumerate(uploads):
+                    if isinstance(image, ValueError):
+                        errors += 1
+                        REQUEST_ERRORS.inc(model=data.model_name, status=int(HTTPStatus.BAD_REQUEST))
+                        yield batch_error_json(index, filename, str(image))
+
+                results = count_action.execute_batch([uploads[index][1] for index in valid], data.threshold,
+                                                     data.return_total, batch_size=Constants.TFS_MAX_BATCH_SIZE)
+                for position, result in results:
+                    if position is None:
+                        yield batch_summary_json(result, images=len(uploads), errors=errors)
+                        continue
+                    index = valid[position]
+                    if isinstance(result, Exception):
+                        errors += 1
+                        message, status = _item_error(result)
+                        REQUEST_ERRORS.inc(model=data.model_name, status=int(status))
+                        yield batch_error_json(index, uploads[index][0], message)
+                    else:
+                        yield batch_item_json(index, uploads[index][0], result)
+
+        return Response(generate(), status=HTTPStatus.OK, mimetype="application/x-ndjson")
+
+    @app.route('/v1/object-count/frames', methods=['POST'])
+    def frames_object_detection():
+        """
+        Endpoint to detect and count objects in every frame of an animated image (GIF, WebP).
+
+        Expects a multipart/form-data POST request with the fields of /v1/object-count. Frames
+        too similar to the last inferred one (Constants.FRAME_DIFFERENCE_THRESHOLD) reuse its
+        counts instead of going to the detector; the inferred frames are sent in model-sized batches.
+
+        Returns:
+            tuple: A tuple containing:
+                - JSON response with the counts of every frame, the max/mean count per class,
+                  the number of inferred frames and optionally the totals
+                - HTTP status code:
+                    * 200: Successful detection and counting
+                    * 400: Invalid request (e.g., missing/undecodable file, too many frames)
+                    * 422: Invalid form data
+                    * 500: Internal server error
+                    * 503: Detector saturated (batching queue full)
+        """
+        try:
+            uploaded_file = request.files.get('file')
+            Helpers.validate_image_file(uploaded_file)
+            data = ObjectCountInput(**request.form)
+            g.model_name = data.model_name
+
+            with REQUESTS_IN_FLIGHT.track_inprogress(model=data.model_name):
+                with STAGE_SECONDS.time(stage=StageConstants.DECODE):
+                    frames = Helpers.read_frames(uploaded_file)
+
+                count_action = get_count_action(model_name=data.model_name)
+                frame_count_response = count_action.execute_frames(
+                    frames, data.threshold, data.return_total,
+                    difference_threshold=Constants.FRAME_DIFFERENCE_THRESHOLD, max_gap=Constants.FRAME_MAX_GAP,
+                    batch_size=Constants.TFS_MAX_BATCH_SIZE)
+            return jsonify(frame_count_response.model_dump(exclude_none=True)), HTTPStatus.OK
+
+        except ValidationError as ve:
+            return jsonify({"error": ve.errors()}), HTTPStatus.UNPROCESSABLE_ENTITY
+        except ValueError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.BAD_REQUEST
+        except DetectorOverloadedError as e:
+            return jsonify({"error": str(e)}), HTTPStatus.SERVICE_UNAVAILABLE
+        except Exception as e:  # pragma: no cover
+            return jsonify({"error": "Internal server error", "details": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @app.route('/v1/object-count/history', methods=['GET'])
+    def count_history():
+        """
+        Endpoint returning how many objects of every class were counted per minute, hour or day.
 
-            # Prepare image
-            image = BytesIO()
-            uploaded_file.save(image)
+        Expects the query parameters:
+            - start: Start of the range, ISO 8601 (UTC unless it has an offset) :: Required
+            - end: End of the range, exclusive :: Required
+            - granularity: minute, hour, day or auto (the coarsest one start and end fall on) :: Optional[Default: auto]
+            - object_class: Class to return, may be repeated :: Optional[Default: every class]
 
-            # Process
-            count_action = get_count_action(model_name=data.model_name)
-            count_response = count_action.execute(image, data.threshold, data.return_total)
-            return jsonify(count_response.model_dump(exclude_none=True)), HTTPStatus.OK
+        The range is widened to whole buckets. Older buckets come from the hourly and daily
+        rollups, recent ones are summed from the minute buckets.
+
+        Returns:
+            tuple: A tuple containing:
+                - JSON response with the granularity, the range, the count of every class per
+                  bucket (buckets without counts are omitted) and the totals over the range
+                - HTTP status code:
+                    * 200: Successful query
+                    * 400: Too many buckets for the granularity
+                    * 422: Invalid query parameters
+                    * 501: The count repository keeps no history
+                    * 500: Internal server error
+        """
+        try:
+            data = CountHistoryInput(**{**request.args.to_dict(),
+                                        "object_class": request.args.getlist('object_class') or None})
+            history_action = get_count_history_action()
+            if history_action is None:
+                return jsonify({"error": "Count history is only kept by the postgres repositories, "
+                                         "with COUNT_HISTORY_ENABLED."}), HTTPStatus.NOT_IMPLEMENTED
+            history_response = history_action.execute(data.start, data.end, data.granularity, data.object_class)
+            return jsonify(history_response.model_dump(mode="json")), HTTPStatus.OK
 
         except ValidationError as ve:
             return jsonify({"error": ve.errors()}), HTTPStatus.UNPROCESSABLE_ENTITY
@@ -79,6 +303,21 @@ def create_app():
     return app
 
 
+def _item_error(error: Exception):
+    """Maps the error of a batch item to its message and the HTTP status the single image endpoint would answer."""
+    if isinstance(error, ValueError):
+        return str(error), HTTPStatus.BAD_REQUEST
+    if isinstance(error, DetectorOverloadedError):
+        return str(error), HTTPStatus.SERVICE_UNAVAILABLE
+    return "Internal server error", HTTPStatus.INTERNAL_SERVER_ERROR  # pragma: no cover
+
+
+def main():  # pragma: no cover
+    """Entrypoint of the ``webapp`` console script: serves the app with the pre-fork production server."""
+    from counter.entrypoints.server import main as serve
+    sys.exit(serve())
+
+
 if __name__ == '__main__':  # pragma: no cover
     app = create_app()
     app.run('0.0.0.0', debug=True)
@@ -0,0 +1,46 @@
+import json
+import logging
+import time
+
+from counter.constants import Constants
+
+# Attributes every LogRecord has; anything else was passed through ``extra`` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line, with the ``extra`` fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 6), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = Constants.LOG_LEVEL, log_format: str = Constants.LOG_FORMAT):
+    """
+    Sets up the ``counter`` logger once per process.
+
+    Hot-path messages are logged at DEBUG, so with the default INFO level they cost a level
+    check and nothing is formatted or written.
+
+    Args:
+        level (str): Minimum level of the records written (e.g. DEBUG, INFO, WARNING)
+        log_format (str): ``json`` for one JSON object per line, ``text`` for plain lines
+    """
+    logger = logging.getLogger("counter")
+    logger.setLevel(level.upper())
+    if any(getattr(handler, "_counter_handler", False) for handler in logger.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._counter_handler = True
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        handler.formatter.converter = time.gmtime
+    logger.addHandler(handler)
+    logger.propagate = False
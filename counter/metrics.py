@@ -0,0 +1,366 @@
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class Counter:
+    """A monotonically increasing, thread-safe counter with optional labels.
+
+    Args:
+        name (str): Metric name, e.g. ``counter_tfs_pool_hits_total``
+        documentation (str): One-line description of the metric
+        labelnames (Sequence[str]): Names of the labels every sample is keyed by
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, samples: Dict[Tuple[str, ...], float]):
+        """Adds the samples of the same metric of another process."""
+        with self._lock:
+            for key, value in samples.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Counter):
+    """A thread-safe value that can go up and down."""
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """Increments the gauge for the duration of the ``with`` block."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram:
+    """A thread-safe histogram of observed values with fixed upper bucket bounds.
+
+    Bucket counts are kept per bucket (not cumulative) so an observation is one bisect and
+    three additions under the lock.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def bucket_counts(self, **labels) -> List[int]:
+        """Returns the (non-cumulative) number of observations per bucket, the last one being ``+Inf``."""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        entry = self._values.get(key)
+        return list(entry[0]) if entry else [0] * (len(self.buckets) + 1)
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        entry = self._values.get(key)
+        return entry[2] if entry else 0
+
+    def samples(self) -> Dict[Tuple[str, ...], tuple]:
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+
+    def merge(self, samples: Dict[Tuple[str, ...], tuple]):
+        """Adds the samples of the same histogram of another process, which has the same buckets."""
+        with self._lock:
+            for key, (counts, total, count) in samples.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                entry[0] = [mine + theirs for mine, theirs in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the ``with`` block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics, looked up (or created) by name."""
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __get_or_create(self, metric_cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = metric_cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not metric_cls:
+                raise ValueError(f"Metric {name} is already registered as a {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.__get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.__get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.__get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str):
+        return self.__metrics.get(name)
+
+    def collect(self):
+        with self.__lock:
+            return list(self.__metrics.values())
+
+    def snapshot(self, gauges: bool = True) -> dict:
+        """Returns the metrics and their samples as JSON-serializable data, see ``merge``."""
+        snapshot = {}
+        for metric in self.collect():
+            metric_type = _metric_type(metric)
+            if metric_type == "gauge" and not gauges:
+                continue
+            snapshot[metric.name] = {
+                "type": metric_type,
+                "documentation": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(metric.buckets) if metric_type == "histogram" else None,
+                "samples": [[list(key), sample] for key, sample in metric.samples().items()],
+            }
+        return snapshot
+
+    def merge(self, snapshot: dict, gauges: bool = True):
+        """Adds the samples of a ``snapshot`` (e.g. of another process), creating the metrics it has and this lacks."""
+        for name, metric in snapshot.items():
+            if metric["type"] == "histogram":
+                target = self.histogram(name, metric["documentation"], metric["labelnames"], metric["buckets"])
+            elif metric["type"] == "gauge":
+                if not gauges:
+                    continue
+                target = self.gauge(name, metric["documentation"], metric["labelnames"])
+            else:
+                target = self.counter(name, metric["documentation"], metric["labelnames"])
+            target.merge({tuple(key): sample for key, sample in metric["samples"]})
+
+
+class SharedMetrics:
+    """
+    Shares the metrics of the workers of the pre-fork server, so that any worker's ``/metrics`` covers them all.
+
+    Every worker writes a snapshot of its registry to ``<directory>/<pid>.json`` every ``interval``
+    seconds and when it stops. ``collect`` adds the other workers' snapshots to the live metrics of
+    the calling worker: counters and histograms are summed, and so are gauges (e.g. the requests in
+    flight in all the workers). Once a worker exited, the master ``retire``s it: its counters and
+    histograms are added to ``exited.json``, so the totals never go down, and its gauges dropped.
+    Merged metrics are therefore at most ``interval`` seconds behind.
+
+    Args:
+        registry (MetricsRegistry): Metrics of this process
+        directory (str): Directory shared by the master and its workers
+        interval (float): Seconds between two snapshots of this process
+    """
+
+    EXITED = "exited"
+
+    def __init__(self, registry: MetricsRegistry, directory: str, interval: float = 1.0):
+        self.__registry = registry
+        self.__directory = Path(directory)
+        self.__interval = interval
+        self.__path = self.__directory / f"{os.getpid()}.json"
+        self.__writer = None
+        self.__stop = threading.Event()
+
+    def start(self):
+        """Writes a snapshot now, then every ``interval`` seconds from a daemon thread."""
+        self.write()
+        if self.__writer is None:
+            self.__writer = threading.Thread(target=self.__write_periodically, name="metrics-snapshot", daemon=True)
+            self.__writer.start()
+
+    def stop(self):
+        """Stops the snapshot thread and writes the last snapshot of this process."""
+        self.__stop.set()
+        if self.__writer is not None:
+            self.__writer.join()
+            self.__writer = None
+        self.write()
+
+    def write(self):
+        _write_json(self.__path, self.__registry.snapshot())
+
+    def collect(self) -> MetricsRegistry:
+        """Returns a registry with the live metrics of this process plus the snapshots of the others."""
+        merged = MetricsRegistry()
+        merged.merge(self.__registry.snapshot())
+        with _locked(self.__directory, fcntl.LOCK_SH):
+            for path in sorted(self.__directory.glob("*.json")):
+                if path != self.__path:
+                    merged.merge(_read_json(path))
+        return merged
+
+    @classmethod
+    def retire(cls, directory: str, pid: int):
+        """Adds the counters and histograms of the exited worker ``pid`` to those of the previous ones."""
+        directory = Path(directory)
+        path = directory / f"{pid}.json"
+        with _locked(directory, fcntl.LOCK_EX):
+            if not path.exists():
+                return
+            exited = MetricsRegistry()
+            exited.merge(_read_json(directory / f"{cls.EXITED}.json"))
+            exited.merge(_read_json(path), gauges=False)
+            _write_json(directory / f"{cls.EXITED}.json", exited.snapshot(gauges=False))
+            path.unlink()
+
+    def __write_periodically(self):
+        while not self.__stop.wait(self.__interval):
+            self.write()
+
+
+_SHARED: Optional[SharedMetrics] = None
+
+
+def share_metrics(directory: str, interval: float = 1.0) -> SharedMetrics:
+    """Starts sharing REGISTRY with the other workers through ``directory``, see SharedMetrics."""
+    global _SHARED
+    _SHARED = SharedMetrics(REGISTRY, directory, interval)
+    _SHARED.start()
+    return _SHARED
+
+
+def collect_metrics() -> MetricsRegistry:
+    """Returns the metrics ``/metrics`` exposes: REGISTRY, plus the other workers' once shared."""
+    return REGISTRY if _SHARED is None else _SHARED.collect()
+
+
+def render_text(registry: MetricsRegistry) -> str:
+    """Renders every metric of the registry in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in registry.collect():
+        metric_type = _metric_type(metric)
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation, quote=False)}")
+        lines.append(f"# TYPE {metric.name} {metric_type}")
+        for key, sample in sorted(metric.samples().items()):
+            labels = list(zip(metric.labelnames, key))
+            if metric_type != "histogram":
+                lines.append(f"{metric.name}{_labels(labels)} {_number(sample)}")
+                continue
+            counts, total, count = sample
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{metric.name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{metric.name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{metric.name}_count{_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def _metric_type(metric) -> str:
+    return "histogram" if isinstance(metric, Histogram) else "gauge" if isinstance(metric, Gauge) else "counter"
+
+
+@contextmanager
+def _locked(directory: Path, operation: int):
+    # Readers never see a retired worker in both its own snapshot and exited.json
+    with open(directory / ".lock", "a") as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def _write_json(path: Path, data: dict):
+    # Written aside and renamed, so readers never see a partial snapshot
+    temporary = path.with_name(f".{path.name}.tmp")
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value: str, quote: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("counter_stage_duration_seconds",
+                                   "Duration of each step of a count request",
+                                   ["stage"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                                       0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("counter_requests_in_flight", "Count requests being processed", ["model"])
+REQUEST_ERRORS = REGISTRY.counter("counter_request_errors_total",
+                                  "Count requests (or batch items) that failed, by HTTP status", ["model", "status"])
@@ -0,0 +1,249 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from counter.constants import Constants
+from counter.domain.actions import CountDetectedObjects
+
+logger = logging.getLogger(__name__)
+
+# Mid-gray frame of a typical upload size: detectors resize it like a real image but find nothing in it
+WARMUP_IMAGE = np.full((480, 640, 3), 128, dtype=np.uint8)
+
+
+@dataclass
+class ModelState:
+    model_name: str
+    version: Optional[int] = None
+    ready: bool = False
+    warmup_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ModelRegistry:
+    """
+    Holds the count action of every model, built, pinned to a version and warmed up once per process.
+
+    ``start`` builds the actions of ``model_names`` and runs ``warmup_requests`` detections on
+    each, so no user request pays for opening repositories, reading the label map or the cold
+    model load of TF Serving. Actions of other model names are built on first use. Building is
+    done under a lock per model, so concurrent first requests wait for one action instead of
+    building one each, without waiting for the other models.
+
+    A model whose version could not be resolved (e.g. TF Serving still loading it) is served
+    unpinned meanwhile; after ``start``, the models that are not ready are retried every
+    ``retry_interval`` seconds on a daemon thread, and their action is rebuilt pinned once the
+    version resolves.
+
+    Args:
+        build_action: Builds the action of a model name, pinned to a version (None for the latest)
+        resolve_version: Waits until a model name is served and returns the version to pin it to,
+            or None to leave it unpinned
+        model_names: Names of the models built and warmed up by ``start``
+        warmup_requests: Warmup detections run on every model by ``start``
+        retry_interval: Seconds between two attempts at resolving and warming up the models not ready
+    """
+
+    def __init__(self, build_action: Callable[[str, Optional[int]], CountDetectedObjects],
+                 resolve_version: Callable[[str], Optional[int]], model_names: List[str],
+                 warmup_requests: int = Constants.WARMUP_REQUESTS,
+                 retry_interval: float = Constants.WARMUP_RETRY_INTERVAL):
+        self.__build_action = build_action
+        self.__resolve_version = resolve_version
+        self.__model_names = list(model_names)
+        self.__warmup_requests = warmup_requests
+        self.__retry_interval = retry_interval
+        self.__lock = threading.Lock()
+        self.__model_locks: Dict[str, threading.Lock] = {}
+        self.__actions: Dict[str, CountDetectedObjects] = {}
+        self.__replaced: List[CountDetectedObjects] = []
+        self.__states = {model_name: ModelState(model_name) for model_name in self.__model_names}
+        self.__resolved = set()
+        self.__started = False
+        self.__finished = threading.Event()
+        self.__stopped = threading.Event()
+        self.__retries = None
+
+    def get(self, model_name: str) -> CountDetectedObjects:
+        """Returns the action of the model, building it first if ``start`` has not got to it yet."""
+        action = self.__actions.get(model_name)
+        if action is None:
+            with self.__model_lock(model_name):
+                action = self.__actions.get(model_name)
+                if action is None:
+                    action = self.__actions[model_name] = self.__build(model_name)
+        return action
+
+    def built(self, model_name: str) -> Optional[CountDetectedObjects]:
+        """Returns the action of the model if it is built already, None otherwise; never blocks."""
+        return self.__actions.get(model_name)
+
+    def start(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Builds and warms up every model, once per registry.
+
+        The models that are not ready afterwards are retried in the background until ``stop``.
+
+        Args:
+            background: Whether to warm up on a daemon thread and return at once
+
+        Returns:
+            Optional[threading.Thread]: The warmup thread when started in the background
+        """
+        with self.__lock:
+            if self.__started:
+                return None
+            self.__started = True
+        if not background:
+            self.__warm_up_all()
+            if not self.ready:
+                self.__retries = threading.Thread(target=self.__retry_until_ready, name="model-warmup-retry",
+                                                  daemon=True)
+                self.__retries.start()
+            return None
+        self.__retries = threading.Thread(target=self.__warm_up_and_retry, name="model-warmup", daemon=True)
+        self.__retries.start()
+        return self.__retries
+
+    def stop(self):
+        """Stops retrying the models that are not ready."""
+        self.__stopped.set()
+        if self.__retries is not None:
+            self.__retries.join()
+            self.__retries = None
+
+    def close(self):
+        """Stops the retries and closes every action built, writing the counts their repositories still buffer."""
+        self.stop()
+        with self.__lock:
+            actions = [action for action in self.__replaced + list(self.__actions.values()) if action is not None]
+            self.__replaced = []
+            self.__actions = {}
+        for action in actions:
+            action.close()
+
+    def resolve_versions(self):
+        """
+        Resolves the version of every startup model without building their actions.
+
+        It opens no connection that outlives the call and starts no thread, so a pre-fork server
+        can call it before forking: the workers then build their actions pinned to these versions.
+        """
+        for model_name in self.__model_names:
+            with self.__model_lock(model_name):
+                self.__resolve(model_name)
+
+    @property
+    def ready(self) -> bool:
+        """Whether every startup model has been built and warmed up."""
+        return self.__finished.is_set() and all(state.ready for state in self.__states.values())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the first warmup of every model has finished and returns whether they are all ready."""
+        self.__finished.wait(timeout)
+        return self.ready
+
+    def reset_after_fork(self):
+        """
+        Forgets the actions built before the process forked, keeping the versions resolved for them.
+
+        The connections and threads of those actions stayed in the parent process, so ``start``
+        builds and warms up new ones in this process, pinned to the same versions as its siblings.
+        """
+        self.__lock = threading.Lock()
+        self.__model_locks = {}
+        self.__actions = {}
+        self.__replaced = []
+        self.__started = False
+        self.__finished = threading.Event()
+        self.__stopped = threading.Event()
+        self.__retries = None
+        for model_name, state in self.__states.items():
+            state.ready = False
+            state.warmup_seconds = None
+            if model_name in self.__resolved:
+                state.error = None
+
+    def version(self, model_name: str) -> Optional[int]:
+        """Returns the version the model is pinned to, None while unpinned."""
+        state = self.__states.get(model_name)
+        return None if state is None else state.version
+
+    def status(self) -> Dict[str, dict]:
+        """Returns the version, readiness, warmup time and startup error of every model."""
+        return {model_name: asdict(state) for model_name, state in self.__states.items()}
+
+    def __model_lock(self, model_name: str) -> threading.Lock:
+        with self.__lock:
+            return self.__model_locks.setdefault(model_name, threading.Lock())
+
+    def __build(self, model_name: str) -> CountDetectedObjects:
+        state = self.__states.setdefault(model_name, ModelState(model_name))
+        # Still build the action unpinned when not resolved: requests get TF Serving's own error
+        # until it serves the model
+        self.__resolve(model_name)
+        return self.__build_action(model_name, state.version)
+
+    def __resolve(self, model_name: str) -> bool:
+        """Resolves the version of the model once; returns whether it is resolved."""
+        if model_name in self.__resolved:
+            return True
+        state = self.__states[model_name]
+        try:
+            state.version = self.__resolve_version(model_name)
+        except Exception as e:
+            state.error = str(e)
+            logger.warning("model version not resolved", extra={"model": model_name, "error": str(e)})
+            return False
+        state.error = None
+        self.__resolved.add(model_name)
+        return True
+
+    def __warm_up_and_retry(self):
+        self.__warm_up_all()
+        self.__retry_until_ready()
+
+    def __warm_up_all(self):
+        try:
+            for model_name in self.__model_names:
+                self.__warm_up(model_name)
+        finally:
+            self.__finished.set()
+
+    def __retry_until_ready(self):
+        while not self.ready and not self.__stopped.wait(self.__retry_interval):
+            for model_name in self.__model_names:
+                if not self.__states[model_name].ready:
+                    self.__retry(model_name)
+
+    def __retry(self, model_name: str):
+        if model_name not in self.__resolved:
+            with self.__model_lock(model_name):
+                if model_name in self.__resolved or not self.__resolve(model_name):
+                    return
+                # Replaces the unpinned action; requests holding it finish with it, close() closes it
+                self.__replaced.append(self.__actions.get(model_name))
+                self.__actions[model_name] = self.__build_action(model_name, self.__states[model_name].version)
+        self.__warm_up(model_name)
+
+    def __warm_up(self, model_name: str):
+        state = self.__states[model_name]
+        started = time.perf_counter()
+        try:
+            action = self.get(model_name)
+            if model_name in self.__resolved:
+                action.warm_up(WARMUP_IMAGE, Constants.DEFAULT_THRESHOLD, requests=self.__warmup_requests)
+        except Exception as e:
+            state.error = str(e)
+            logger.exception("model warmup failed", extra={"model": model_name})
+            return
+        if model_name in self.__resolved:
+            state.error = None
+            state.warmup_seconds = round(time.perf_counter() - started, 6)
+            state.ready = True
+            logger.info("model ready", extra={"model": model_name, "version": state.version,
+                                              "warmup_seconds": state.warmup_seconds})
@@ -36,7 +36,7 @@ config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL)
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-from counter.adapters.helpers import Base
+from counter.adapters.models import Base
 from counter.adapters.models import *
 target_metadata = Base.metadata
 
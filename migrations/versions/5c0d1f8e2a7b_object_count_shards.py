@@ -0,0 +1,39 @@
+"""object count shards
+
+Revision ID: 5c0d1f8e2a7b
+Revises: ae2870447b2b
+Create Date: 2025-06-02 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0d1f8e2a7b'
+down_revision: Union[str, None] = 'ae2870447b2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('object_count_shards',
+    sa.Column('object_class', sa.String(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('object_class', 'shard')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fold the uncompacted increments back into object_counts before dropping the shards
+    op.execute(
+        "INSERT INTO object_counts (object_class, count) "
+        "SELECT object_class, SUM(count) FROM object_count_shards GROUP BY object_class "
+        "ON CONFLICT (object_class) DO UPDATE SET count = object_counts.count + EXCLUDED.count"
+    )
+    op.drop_table('object_count_shards')
@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from counter.adapters.batching import BatchingObjectDetector, DetectorOverloadedError, BATCH_SIZE
+from counter.domain.ports import ObjectDetector
+from tests.domain.helpers import generate_prediction
+
+
+class RecordingDetector(ObjectDetector):
+    """Echoes every image back as a prediction class name and records the batch sizes it was called with."""
+
+    def __init__(self, delay=0.0, error=None):
+        self.batch_sizes = []
+        self.delay = delay
+        self.error = error
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        self.batch_sizes.append(len(images))
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [[generate_prediction(image)] for image in images]
+
+
+def test_concurrent_calls_are_batched():
+    detector = RecordingDetector(delay=0.05)
+    batching = BatchingObjectDetector(detector, "batched", max_batch_size=4, max_wait=0.05)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batching.predict, [f"image-{i}" for i in range(8)]))
+    batching.close()
+
+    assert [r[0].class_name for r in results] == [f"image-{i}" for i in range(8)]
+    assert sum(detector.batch_sizes) == 8
+    assert len(detector.batch_sizes) < 8
+    assert max(detector.batch_sizes) <= 4
+    assert BATCH_SIZE.count(model="batched") == len(detector.batch_sizes)
+
+
+def test_errors_are_propagated_to_every_caller():
+    batching = BatchingObjectDetector(RecordingDetector(error=RuntimeError("TFS down")), "failing")
+    with pytest.raises(RuntimeError, match="TFS down"):
+        batching.predict("image")
+    batching.close()
+
+
+def test_full_queue_is_rejected():
+    release = threading.Event()
+
+    class BlockingDetector(RecordingDetector):
+        def predict_batch(self, images):
+            release.wait(5)
+            return super().predict_batch(images)
+
+    batching = BatchingObjectDetector(BlockingDetector(), "saturated", max_batch_size=1, max_wait=0, max_queue_size=1)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        in_flight = pool.submit(batching.predict, "first")
+        time.sleep(0.05)  # let the worker pick "first" so the queue is empty again
+        queued = pool.submit(batching.predict, "second")
+        time.sleep(0.05)
+        with pytest.raises(DetectorOverloadedError):
+            batching.predict("third")
+        release.set()
+        assert in_flight.result()[0].class_name == "first"
+        assert queued.result()[0].class_name == "second"
+    batching.close()
+
+
+def test_rejected_call_does_not_infer_the_images_it_queued():
+    release = threading.Event()
+
+    class BlockingDetector(RecordingDetector):
+        def predict_batch(self, images):
+            release.wait(5)
+            return super().predict_batch(images)
+
+    detector = BlockingDetector()
+    batching = BatchingObjectDetector(detector, "partial", max_batch_size=4, max_wait=0, max_queue_size=2)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        in_flight = pool.submit(batching.predict, "first")
+        time.sleep(0.05)  # let the worker pick "first" so the queue is empty again
+        # The first 2 images fit in the queue, the third does not
+        with pytest.raises(DetectorOverloadedError):
+            batching.predict_batch(["a", "b", "c"])
+        release.set()
+        assert in_flight.result()[0].class_name == "first"
+    batching.close()
+    time.sleep(0.05)
+    assert detector.batch_sizes == [1]
+
+
+def test_missing_predictions_fail_their_callers():
+    class ShortDetector(RecordingDetector):
+        def predict_batch(self, images):
+            return super().predict_batch(images)[:-1]
+
+    batching = BatchingObjectDetector(ShortDetector(), "short", max_batch_size=2, max_wait=0.5)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = [pool.submit(batching.predict, f"image-{i}") for i in range(2)]
+        outcomes = [future.exception(timeout=5) for future in results]
+    batching.close()
+    assert sum(isinstance(outcome, RuntimeError) for outcome in outcomes) == 1
@@ -0,0 +1,118 @@
+import os
+import time
+
+import pytest
+
+from counter.adapters.count_buffer import BufferedObjectCountRepo, BUFFER_REPLAYED
+from counter.adapters.count_repo import CountInMemoryRepo, count_repo_strategy
+from counter.adapters.postgres_repo import CountPostgresRepo
+from counter.constants import CountRepoConstants
+from counter.domain.models import ObjectCount
+
+
+class RecordingRepo(CountInMemoryRepo):
+    """In-memory repo that records every update_values call and can be made to fail."""
+
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+        self.fail = False
+        self.closed = False
+
+    def update_values(self, new_values):
+        if self.fail:
+            raise ConnectionError("database down")
+        self.updates.append(sorted((v.object_class, v.count) for v in new_values))
+        super().update_values(new_values)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def wrapped():
+    return RecordingRepo()
+
+
+@pytest.fixture
+def buffered(wrapped, tmp_path):
+    repo = BufferedObjectCountRepo(wrapped, journal_dir=str(tmp_path), max_pending=1000, flush_interval=60)
+    yield repo
+    repo.close()
+
+
+def test_deltas_are_merged_into_one_flush(buffered, wrapped):
+    for _ in range(50):
+        buffered.update_values([ObjectCount("person", 2), ObjectCount("bottle", 1)])
+    assert wrapped.updates == []
+
+    buffered.flush()
+    assert wrapped.updates == [[("bottle", 50), ("person", 100)]]
+
+
+def test_close_flushes_and_closes_the_wrapped_repo(buffered, wrapped, tmp_path):
+    buffered.update_values([ObjectCount("person", 3)])
+    buffered.close()
+
+    assert wrapped.updates == [[("person", 3)]]
+    assert wrapped.closed
+    assert os.listdir(tmp_path) == []
+
+
+def test_read_values_includes_pending_deltas(buffered, wrapped):
+    wrapped.store["person"] = ObjectCount("person", 10)
+    buffered.update_values([ObjectCount("person", 3), ObjectCount("cup", 1)])
+
+    assert buffered.read_values(["person", "cup", "dog"]) == [ObjectCount("person", 13), ObjectCount("cup", 1)]
+    assert buffered.update_and_read_values([ObjectCount("cup", 1)]) == [ObjectCount("cup", 2)]
+    buffered.flush()
+    assert sorted(buffered.read_values(), key=lambda oc: oc.object_class) == \
+        [ObjectCount("cup", 2), ObjectCount("person", 13)]
+
+
+def test_size_trigger_flushes_in_background(wrapped, tmp_path):
+    repo = BufferedObjectCountRepo(wrapped, journal_dir=str(tmp_path), max_pending=3, flush_interval=60)
+    for _ in range(3):
+        repo.update_values([ObjectCount("person", 1)])
+    deadline = time.monotonic() + 2
+    while not wrapped.updates and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert wrapped.updates == [[("person", 3)]]
+    repo.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_flush_keeps_deltas(buffered, wrapped):
+    buffered.update_values([ObjectCount("person", 1)])
+    wrapped.fail = True
+    with pytest.raises(ConnectionError):
+        buffered.flush()
+    assert buffered.read_values(["person"]) == [ObjectCount("person", 1)]
+
+    wrapped.fail = False
+    buffered.update_values([ObjectCount("person", 1)])
+    buffered.flush()
+    assert wrapped.updates == [[("person", 2)]]
+
+
+def test_journal_of_crashed_buffer_is_replayed(wrapped, tmp_path):
+    crashed = BufferedObjectCountRepo(wrapped, journal_dir=str(tmp_path), flush_interval=60)
+    crashed.update_values([ObjectCount("person", 2)])
+    crashed.update_values([ObjectCount("person", 1), ObjectCount("bottle", 4)])
+    # Simulate the process dying: its lock is released without flushing or cleaning up
+    crashed._BufferedObjectCountRepo__lock_file.close()
+
+    replayed = BUFFER_REPLAYED.value()
+    survivor = BufferedObjectCountRepo(wrapped, journal_dir=str(tmp_path), flush_interval=60)
+    assert wrapped.updates == [[("bottle", 4), ("person", 3)]]
+    assert BUFFER_REPLAYED.value() == replayed + 1
+    survivor.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_count_repo_strategy_buffered(tmp_path, monkeypatch):
+    monkeypatch.setattr("counter.constants.Constants.COUNT_BUFFER_JOURNAL_DIR", str(tmp_path))
+    repo = count_repo_strategy(CountRepoConstants.POSTGRES_REPO, buffered=True)
+    assert isinstance(repo, BufferedObjectCountRepo)
+    repo.close()
+    assert isinstance(count_repo_strategy(CountRepoConstants.POSTGRES_REPO, buffered=False), CountPostgresRepo)
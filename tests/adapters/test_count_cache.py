@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from counter.adapters.count_cache import CachingObjectCountRepo, TOTALS_CACHE_HITS, TOTALS_CACHE_HIT_RATIO
+from counter.adapters.count_repo import CountInMemoryRepo, count_repo_strategy
+from counter.constants import CountRepoConstants
+from counter.domain.models import ObjectCount
+
+
+class CountingRepo(CountInMemoryRepo):
+    """In-memory repo counting the read_values calls that reach it."""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+
+    def read_values(self, object_classes=None):
+        self.reads += 1
+        return [value for value in super().read_values(object_classes) if value is not None]
+
+
+@pytest.fixture
+def wrapped():
+    wrapped = CountingRepo()
+    wrapped.store = {"person": ObjectCount("person", 10)}
+    return wrapped
+
+
+def test_totals_are_served_from_cache_and_kept_in_sync(wrapped):
+    cache = CachingObjectCountRepo(wrapped)
+    hits = TOTALS_CACHE_HITS.value()
+
+    assert cache.read_values(["person", "cup"]) == [ObjectCount("person", 10)]
+    cache.update_values([ObjectCount("person", 2), ObjectCount("cup", 1)])
+    assert cache.read_values(["person", "cup"]) == [ObjectCount("person", 12), ObjectCount("cup", 1)]
+    assert cache.update_and_read_values([ObjectCount("cup", 1)]) == [ObjectCount("cup", 2)]
+
+    assert wrapped.reads == 1
+    assert TOTALS_CACHE_HITS.value() == hits + 3
+    assert 0 < TOTALS_CACHE_HIT_RATIO.value() <= 1
+
+
+def test_update_and_read_values_on_a_miss_uses_the_repository_totals(wrapped):
+    cache = CachingObjectCountRepo(wrapped)
+    assert cache.update_and_read_values([ObjectCount("person", 1)]) == [ObjectCount("person", 11)]
+    assert cache.read_values(["person"]) == [ObjectCount("person", 11)]
+    assert wrapped.reads == 1  # the default update_and_read_values of the wrapped repo
+
+
+def test_invalidate_and_max_staleness(wrapped):
+    cache = CachingObjectCountRepo(wrapped, max_staleness=0.05)
+    cache.read_values(["person"])
+    wrapped.update_values([ObjectCount("person", 5)])  # another worker's write
+    assert cache.read_values(["person"]) == [ObjectCount("person", 10)]
+
+    time.sleep(0.06)
+    assert cache.read_values(["person"]) == [ObjectCount("person", 15)]
+
+    wrapped.update_values([ObjectCount("person", 5)])
+    cache.invalidate(["person"])
+    assert cache.read_values(["person"]) == [ObjectCount("person", 20)]
+    assert wrapped.reads == 3
+
+
+def test_count_repo_strategy_cached():
+    assert isinstance(count_repo_strategy(CountRepoConstants.POSTGRES_REPO, cached=True), CachingObjectCountRepo)
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import delete
+
+from counter.adapters.count_history import CountHistoryPostgresRepo
+from counter.adapters.count_repo import count_history_strategy
+from counter.adapters.models import CountRollupWatermarkDB, ObjectCountDB, ObjectCountDailyDB, ObjectCountHourlyDB, \
+    ObjectCountMinuteDB, ObjectCountShardDB
+from counter.adapters.postgres_repo import CountPostgresRepo, CountStripedPostgresRepo
+from counter.constants import CountRepoConstants, GranularityConstants
+from counter.domain.models import CountBucket, ObjectCount
+
+DAY = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+
+class Clock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def _empty_tables(_sqlite_session_factory):
+    def empty():
+        with _sqlite_session_factory() as session:
+            for model in (ObjectCountDB, ObjectCountShardDB, ObjectCountMinuteDB, ObjectCountHourlyDB,
+                          ObjectCountDailyDB, CountRollupWatermarkDB):
+                session.execute(delete(model))
+            session.commit()
+
+    empty()
+    yield
+    empty()
+
+
+@pytest.fixture
+def clock():
+    return Clock(DAY)
+
+
+@pytest.fixture
+def repo(clock):
+    return CountPostgresRepo("user", "pwd", "localhost", "5432", "irrelevant_db", history=True, clock=clock)
+
+
+@pytest.fixture
+def history_repo(clock):
+    history_repo = CountHistoryPostgresRepo("user", "pwd", "localhost", "5432", "irrelevant_db", rollup_lag=120,
+                                            minute_retention=timedelta(hours=48), hour_retention=timedelta(days=90),
+                                            clock=clock)
+    yield history_repo
+    history_repo.stop_rollup()
+
+
+def _count_every_10_minutes(repo, clock, hours: int):
+    """Counts 1 bottle at every 10th minute of ``hours`` hours from DAY, and 1 cup at every 30th."""
+    for minute in range(0, hours * 60, 10):
+        clock.now = DAY + timedelta(minutes=minute, seconds=7)
+        repo.update_values([ObjectCount("bottle", 1)] + ([ObjectCount("cup", 1)] if minute % 30 == 0 else []))
+
+
+def test_updates_are_counted_in_minute_buckets(repo, history_repo, clock):
+    clock.now = DAY + timedelta(minutes=5, seconds=30)
+    repo.update_values([ObjectCount("bottle", 2), ObjectCount("cup", 1)])
+    assert repo.update_and_read_values([ObjectCount("bottle", 3)])
+    clock.now += timedelta(minutes=1)
+    repo.update_values([ObjectCount("bottle", 1)])
+
+    assert history_repo.read_buckets(GranularityConstants.MINUTE, DAY, DAY + timedelta(hours=1)) == [
+        CountBucket(DAY + timedelta(minutes=5), "bottle", 5),
+        CountBucket(DAY + timedelta(minutes=5), "cup", 1),
+        CountBucket(DAY + timedelta(minutes=6), "bottle", 1),
+    ]
+    assert history_repo.read_buckets(GranularityConstants.HOUR, DAY, DAY + timedelta(hours=1), ["cup"]) == [
+        CountBucket(DAY, "cup", 1)]
+
+
+def test_striped_repo_counts_in_minute_bucket_shards(history_repo, clock, mocker, _sqlite_session_factory):
+    striped_repo = CountStripedPostgresRepo("user", "pwd", "localhost", "5432", "irrelevant_db", shards=2,
+                                            history=True, clock=clock)
+    mocker.patch.object(striped_repo, "shard_for_writer", side_effect=[0, 1])
+    striped_repo.update_values([ObjectCount("bottle", 4)])
+    striped_repo.update_values([ObjectCount("bottle", 3)])
+
+    with _sqlite_session_factory() as session:
+        assert sorted((row.shard, row.count) for row in session.query(ObjectCountMinuteDB)) == [(0, 4), (1, 3)]
+    assert history_repo.read_buckets(GranularityConstants.MINUTE, DAY, DAY + timedelta(minutes=1)) == [
+        CountBucket(DAY, "bottle", 7)]
+    history_repo.roll_up(now=DAY + timedelta(hours=2))
+    assert history_repo.read_buckets(GranularityConstants.HOUR, DAY, DAY + timedelta(hours=1)) == [
+        CountBucket(DAY, "bottle", 7)]
+
+
+def test_roll_up_only_complete_hours_and_days(repo, history_repo, clock):
+    _count_every_10_minutes(repo, clock, hours=26)
+
+    # 02:01 on the next day: the last hour ended less than the lag ago
+    written = history_repo.roll_up(now=DAY + timedelta(hours=26, minutes=1))
+    assert written == {GranularityConstants.HOUR: 25 * 2, GranularityConstants.DAY: 2, "pruned": 0}
+    assert history_repo.roll_up(now=DAY + timedelta(hours=26, minutes=1)) == \
+        {GranularityConstants.HOUR: 0, GranularityConstants.DAY: 0, "pruned": 0}
+
+    end = DAY + timedelta(hours=26)
+    hourly = history_repo.read_buckets(GranularityConstants.HOUR, DAY, end)
+    assert len(hourly) == 26 * 2
+    assert {bucket.count for bucket in hourly if bucket.object_class == "bottle"} == {6}
+    assert {bucket.count for bucket in hourly if bucket.object_class == "cup"} == {2}
+    assert history_repo.read_buckets(GranularityConstants.DAY, DAY, DAY + timedelta(days=2)) == [
+        CountBucket(DAY, "bottle", 144), CountBucket(DAY, "cup", 48),
+        CountBucket(DAY + timedelta(days=1), "bottle", 12), CountBucket(DAY + timedelta(days=1), "cup", 4)]
+
+
+def test_reads_are_the_same_before_and_after_roll_up(repo, history_repo, clock):
+    _count_every_10_minutes(repo, clock, hours=30)
+    end = DAY + timedelta(hours=30)
+    before = {granularity: history_repo.read_buckets(granularity, DAY, end)
+              for granularity in (GranularityConstants.MINUTE, GranularityConstants.HOUR)}
+    before[GranularityConstants.DAY] = history_repo.read_buckets(GranularityConstants.DAY, DAY,
+                                                                 DAY + timedelta(days=2))
+
+    history_repo.roll_up(now=end)
+    after = {granularity: history_repo.read_buckets(granularity, DAY, end)
+             for granularity in (GranularityConstants.MINUTE, GranularityConstants.HOUR)}
+    after[GranularityConstants.DAY] = history_repo.read_buckets(GranularityConstants.DAY, DAY,
+                                                                DAY + timedelta(days=2))
+    assert after == before
+
+
+def test_roll_up_prunes_only_rolled_up_buckets(repo, history_repo, clock):
+    _count_every_10_minutes(repo, clock, hours=2)
+    three_days_later = DAY + timedelta(days=3)
+
+    assert history_repo.roll_up(now=three_days_later)["pruned"] == 2 * (6 + 2)
+    assert history_repo.read_buckets(GranularityConstants.MINUTE, DAY, DAY + timedelta(hours=2)) == []
+    # Still answered from the hourly and daily rollups
+    assert history_repo.read_buckets(GranularityConstants.HOUR, DAY, DAY + timedelta(hours=2), ["bottle"]) == [
+        CountBucket(DAY, "bottle", 6), CountBucket(DAY + timedelta(hours=1), "bottle", 6)]
+    assert history_repo.read_buckets(GranularityConstants.DAY, DAY, DAY + timedelta(days=1)) == [
+        CountBucket(DAY, "bottle", 12), CountBucket(DAY, "cup", 4)]
+
+
+def test_count_history_strategy(monkeypatch):
+    assert count_history_strategy(CountRepoConstants.POSTGRES_REPO) is None
+    monkeypatch.setattr("counter.constants.Constants.COUNT_HISTORY_ENABLED", True)
+    assert count_history_strategy(CountRepoConstants.IN_MEMORY_REPO) is None
+    assert count_history_strategy(CountRepoConstants.MONGO_REPO) is None
+    history_repo = count_history_strategy(CountRepoConstants.POSTGRES_REPO)
+    assert isinstance(history_repo, CountHistoryPostgresRepo)
+    assert count_history_strategy(CountRepoConstants.STRIPED_POSTGRES_REPO) is history_repo
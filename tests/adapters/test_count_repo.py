@@ -1,7 +1,16 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
 import pytest
+from pymongo import UpdateOne
 
-from counter.adapters.count_repo import CountPostgresRepo
-from counter.adapters.count_repo import count_repo_strategy, CountInMemoryRepo, CountMongoDBRepo
+from counter.adapters.count_repo import count_repo_strategy, CountInMemoryRepo, CountSharedMemoryRepo
+from counter.adapters.helpers import Helpers
+from counter.adapters.mongo_repo import CountMongoDBRepo
+from counter.adapters.postgres_repo import COMPACTIONS, CountPostgresRepo, CountStripedPostgresRepo
 from counter.constants import CountRepoConstants
 from counter.domain.models import ObjectCount
 
@@ -10,6 +19,9 @@ def test_count_repo_strategy1():
     assert isinstance(count_repo_strategy(count_repo=CountRepoConstants.POSTGRES_REPO), CountPostgresRepo)
     assert isinstance(count_repo_strategy(count_repo=CountRepoConstants.IN_MEMORY_REPO), CountInMemoryRepo)
     assert isinstance(count_repo_strategy(count_repo=CountRepoConstants.MONGO_REPO), CountMongoDBRepo)
+    striped_repo = count_repo_strategy(count_repo=CountRepoConstants.STRIPED_POSTGRES_REPO)
+    assert isinstance(striped_repo, CountStripedPostgresRepo)
+    striped_repo.stop_compaction()
 
 
 @pytest.fixture
@@ -83,3 +95,116 @@ def test_postgres_increment_existing_value(repo):
     repo.update_values([ObjectCount("cat", 4)])
     cat_count = repo.read_values(["cat"])[0]
     assert cat_count.count == 5
+
+
+def test_postgres_update_and_read_values_returns_new_totals(repo):
+    repo.update_values([ObjectCount("bicycle", 2)])
+    totals = repo.update_and_read_values([ObjectCount("bicycle", 3), ObjectCount("kite", 1), ObjectCount("kite", 1)])
+    assert totals == [ObjectCount("bicycle", 5), ObjectCount("kite", 2)]
+    assert repo.update_and_read_values([]) == []
+
+
+def test_mongo_client_is_shared():
+    client = Helpers.get_mongo_client("localhost", 27017, 5, connect=False)
+    assert Helpers.get_mongo_client("localhost", 27017, 5, connect=False) is client
+    client.close()
+
+
+def test_mongo_update_values_is_one_bulk_write(monkeypatch):
+    client = MagicMock()
+    monkeypatch.setattr(Helpers, "get_mongo_client", lambda *_args, **_kw: client)
+    mongo_repo = CountMongoDBRepo("localhost", "27017", "counter_db")
+    counter_col = client["counter_db"].counter
+
+    mongo_repo.update_values([ObjectCount("person", 2), ObjectCount("bottle", 1)])
+    mongo_repo.update_values([ObjectCount("person", 1)])
+
+    counter_col.create_index.assert_called_once_with("object_class", unique=True)
+    assert counter_col.bulk_write.call_count == 2
+    requests, kwargs = counter_col.bulk_write.call_args_list[0]
+    assert requests[0] == [UpdateOne({"object_class": "person"}, {"$inc": {"count": 2}}, upsert=True),
+                           UpdateOne({"object_class": "bottle"}, {"$inc": {"count": 1}}, upsert=True)]
+    assert kwargs == {"ordered": False}
+
+
+@pytest.fixture
+def striped_repo():
+    striped_repo = CountStripedPostgresRepo("user", "pwd", "localhost", "5432", "irrelevant_db", shards=4)
+    yield striped_repo
+    striped_repo.stop_compaction()
+
+
+def test_striped_repo_reads_sum_of_base_and_shards(repo, striped_repo):
+    repo.update_values([ObjectCount("zebra", 10)])
+    striped_repo.update_values([ObjectCount("zebra", 2), ObjectCount("giraffe", 1)])
+    striped_repo.update_values([ObjectCount("zebra", 3)])
+
+    assert sorted(striped_repo.read_values(["zebra", "giraffe"]), key=lambda oc: oc.object_class) == \
+        [ObjectCount("giraffe", 1), ObjectCount("zebra", 15)]
+    assert striped_repo.update_and_read_values([ObjectCount("giraffe", 4)]) == [ObjectCount("giraffe", 5)]
+
+
+def test_striped_repo_writers_use_several_shards(striped_repo):
+    # The SQLite test database is per thread, so only the shard choice is exercised concurrently
+    barrier = threading.Barrier(8)
+
+    def pick_shard(_):
+        barrier.wait()  # keep every thread alive so no thread ident is reused
+        return striped_repo.shard_for_writer()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        shards = set(pool.map(pick_shard, range(8)))
+    assert len(shards) > 1
+    assert shards <= set(range(4))
+
+
+def test_failed_compactions_are_counted_and_logged(striped_repo, mocker, caplog):
+    compact = mocker.patch.object(striped_repo, "compact", side_effect=RuntimeError("db down"))
+    failures = COMPACTIONS.value(result="error")
+    striped_repo.start_compaction(0.01)
+    deadline = time.monotonic() + 5
+    while COMPACTIONS.value(result="error") == failures and time.monotonic() < deadline:
+        time.sleep(0.01)
+    striped_repo.stop_compaction()
+
+    assert compact.called
+    assert COMPACTIONS.value(result="error") > failures
+    assert "count shard compaction failed" in caplog.text
+
+
+def test_striped_repo_compaction_keeps_totals(repo, striped_repo):
+    striped_repo.update_values([ObjectCount("horse", 2)])
+    before = {oc.object_class: oc.count for oc in striped_repo.read_values()}
+
+    assert striped_repo.compact() > 0
+    assert {oc.object_class: oc.count for oc in striped_repo.read_values()} == before
+    assert repo.read_values(["horse"]) == [ObjectCount("horse", 2)]
+    assert striped_repo.compact() == 0
+
+
+def test_shared_memory_repo_is_shared_with_forked_workers():
+    shared_repo = CountSharedMemoryRepo(["person", "cup", "cat"], lock_stripes=2)
+    shared_repo.update_values([ObjectCount("person", 2)])
+
+    def work():
+        for _ in range(500):
+            shared_repo.update_values([ObjectCount("person", 1), ObjectCount("cup", 1)])
+
+    workers = [multiprocessing.get_context("fork").Process(target=work) for _ in range(2)]
+    threads = [threading.Thread(target=work) for _ in range(2)]
+    for worker in workers + threads:
+        worker.start()
+    for worker in workers + threads:
+        worker.join()
+
+    assert shared_repo.read_values(["person", "cup", "cat", "unknown"]) == \
+        [ObjectCount("person", 2002), ObjectCount("cup", 2000)]
+    assert shared_repo.read_values() == [ObjectCount("person", 2002), ObjectCount("cup", 2000)]
+    with pytest.raises(ValueError):
+        shared_repo.update_values([ObjectCount("unicorn", 1)])
+
+
+def test_shared_memory_repo_strategy():
+    shared_repo = count_repo_strategy(CountRepoConstants.SHARED_MEMORY_REPO)
+    assert shared_repo is count_repo_strategy(CountRepoConstants.SHARED_MEMORY_REPO)
+    assert {"person", "cat"} <= set(CountSharedMemoryRepo.default_classes())
@@ -0,0 +1,70 @@
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from counter.adapters.images import decode_image, estimate_decoded_bytes
+from counter.adapters.prediction_cache import image_digest
+from counter.domain.models import DecodedImage
+from tests.helpers import png_header
+
+
+def encode(image: Image.Image, image_format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def test_jpeg_is_downscaled_while_decoding():
+    data = encode(Image.new("RGB", (2048, 1536), (200, 10, 10)), "JPEG")
+    decoded = decode_image(io.BytesIO(data), max_side=700)
+    assert decoded.pixels.shape == (768, 1024, 3)  # 1/2 scale keeps the short side >= 700
+    assert decoded.pixels.dtype == np.uint8
+    assert decoded.encoded == data
+
+
+def test_other_formats_are_decoded_at_full_size():
+    decoded = decode_image(encode(Image.new("RGBA", (300, 200)), "PNG"), max_side=100)
+    assert decoded.pixels.shape == (200, 300, 3)
+    assert decoded.encoded is None
+
+
+def test_sample_image_matches_full_decode():
+    data = (Path(__file__).parent.parent.parent / "resources" / "images" / "boy.jpg").read_bytes()
+    decoded = decode_image(data, max_side=0)
+    assert np.array_equal(decoded.pixels, np.asarray(Image.open(io.BytesIO(data)).convert("RGB")))
+
+
+def test_decoded_bytes_are_estimated_from_the_header():
+    for data, max_side in [(encode(Image.new("RGB", (2048, 1536)), "JPEG"), 700),
+                           (encode(Image.new("RGB", (2050, 1001)), "JPEG"), 120),
+                           (encode(Image.new("RGBA", (300, 200)), "PNG"), 100)]:
+        stream = io.BytesIO(data)
+        stream.seek(3)
+        estimate = estimate_decoded_bytes(stream, max_side=max_side)
+        assert stream.tell() == 3
+        assert estimate == 2 * decode_image(data, max_side=max_side).pixels.nbytes
+
+    with pytest.raises(ValueError, match="Image too large"):
+        estimate_decoded_bytes(io.BytesIO(png_header(5000, 5000)), max_pixels=1000)
+    with pytest.raises(ValueError, match="Cannot decode image"):
+        estimate_decoded_bytes(io.BytesIO(b"not an image"))
+
+
+def test_oversized_and_invalid_images_are_rejected_before_decoding():
+    with pytest.raises(ValueError, match="too large"):
+        decode_image(png_header(9000, 5000), max_pixels=40_000_000)
+    with pytest.raises(ValueError, match="too large"):
+        decode_image(png_header(100_000, 100_000))  # over Pillow's own decompression bomb limit
+    with pytest.raises(ValueError, match="Cannot decode"):
+        decode_image(b"not an image")
+
+
+def test_decoded_images_are_passed_through_and_hashed_by_their_bytes():
+    decoded = decode_image(encode(Image.new("RGB", (8, 8)), "JPEG"))
+    assert decode_image(decoded) is decoded
+    assert image_digest(decoded, "rfcn") == image_digest(io.BytesIO(decoded.encoded), "rfcn")
+    assert decode_image(decoded.pixels).pixels is decoded.pixels
+    assert isinstance(decode_image(decoded.pixels), DecodedImage)
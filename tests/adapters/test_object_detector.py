@@ -0,0 +1,217 @@
+import asyncio
+import base64
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+import requests
+
+from counter.adapters.object_detector import object_detector_strategy, FakeObjectDetector
+from counter.adapters.tfs_detector import TFSObjectDetector, TFSGrpcObjectDetector, AsyncTFSGrpcObjectDetector
+from counter.adapters.http_session import TFS_CONNECTIONS, TFS_POOL_HITS
+from counter.adapters.tfs_grpc import (encode_predict_request, decode_predict_request, encode_tensor, decode_tensor,
+                                       encode_predict_response, decode_predict_response)
+from counter.adapters.tfs_status import TFSModelStatus
+from counter.adapters.tfs_rest import uint8_to_json, encode_columnar_request, encode_b64_request
+from counter.adapters.tfs_stub import StubPredictionServer, StubRestServer, canned_rfcn_outputs
+from counter.constants import ModelConstants, TFSProtocolConstants, TFSRestEncodingConstants
+
+
+@pytest.fixture
+def image_path():
+    return Path(__file__).parent.parent.parent / "resources" / "images" / "boy.jpg"
+
+
+@pytest.fixture
+def rest_server():
+    with StubRestServer(num_detections=3) as server:
+        yield server
+
+
+@pytest.fixture
+def stub_server():
+    with StubPredictionServer(num_detections=3) as server:
+        yield server
+
+
+def test_object_detector_strategy():
+    assert isinstance(object_detector_strategy(ModelConstants.FAKE_MODEL_NAME), FakeObjectDetector)
+    assert isinstance(object_detector_strategy(ModelConstants.RFCN_MODEL_NAME, protocol=TFSProtocolConstants.REST),
+                      TFSObjectDetector)
+    assert isinstance(object_detector_strategy(ModelConstants.RFCN_MODEL_NAME, protocol=TFSProtocolConstants.GRPC),
+                      TFSGrpcObjectDetector)
+
+
+@pytest.mark.parametrize("array", [
+    np.arange(24, dtype=np.uint8).reshape((1, 2, 4, 3)),
+    np.linspace(0, 1, 12, dtype=np.float32).reshape((3, 4)),
+    np.array([7], dtype=np.int64),
+])
+def test_tensor_round_trip(array):
+    decoded = decode_tensor(encode_tensor(array))
+    assert decoded.dtype == array.dtype
+    np.testing.assert_array_equal(decoded, array)
+
+
+def test_predict_request_and_response_round_trip():
+    image = np.zeros((1, 5, 7, 3), dtype=np.uint8)
+    model_name, inputs = decode_predict_request(encode_predict_request("rfcn", {"inputs": image}, version=3))
+    assert model_name == "rfcn"
+    assert inputs["inputs"].shape == (1, 5, 7, 3)
+
+    outputs = canned_rfcn_outputs(num_detections=2)
+    decoded = decode_predict_response(encode_predict_response(outputs, "rfcn"))
+    assert decoded.keys() == outputs.keys()
+    np.testing.assert_array_equal(decoded["detection_scores"], outputs["detection_scores"])
+
+
+def test_grpc_detector_predict(stub_server, image_path):
+    detector = TFSGrpcObjectDetector("127.0.0.1", stub_server.port, "rfcn")
+    with open(image_path, "rb") as image:
+        predictions = detector.predict(image)
+    detector.close()
+
+    assert [p.class_name for p in predictions] == ["person", "bottle", "person"]
+    assert predictions[0].score == pytest.approx(0.99)
+
+    model_name, inputs = stub_server.requests[0]
+    assert model_name == "rfcn"
+    assert inputs["inputs"].dtype == np.uint8
+    assert inputs["inputs"].shape[0] == 1 and inputs["inputs"].shape[-1] == 3
+
+
+@pytest.mark.parametrize("shape", [(5,), (2, 3), (4, 5, 3), (1, 7, 9, 3), (2, 0, 3)])
+def test_uint8_to_json(shape):
+    array = np.random.default_rng(0).integers(0, 256, size=shape, dtype=np.uint8)
+    assert json.loads(uint8_to_json(array)) == array.tolist()
+
+
+def test_encode_columnar_request():
+    images = np.arange(2 * 3 * 4 * 3, dtype=np.uint8).reshape((2, 3, 4, 3))
+    assert json.loads(encode_columnar_request(images)) == {"inputs": images.tolist()}
+
+
+def test_encode_b64_request_keeps_jpeg_bytes(image_path):
+    with open(image_path, "rb") as image:
+        payload = json.loads(encode_b64_request([image]))
+        image.seek(0)
+        assert base64.b64decode(payload["instances"][0]["b64"]) == image.read()
+
+
+@pytest.mark.parametrize("encoding", [TFSRestEncodingConstants.INSTANCES, TFSRestEncodingConstants.COLUMNAR,
+                                      TFSRestEncodingConstants.B64])
+def test_rest_detector_predict(rest_server, image_path, encoding):
+    detector = TFSObjectDetector("127.0.0.1", rest_server.port, "rfcn", encoding=encoding)
+    with open(image_path, "rb") as image:
+        predictions = detector.predict(image)
+
+    assert [p.class_name for p in predictions] == ["person", "bottle", "person"]
+    body_format = "inputs" if encoding == TFSRestEncodingConstants.COLUMNAR else "instances"
+    assert rest_server.requests == [("rfcn", body_format, 1)]
+
+
+def test_rest_detector_rejects_unknown_encoding():
+    with pytest.raises(ValueError):
+        TFSObjectDetector("127.0.0.1", 8501, "rfcn", encoding="protobuf")
+
+
+def test_rest_detector_reuses_pooled_connection(rest_server, image_path):
+    detector = TFSObjectDetector("127.0.0.1", rest_server.port, "pooled")
+    for _ in range(3):
+        with open(image_path, "rb") as image:
+            detector.predict(image)
+    detector.close()
+
+    assert TFS_CONNECTIONS.value(model="pooled") == 1
+    assert TFS_POOL_HITS.value(model="pooled") == 2
+
+
+def test_rest_detector_times_out_with_bounded_retries(image_path):
+    with StubRestServer(latency=0.5) as server:
+        detector = TFSObjectDetector("127.0.0.1", server.port, "rfcn", read_timeout=0.05,
+                                     max_retries=1, backoff_factor=0)
+        with open(image_path, "rb") as image, pytest.raises(requests.RequestException):
+            detector.predict(image)
+        deadline = time.monotonic() + 2
+        while len(server.requests) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(server.requests) == 2
+
+
+def test_rest_detector_batches_images_by_shape(rest_server, image_path):
+    detector = TFSObjectDetector("127.0.0.1", rest_server.port, "rfcn")
+    other_path = image_path.parent / "cat.jpg"
+    with open(image_path, "rb") as boy1, open(image_path, "rb") as boy2, open(other_path, "rb") as cat:
+        results = detector.predict_batch([boy1, cat, boy2])
+
+    assert len(results) == 3
+    assert all([p.class_name for p in predictions] == ["person", "bottle", "person"] for predictions in results)
+    assert sorted(batch_size for _, _, batch_size in rest_server.requests) == [1, 2]
+
+
+@pytest.mark.parametrize("encoding", [TFSRestEncodingConstants.COLUMNAR, TFSRestEncodingConstants.B64])
+def test_rest_detector_accepts_decoded_frames(rest_server, encoding):
+    detector = TFSObjectDetector("127.0.0.1", rest_server.port, "rfcn", encoding=encoding)
+    frames = [np.zeros((16, 16, 3), dtype=np.uint8)] * 2
+    assert len(detector.predict_columnar_batch(frames)) == 2
+    body_format = "inputs" if encoding == TFSRestEncodingConstants.COLUMNAR else "instances"
+    assert rest_server.requests == [("rfcn", body_format, 2)]
+
+
+@pytest.mark.parametrize("encoding", [TFSRestEncodingConstants.INSTANCES, TFSRestEncodingConstants.COLUMNAR,
+                                      TFSRestEncodingConstants.B64])
+def test_rest_stub_reads_batch_size_without_parsing(encoding):
+    with StubRestServer(parse_requests=False) as server:
+        detector = TFSObjectDetector("127.0.0.1", server.port, "rfcn", encoding=encoding)
+        assert len(detector.predict_columnar_batch([np.zeros((4, 4, 3), dtype=np.uint8)] * 3)) == 3
+        body_format = "inputs" if encoding == TFSRestEncodingConstants.COLUMNAR else "instances"
+        assert server.requests == [("rfcn", body_format, 3)]
+
+
+def test_grpc_detector_batches_images_by_shape(stub_server, image_path):
+    detector = TFSGrpcObjectDetector("127.0.0.1", stub_server.port, "rfcn")
+    with open(image_path, "rb") as boy1, open(image_path, "rb") as boy2:
+        results = detector.predict_batch([boy1, boy2])
+    detector.close()
+
+    assert len(results) == 2
+    assert [inputs["inputs"].shape[0] for _, inputs in stub_server.requests] == [2]
+
+
+def test_async_grpc_detector_predict(stub_server, image_path):
+    async def predict_concurrently():
+        detector = AsyncTFSGrpcObjectDetector("127.0.0.1", stub_server.port, "rfcn")
+        images = [open(image_path, "rb") for _ in range(4)]
+        try:
+            return await asyncio.gather(*(detector.predict(image) for image in images))
+        finally:
+            await detector.close()
+            for image in images:
+                image.close()
+
+    results = asyncio.run(predict_concurrently())
+    assert [[p.class_name for p in predictions] for predictions in results] == [["person", "bottle", "person"]] * 4
+    assert len(stub_server.requests) == 4
+
+
+def test_rest_detector_pins_model_version(rest_server, image_path):
+    detector = TFSObjectDetector("127.0.0.1", rest_server.port, "rfcn", version=2)
+    assert detector.url.endswith("/v1/models/rfcn/versions/2:predict")
+    assert len(detector.predict_columnar(image_path.open("rb"))) == 3
+
+
+def test_model_status_waits_for_available_version():
+    with StubRestServer(versions=(1, 2)) as server:
+        status = TFSModelStatus("127.0.0.1", server.port, "rfcn")
+        assert status.available_versions() == [2, 1]
+        assert status.wait_until_available(timeout=1) == 2
+        assert status.metadata(1)["model_spec"]["version"] == "1"
+        with pytest.raises(TimeoutError):
+            status.wait_until_available(3, timeout=0.2, interval=0.05)
+
+
+def test_label_map_is_read_independently_of_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert TFSObjectDetector.build_classes_dict()[1] == "person"
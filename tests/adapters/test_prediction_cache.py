@@ -0,0 +1,118 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from counter.adapters.prediction_cache import (CachingObjectDetector, PREDICTION_BATCH_OVERHEAD, CACHE_HITS,
+                                               CACHE_MISSES, CACHE_COALESCED)
+from counter.domain.ports import ObjectDetector
+from tests.domain.helpers import generate_prediction
+
+
+class CountingDetector(ObjectDetector):
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def predict(self, image):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return [generate_prediction(image.getvalue().decode(), 0.9), generate_prediction('dog', 0.2)]
+
+
+def test_same_image_is_served_from_cache():
+    detector = CountingDetector()
+    cache = CachingObjectDetector(detector, "cached")
+
+    first = cache.predict(io.BytesIO(b"cat"))
+    second = cache.predict(io.BytesIO(b"cat"))
+    cache.predict(io.BytesIO(b"bird"))
+
+    assert first == second
+    assert detector.calls == 2
+    assert CACHE_HITS.value(model="cached") == 1
+    assert CACHE_MISSES.value(model="cached") == 2
+
+
+def test_model_name_is_part_of_the_key():
+    detector = CountingDetector()
+    CachingObjectDetector(detector, "model-a").predict(io.BytesIO(b"cat"))
+    CachingObjectDetector(detector, "model-b").predict(io.BytesIO(b"cat"))
+    assert detector.calls == 2
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    detector = CountingDetector(delay=0.1)
+    cache = CachingObjectDetector(detector, "coalesced")
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: cache.predict(io.BytesIO(b"cat")), range(5)))
+
+    assert detector.calls == 1
+    assert all(result == results[0] for result in results)
+    assert CACHE_COALESCED.value(model="coalesced") + CACHE_HITS.value(model="coalesced") == 4
+
+
+def test_lru_eviction_under_byte_budget():
+    detector = CountingDetector()
+    entry_size = PREDICTION_BATCH_OVERHEAD + 2 * (4 * 8 + 8 + 8)  # two detections: box, score and class id
+    cache = CachingObjectDetector(detector, "evicting", max_bytes=2 * entry_size)
+
+    cache.predict(io.BytesIO(b"a"))
+    cache.predict(io.BytesIO(b"b"))
+    cache.predict(io.BytesIO(b"a"))  # "a" becomes the most recently used entry
+    cache.predict(io.BytesIO(b"c"))  # evicts "b"
+    assert detector.calls == 3
+
+    cache.predict(io.BytesIO(b"a"))
+    assert detector.calls == 3
+    cache.predict(io.BytesIO(b"b"))
+    assert detector.calls == 4
+
+
+def test_entries_expire_after_ttl():
+    detector = CountingDetector()
+    cache = CachingObjectDetector(detector, "expiring", ttl=0.05)
+
+    cache.predict(io.BytesIO(b"cat"))
+    time.sleep(0.1)
+    cache.predict(io.BytesIO(b"cat"))
+    assert detector.calls == 2
+
+
+def test_errors_are_not_cached():
+    class FailingDetector(ObjectDetector):
+        def predict(self, image):
+            raise RuntimeError("TFS down")
+
+    cache = CachingObjectDetector(FailingDetector(), "failing")
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.predict(io.BytesIO(b"cat"))
+
+
+def test_batch_sends_only_the_misses_in_one_call():
+    class BatchRecordingDetector(CountingDetector):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def predict_batch(self, images):
+            self.batches.append([image.getvalue() for image in images])
+            return [self.predict(image) for image in images]
+
+    detector = BatchRecordingDetector()
+    cache = CachingObjectDetector(detector, "batched")
+    cache.predict(io.BytesIO(b"cat"))
+
+    results = cache.predict_columnar_batch([io.BytesIO(name) for name in (b"cat", b"dog", b"bird", b"dog")])
+
+    assert detector.batches == [[b"cat"], [b"dog", b"bird"]]
+    assert [result.to_predictions()[0].class_name for result in results] == ["cat", "dog", "bird", "dog"]
+    assert CACHE_HITS.value(model="batched") == 1
+    assert CACHE_MISSES.value(model="batched") == 3
+    assert CACHE_COALESCED.value(model="batched") == 1
@@ -1,7 +1,13 @@
-import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from counter.adapters.helpers import Base, Helpers
+import os
+
+# Keep debug rendering off in tests (it is on by default in dev); must be set before counter is imported
+os.environ.setdefault("DEBUG_SAMPLE_RATE", "0")
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from counter.adapters.helpers import Helpers  # noqa: E402
+from counter.adapters.models import Base  # noqa: E402
 
 
 @pytest.fixture(scope="session")
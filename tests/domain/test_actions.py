@@ -1,9 +1,13 @@
-from unittest.mock import Mock
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, AsyncMock
+
+import numpy as np
 
 import pytest
 
-from counter.domain.actions import CountDetectedObjects
-from counter.domain.models import ObjectCount
+from counter.domain.actions import CountDetectedObjects, AsyncCountDetectedObjects
+from counter.domain.models import ObjectCount, PredictionBatch
 from tests.domain.helpers import generate_prediction
 
 
@@ -11,11 +15,12 @@ class TestCountDetectedObjects:
     @pytest.fixture
     def object_detector(self) -> Mock:
         object_detector = Mock()
-        object_detector.predict.return_value = [generate_prediction('cat', 0.9),
-                                                generate_prediction('cat', 0.8),
-                                                generate_prediction('dog', 0.8),
-                                                generate_prediction('dog', 0.1),
-                                                generate_prediction('rabbit', 0.9)]
+        object_detector.predict_columnar.return_value = PredictionBatch.from_predictions(
+            [generate_prediction('cat', 0.9),
+             generate_prediction('cat', 0.8),
+             generate_prediction('dog', 0.8),
+             generate_prediction('dog', 0.1),
+             generate_prediction('rabbit', 0.9)])
         return object_detector
 
     @pytest.fixture
@@ -31,3 +36,98 @@ class TestCountDetectedObjects:
         CountDetectedObjects(object_detector, count_object_repo).execute(None, 0)
         count_object_repo.update_values.assert_called_with(
             [ObjectCount('cat', 2), ObjectCount('dog', 2), ObjectCount('rabbit', 1)])
+
+    def test_return_total_updates_and_reads_in_one_call(self, object_detector, count_object_repo):
+        count_object_repo.update_and_read_values.return_value = [ObjectCount('cat', 7)]
+        response = CountDetectedObjects(object_detector, count_object_repo).execute(None, 0.85, return_total=True)
+        assert response.total_objects == [ObjectCount('cat', 7)]
+        count_object_repo.update_and_read_values.assert_called_once_with([ObjectCount('cat', 1),
+                                                                          ObjectCount('rabbit', 1)])
+        count_object_repo.update_values.assert_not_called()
+        count_object_repo.read_values.assert_not_called()
+
+
+class TestCountDetectedObjectsBatch:
+    @pytest.fixture
+    def object_detector(self) -> Mock:
+        def predict_columnar_batch(images):
+            if "bad" in images:
+                raise ValueError("cannot identify image file")
+            return [PredictionBatch.from_predictions([generate_prediction(image, 0.9), generate_prediction('cat', 0.8)])
+                    for image in images]
+
+        object_detector = Mock()
+        object_detector.predict_columnar_batch.side_effect = predict_columnar_batch
+        return object_detector
+
+    @pytest.mark.parametrize("executor", [None, ThreadPoolExecutor(max_workers=2)])
+    def test_results_per_image_and_one_repo_write(self, object_detector, executor):
+        count_object_repo = Mock()
+        count_object_repo.update_and_read_values.return_value = [ObjectCount('cat', 42)]
+        action = CountDetectedObjects(object_detector, count_object_repo, executor=executor)
+
+        results = list(action.execute_batch(['dog', 'bad', 'cat', 'rabbit'], 0.5, return_total=True, batch_size=2))
+
+        items = dict(results[:-1])
+        assert sorted(items) == [0, 1, 2, 3]
+        assert items[0].current_objects == [ObjectCount('dog', 1), ObjectCount('cat', 1)]
+        assert items[2].current_objects == [ObjectCount('cat', 2)]
+        assert isinstance(items[1], ValueError)
+        summary_index, summary = results[-1]
+        assert summary_index is None
+        assert sorted(summary.current_objects, key=lambda x: x.object_class) == \
+            [ObjectCount('cat', 4), ObjectCount('dog', 1), ObjectCount('rabbit', 1)]
+        assert summary.total_objects == [ObjectCount('cat', 42)]
+        count_object_repo.update_and_read_values.assert_called_once()
+        count_object_repo.update_values.assert_not_called()
+
+    def test_counts_are_written_when_the_caller_stops_early(self, object_detector):
+        count_object_repo = Mock()
+        results = CountDetectedObjects(object_detector, count_object_repo).execute_batch(['dog', 'cat'], 0.5)
+        next(results)
+        results.close()
+        count_object_repo.update_values.assert_called_once_with([ObjectCount('dog', 1), ObjectCount('cat', 1)])
+
+
+class TestCountDetectedObjectsFrames:
+    def test_only_changed_frames_are_inferred_and_peaks_are_stored(self):
+        object_detector = Mock()
+        object_detector.predict_columnar_batch.side_effect = lambda frames: [
+            PredictionBatch.from_predictions([generate_prediction('cat', 0.9)] * (1 + int(frame[0, 0, 0] > 100)))
+            for frame in frames]
+        count_object_repo = Mock()
+        frames = [np.full((32, 32, 3), value, dtype=np.uint8) for value in [10, 10, 10, 200, 200, 200]]
+
+        response = CountDetectedObjects(object_detector, count_object_repo).execute_frames(
+            frames, 0.5, difference_threshold=0.02, max_gap=30, batch_size=1)
+
+        assert response.inferred_frames == 2
+        assert object_detector.predict_columnar_batch.call_count == 2
+        assert [(f.frame, f.source_frame) for f in response.frames] == [(0, 0), (1, 0), (2, 0), (3, 3), (4, 3), (5, 3)]
+        assert response.frames[4].current_objects == [ObjectCount('cat', 2)]
+        assert len(response.objects) == 1
+        assert (response.objects[0].max, response.objects[0].mean) == (2, 1.5)
+        count_object_repo.update_values.assert_called_once_with([ObjectCount('cat', 2)])
+
+
+class TestAsyncCountDetectedObjects:
+    @pytest.fixture
+    def object_detector(self) -> AsyncMock:
+        object_detector = AsyncMock()
+        object_detector.predict_columnar.return_value = PredictionBatch.from_predictions(
+            [generate_prediction('cat', 0.9), generate_prediction('dog', 0.1)])
+        return object_detector
+
+    @pytest.fixture
+    def count_object_repo(self) -> AsyncMock:
+        count_object_repo = AsyncMock()
+        count_object_repo.update_and_read_values.return_value = [ObjectCount('cat', 10)]
+        return count_object_repo
+
+    def test_count_valid_predictions(self, object_detector, count_object_repo) -> None:
+        action = AsyncCountDetectedObjects(object_detector, count_object_repo)
+        response = asyncio.run(action.execute(None, 0.5, return_total=True))
+        assert response.current_objects == [ObjectCount('cat', 1)]
+        assert response.total_objects == [ObjectCount('cat', 10)]
+        count_object_repo.update_and_read_values.assert_awaited_once_with([ObjectCount('cat', 1)])
+        count_object_repo.read_values.assert_not_awaited()
@@ -0,0 +1,27 @@
+import numpy as np
+
+from counter.domain.frames import aggregate_counts, select_frames
+from counter.domain.models import ObjectCount, ObjectCountStats
+
+
+def frame(value, size=64):
+    return np.full((size, size, 3), value, dtype=np.uint8)
+
+
+def test_static_frames_are_skipped_until_the_scene_changes():
+    frames = [frame(10)] * 5 + [frame(200)] * 5
+    assert select_frames(frames, difference_threshold=0.02, max_gap=100) == [0, 5]
+
+
+def test_max_gap_forces_inference_on_a_static_scene():
+    assert select_frames([frame(10)] * 7, difference_threshold=0.02, max_gap=3) == [0, 3, 6]
+
+
+def test_slow_drift_is_measured_against_the_last_inferred_frame():
+    frames = [frame(value) for value in range(0, 40, 2)]  # 2/255 per frame, below the threshold
+    assert select_frames(frames, difference_threshold=0.02, max_gap=100) == [0, 3, 6, 9, 12, 15, 18]
+
+
+def test_aggregate_counts():
+    stats = aggregate_counts([[ObjectCount('cat', 2)], [ObjectCount('cat', 1), ObjectCount('dog', 3)], []])
+    assert stats == [ObjectCountStats('cat', 2, 1.0), ObjectCountStats('dog', 3, 1.0)]
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+import pytest
+
+from counter.constants import GranularityConstants
+from counter.domain.actions import ReadCountHistory
+from counter.domain.history import aggregate_buckets, bucket_totals, ceil_time, coarsest_granularity, floor_time
+from counter.domain.models import CountBucket, ObjectCount
+
+MOMENT = datetime(2026, 3, 2, 13, 45, 30, tzinfo=timezone.utc)
+DAY = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+
+def test_floor_and_ceil_time():
+    assert floor_time(MOMENT, GranularityConstants.MINUTE) == MOMENT.replace(second=0)
+    assert floor_time(MOMENT, GranularityConstants.HOUR) == MOMENT.replace(minute=0, second=0)
+    assert floor_time(MOMENT, GranularityConstants.DAY) == DAY
+    assert ceil_time(MOMENT, GranularityConstants.HOUR) == DAY + timedelta(hours=14)
+    assert ceil_time(DAY, GranularityConstants.DAY) == DAY
+    # Days start at midnight UTC whatever the offset of the moment
+    assert floor_time(MOMENT.astimezone(timezone(timedelta(hours=-5))), GranularityConstants.DAY) == DAY
+
+
+def test_coarsest_granularity():
+    assert coarsest_granularity(DAY, DAY + timedelta(days=1)) == GranularityConstants.DAY
+    assert coarsest_granularity(DAY, DAY + timedelta(hours=5)) == GranularityConstants.HOUR
+    assert coarsest_granularity(DAY, MOMENT) == GranularityConstants.MINUTE
+
+
+def test_aggregate_buckets_and_totals():
+    buckets = [CountBucket(DAY + timedelta(minutes=61), "cup", 1), CountBucket(DAY, "bottle", 2),
+               CountBucket(DAY + timedelta(minutes=59), "bottle", 3), CountBucket(DAY + timedelta(hours=1), "cup", 4)]
+    assert aggregate_buckets(buckets, GranularityConstants.HOUR) == [
+        CountBucket(DAY, "bottle", 5), CountBucket(DAY + timedelta(hours=1), "cup", 5)]
+    assert bucket_totals(buckets) == [ObjectCount("bottle", 5), ObjectCount("cup", 5)]
+
+
+class TestReadCountHistory:
+    @pytest.fixture
+    def history_repo(self) -> Mock:
+        history_repo = Mock()
+        history_repo.read_buckets.return_value = [CountBucket(DAY, "bottle", 2),
+                                                  CountBucket(DAY + timedelta(hours=1), "bottle", 3)]
+        return history_repo
+
+    def test_picks_the_coarsest_granularity(self, history_repo):
+        response = ReadCountHistory(history_repo).execute(DAY, DAY + timedelta(hours=2))
+        assert response.granularity == GranularityConstants.HOUR
+        history_repo.read_buckets.assert_called_once_with(GranularityConstants.HOUR, DAY, DAY + timedelta(hours=2),
+                                                          None)
+        assert response.totals == [ObjectCount("bottle", 5)]
+
+    def test_widens_the_range_to_whole_buckets(self, history_repo):
+        response = ReadCountHistory(history_repo).execute(MOMENT, MOMENT + timedelta(minutes=1),
+                                                          GranularityConstants.DAY, ["bottle"])
+        assert (response.start, response.end) == (DAY, DAY + timedelta(days=1))
+        history_repo.read_buckets.assert_called_once_with(GranularityConstants.DAY, DAY, DAY + timedelta(days=1),
+                                                          ["bottle"])
+
+    def test_rejects_too_many_buckets(self, history_repo):
+        with pytest.raises(ValueError, match="1440 minute buckets"):
+            ReadCountHistory(history_repo, max_buckets=1000).execute(DAY, DAY + timedelta(days=1),
+                                                                     GranularityConstants.MINUTE)
+        history_repo.read_buckets.assert_not_called()
@@ -1,5 +1,7 @@
-from counter.domain.models import ObjectCount
-from counter.domain.predictions import over_threshold, count
+import numpy as np
+
+from counter.domain.models import ObjectCount, PredictionBatch
+from counter.domain.predictions import over_threshold, count, batch_over_threshold, batch_count
 from tests.domain.helpers import generate_prediction
 
 
@@ -18,3 +20,26 @@ def test_count_predictions_by_class() -> None:
     object_counts = count(predictions)
     assert sorted(object_counts, key=lambda x: x.object_class) == \
         [ObjectCount(object_class='cat', count=2), ObjectCount(object_class='dog', count=1)]
+
+
+def test_batch_over_threshold_with_mask_and_sorted_scores() -> None:
+    predictions = [generate_prediction('dog', 0.9),
+                   generate_prediction('cat', 0.8),
+                   generate_prediction('cat', 0.91)]
+    batch = PredictionBatch.from_predictions(predictions)
+    assert batch_over_threshold(batch, 0.9).to_predictions() == list(over_threshold(predictions, 0.9))
+
+    sorted_batch = PredictionBatch(boxes=np.zeros((4, 4)), scores=np.array([0.95, 0.9, 0.9, 0.2]),
+                                   class_ids=np.array([2, 1, 2, 1]), class_names=np.array([None, 'cat', 'dog']),
+                                   scores_sorted=True)
+    assert len(batch_over_threshold(sorted_batch, 0.9)) == 3
+    assert len(batch_over_threshold(sorted_batch, 0.96)) == 0
+    assert len(batch_over_threshold(sorted_batch, 0.0)) == 4
+
+
+def test_batch_count_matches_count() -> None:
+    predictions = [generate_prediction('cat'),
+                   generate_prediction('cat'),
+                   generate_prediction('dog')]
+    assert batch_count(PredictionBatch.from_predictions(predictions)) == count(predictions)
+    assert batch_count(PredictionBatch.from_predictions([])) == []
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from counter.constants import AdmissionRejectionConstants
+from counter.entrypoints.admission import ADMISSION_IN_FLIGHT, ADMISSION_MEMORY_BYTES, ADMISSION_REJECTED, \
+    ADMISSION_WAITING, AdmissionController, AdmissionRejectedError, AsyncAdmissionController, queued_at
+
+MB = 1024 * 1024
+
+
+def test_requests_within_budget_are_admitted_together():
+    admission = AdmissionController(memory_budget=10 * MB, max_in_flight=2, max_waiting=0)
+    with admission.admit(4 * MB), admission.admit(6 * MB):
+        assert ADMISSION_MEMORY_BYTES.value() == 10 * MB
+        assert ADMISSION_IN_FLIGHT.value() == 2
+        # Over the memory budget, then over the slots, with no room to wait
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            with admission.admit(1):
+                pass  # pragma: no cover
+        assert rejected.value.reason == AdmissionRejectionConstants.QUEUE_FULL
+    assert ADMISSION_MEMORY_BYTES.value() == 0
+    assert ADMISSION_IN_FLIGHT.value() == 0
+
+
+def test_request_larger_than_the_budget_is_admitted_alone():
+    admission = AdmissionController(memory_budget=10 * MB, max_in_flight=4, max_waiting=0)
+    with admission.admit(50 * MB):
+        with pytest.raises(AdmissionRejectedError):
+            with admission.admit(1 * MB):
+                pass  # pragma: no cover
+
+
+def test_waiting_request_is_admitted_when_memory_is_released():
+    admission = AdmissionController(memory_budget=10 * MB, max_in_flight=4, max_waiting=1, queue_timeout=5)
+    first = admission.admit(8 * MB)
+    first.__enter__()
+    admitted = threading.Event()
+
+    def second():
+        with admission.admit(8 * MB):
+            admitted.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while ADMISSION_WAITING.value() != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not admitted.is_set()
+    first.__exit__(None, None, None)
+    thread.join(timeout=5)
+    assert admitted.is_set()
+    assert ADMISSION_WAITING.value() == 0
+
+
+def test_waiting_request_times_out():
+    admission = AdmissionController(memory_budget=10 * MB, max_in_flight=1, max_waiting=1, queue_timeout=0.05,
+                                    retry_after=3)
+    timeouts = ADMISSION_REJECTED.value(reason=AdmissionRejectionConstants.TIMEOUT)
+    with admission.admit(1 * MB):
+        with pytest.raises(AdmissionRejectedError) as rejected:
+            with admission.admit(1 * MB):
+                pass  # pragma: no cover
+    assert rejected.value.reason == AdmissionRejectionConstants.TIMEOUT
+    assert rejected.value.retry_after == 3
+    assert ADMISSION_REJECTED.value(reason=AdmissionRejectionConstants.TIMEOUT) == timeouts + 1
+
+
+def test_request_queued_past_the_deadline_is_dropped():
+    admission = AdmissionController(memory_budget=10 * MB, max_in_flight=1, queue_timeout=1)
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        with admission.admit(1 * MB, queued_since=time.monotonic() - 2):
+            pass  # pragma: no cover
+    assert rejected.value.reason == AdmissionRejectionConstants.DEADLINE
+    with admission.admit(1 * MB, queued_since=time.monotonic() - 0.5):
+        pass
+
+
+def test_async_waiting_request_is_admitted_when_memory_is_released():
+    async def _run():
+        admission = AsyncAdmissionController(memory_budget=10 * MB, max_in_flight=4, max_waiting=1, queue_timeout=5)
+        admitted = asyncio.Event()
+
+        async def second():
+            async with admission.admit(8 * MB):
+                admitted.set()
+
+        async with admission.admit(8 * MB):
+            waiting = asyncio.create_task(second())
+            while ADMISSION_WAITING.value() != 1:
+                await asyncio.sleep(0.01)
+            assert not admitted.is_set()
+            # No room left to wait
+            with pytest.raises(AdmissionRejectedError) as rejected:
+                async with admission.admit(8 * MB):
+                    pass  # pragma: no cover
+            assert rejected.value.reason == AdmissionRejectionConstants.QUEUE_FULL
+        await asyncio.wait_for(waiting, 5)
+        assert admitted.is_set()
+
+    asyncio.run(_run())
+    assert ADMISSION_WAITING.value() == 0
+    assert ADMISSION_IN_FLIGHT.value() == 0
+
+
+def test_async_waiting_request_times_out():
+    async def _run():
+        admission = AsyncAdmissionController(memory_budget=10 * MB, max_in_flight=1, queue_timeout=0.05)
+        async with admission.admit(1 * MB):
+            with pytest.raises(AdmissionRejectedError) as rejected:
+                async with admission.admit(1 * MB):
+                    pass  # pragma: no cover
+        assert rejected.value.reason == AdmissionRejectionConstants.TIMEOUT
+
+    asyncio.run(_run())
+
+
+@pytest.mark.parametrize("header", ["t={:.3f}", "{:.3f}", "{:.0f}000", "{:.0f}000000"])
+def test_queued_at_parses_request_start_headers(header):
+    wall = time.time() - 2
+    queued = queued_at(header.format(wall))
+    assert time.monotonic() - queued == pytest.approx(2, abs=1.01)
+
+
+def test_queued_at_ignores_missing_bad_and_future_headers():
+    assert queued_at(None) is None
+    assert queued_at("t=soon") is None
+    assert queued_at("t=nan") is None
+    assert queued_at(f"t={time.time() + 60:.3f}") <= time.monotonic()
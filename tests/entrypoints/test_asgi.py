@@ -0,0 +1,130 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from quart.datastructures import FileStorage
+
+from counter.adapters.count_repo import CountInMemoryRepo
+from counter.adapters.object_detector import FakeObjectDetector
+from counter.config import get_async_count_action
+from counter.constants import Constants
+from counter.domain.actions import CountDetectedObjects
+from counter.entrypoints.asgi import create_app
+from counter.registry import ModelRegistry
+
+
+@pytest.fixture
+def image_bytes():
+    image_path = Path(__file__).parent.parent.parent / "resources" / "images" / "boy.jpg"
+    return image_path.read_bytes()
+
+
+def post(form, image_bytes=None, headers=None):
+    async def _post():
+        app = create_app()
+        files = {'file': FileStorage(stream=io.BytesIO(image_bytes), filename='test.jpg',
+                                     content_type='image/jpeg')} if image_bytes else None
+        response = await app.test_client().post('/v1/object-count', form=form, files=files, headers=headers)
+        return response.status_code, response.headers, json.loads(await response.get_data())
+
+    return asyncio.run(_post())
+
+
+def test_object_detection(image_bytes):
+    status, _, body = post({'threshold': '0.9', 'model_name': 'fake', 'return_total': 'true'}, image_bytes)
+    assert status == HTTPStatus.OK
+    assert body['current_objects'] == [{'object_class': 'cat', 'count': 1}]
+    assert body['total_objects'][0]['object_class'] == 'cat'
+
+
+def test_object_detection_validation_error(image_bytes):
+    status, _, body = post({'threshold': '1.9', 'model_name': 'rfcn'}, image_bytes)
+    assert status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert body
+
+
+def test_object_detection_value_error():
+    status, _, body = post({'threshold': '0.5'})
+    assert status == HTTPStatus.BAD_REQUEST
+    assert body
+
+
+def test_object_detection_queued_past_the_deadline_gets_429(image_bytes):
+    status, headers, body = post({'model_name': 'fake'}, image_bytes,
+                                 headers={'X-Request-Start': f't={time.time() - 60:.3f}'})
+    assert status == HTTPStatus.TOO_MANY_REQUESTS
+    assert headers['Retry-After'] == '1'
+    assert body['error']
+
+
+def test_concurrent_requests_share_one_loop(image_bytes, monkeypatch):
+    # Every request waits for an inference slot instead of being turned away
+    monkeypatch.setattr(Constants, 'ADMISSION_MAX_WAITING', 20)
+
+    async def _run():
+        client = create_app().test_client()
+
+        async def one():
+            files = {'file': FileStorage(stream=io.BytesIO(image_bytes), filename='test.jpg',
+                                         content_type='image/jpeg')}
+            response = await client.post('/v1/object-count', form={'model_name': 'fake'}, files=files)
+            return response.status_code
+
+        return await asyncio.gather(*(one() for _ in range(20)))
+
+    assert asyncio.run(_run()) == [HTTPStatus.OK] * 20
+
+
+def test_async_action_runs_the_registry_action_and_is_closed_after_serving(image_bytes, mocker):
+    close_count_actions = mocker.patch("counter.config.close_count_actions")
+
+    async def _run():
+        app = create_app()
+        async with app.test_app() as test_app:
+            action = await get_async_count_action("fake")
+            assert await get_async_count_action("fake") is action
+            files = {'file': FileStorage(stream=io.BytesIO(image_bytes), filename='test.jpg',
+                                         content_type='image/jpeg')}
+            response = await test_app.test_client().post('/v1/object-count', form={'model_name': 'fake'},
+                                                         files=files)
+            assert response.status_code == HTTPStatus.OK
+            close_count_actions.assert_not_called()
+        close_count_actions.assert_called_once()
+
+    asyncio.run(_run())
+
+
+def test_building_an_action_does_not_block_the_event_loop(mocker):
+    resolving, release = threading.Event(), threading.Event()
+
+    def resolve_version(model_name):
+        resolving.set()
+        release.wait(5)
+        return 1
+
+    registry = ModelRegistry(lambda model_name, version: CountDetectedObjects(FakeObjectDetector(),
+                                                                                CountInMemoryRepo()),
+                             resolve_version, [])
+    mocker.patch("counter.config.get_model_registry", return_value=registry)
+    assert registry.built("slow") is None
+
+    async def _run():
+        building = asyncio.create_task(get_async_count_action("slow"))
+        while not resolving.is_set():
+            await asyncio.sleep(0.01)
+        # The loop still runs other coroutines while the action is built
+        await asyncio.sleep(0.01)
+        assert not building.done()
+        release.set()
+        await asyncio.wait_for(building, 5)
+
+    try:
+        asyncio.run(_run())
+    finally:
+        release.set()
+    assert registry.built("slow") is not None
@@ -0,0 +1,16 @@
+import pytest
+from flask import jsonify
+
+from counter.domain.models import CountResponse, ObjectCount
+from counter.entrypoints.responses import count_response_json
+from counter.entrypoints.webapp import create_app
+
+
+@pytest.mark.parametrize("total_objects", [None, [ObjectCount("cat", 10), ObjectCount("wine glass", 2)]])
+def test_count_response_json_matches_jsonify(total_objects):
+    count_response = CountResponse.model_construct(current_objects=[ObjectCount("cat", 1), ObjectCount("café", 3)],
+                                                   total_objects=total_objects)
+    with create_app().app_context():
+        expected = jsonify(CountResponse(current_objects=count_response.current_objects,
+                                         total_objects=total_objects).model_dump(exclude_none=True)).get_data(True)
+    assert count_response_json(count_response) == expected
@@ -0,0 +1,114 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+import requests
+
+from counter.entrypoints.server import check_admission_limits, cpu_count, rss_bytes
+
+ROOT = Path(__file__).parent.parent.parent
+IMAGE_PATH = ROOT / "resources" / "images" / "boy.jpg"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    port = _free_port()
+    env = {**os.environ, "ENV": "dev", "DEV_COUNT_REPO": "shared_memory", "SERVER_HOST": "127.0.0.1",
+           "SERVER_PORT": str(port), "SERVER_WORKERS": "2", "SERVER_THREADS": "2", "SERVER_MAX_REQUESTS": "3",
+           "SERVER_MAX_REQUESTS_JITTER": "0", "SERVER_GRACEFUL_TIMEOUT": "5", "SERVER_METRICS_INTERVAL": "0.1",
+           "LOG_FORMAT": "json"}
+    process = subprocess.Popen([sys.executable, "-m", "counter.entrypoints.server"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            if requests.get(f"{url}/ready", timeout=1).status_code == HTTPStatus.OK:
+                break
+        except requests.ConnectionError:
+            pass
+        assert process.poll() is None and time.monotonic() < deadline, "server did not get ready"
+        time.sleep(0.1)
+    yield process, url
+    if process.poll() is None:  # pragma: no cover
+        process.kill()
+        process.wait()
+
+
+def _post_image(url):
+    with open(IMAGE_PATH, "rb") as image:
+        return requests.post(f"{url}/v1/object-count", files={"file": ("boy.jpg", image, "image/jpeg")},
+                             data={"model_name": "fake", "return_total": "true"}, timeout=10)
+
+
+def _requests_counted(url):
+    for line in requests.get(f"{url}/metrics", timeout=10).text.splitlines():
+        if line.startswith('counter_stage_duration_seconds_count{stage="upload_read"}'):
+            return int(line.split()[-1])
+    return 0
+
+
+def test_workers_serve_requests_are_recycled_and_drain_on_sigterm(server):
+    process, url = server
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda _: _post_image(url), range(12)))
+    process.send_signal(signal.SIGTERM)
+    _, stderr = process.communicate(timeout=20)
+
+    assert [response.status_code for response in responses] == [HTTPStatus.OK] * 12
+    # Every worker shares the totals of the pre-fork shared memory repository
+    assert max(response.json()["total_objects"][0]["count"] for response in responses) == 12
+    events = [json.loads(line) for line in stderr.splitlines() if line.startswith("{")]
+    started = [event for event in events if event["message"] == "worker started"]
+    # 2 workers recycled after 3 requests (plus the ones still in flight on their second thread)
+    assert len(started) >= 3
+    assert any(event["message"] == "worker draining" and event["reason"] == "max_requests" for event in events)
+    assert any(event["message"] == "worker draining" and event["reason"] == "sigterm" for event in events)
+    assert process.returncode == 0
+
+
+def test_metrics_cover_every_worker(server):
+    process, url = server
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda _: _post_image(url), range(8)))
+    assert [response.status_code for response in responses] == [HTTPStatus.OK] * 8
+    # Whichever worker answers, /metrics counts the requests of every worker, recycled ones included
+    deadline = time.monotonic() + 5
+    counted = _requests_counted(url)
+    while counted != 8 and time.monotonic() < deadline:
+        time.sleep(0.1)
+        counted = _requests_counted(url)
+    assert counted == 8
+    process.send_signal(signal.SIGTERM)
+    process.communicate(timeout=20)
+
+
+def test_worker_sizing_helpers():
+    assert cpu_count() >= 1
+    assert rss_bytes() > 0
+
+
+def test_admission_limits_are_checked_against_the_worker_threads(monkeypatch):
+    monkeypatch.setattr("counter.constants.Constants.ADMISSION_MAX_IN_FLIGHT", 4)
+    monkeypatch.setattr("counter.constants.Constants.ADMISSION_MAX_WAITING", 4)
+    assert check_admission_limits(8) == []
+
+    monkeypatch.setattr("counter.constants.Constants.ADMISSION_MAX_IN_FLIGHT", 16)
+    monkeypatch.setattr("counter.constants.Constants.ADMISSION_MAX_WAITING", 32)
+    assert len(check_admission_limits(8)) == 2
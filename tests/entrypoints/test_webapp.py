@@ -1,11 +1,21 @@
 import io
 import json
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
 from pathlib import Path
 
 import pytest
+from PIL import Image
 
+from counter.adapters.count_history import CountHistoryPostgresRepo
+from counter.adapters.postgres_repo import CountPostgresRepo
+from counter.config import get_model_registry
+from counter.domain.actions import ReadCountHistory
+from counter.domain.models import ObjectCount
 from counter.entrypoints.webapp import create_app
+from tests.helpers import png_header
 
 
 @pytest.fixture
@@ -66,3 +76,177 @@ def test_object_detection_value_error1(client):
                            content_type='multipart/form-data', buffered=True)
     assert response.status_code == HTTPStatus.BAD_REQUEST
     assert json.loads(response.data)
+
+
+def test_object_detection_rejects_oversized_image(client):
+    data = {'model_name': 'fake', 'file': (io.BytesIO(png_header(9000, 5000)), 'huge.png', 'image/png')}
+    response = client.post('/v1/object-count', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert 'too large' in json.loads(response.data)['error']
+
+
+def test_batch_object_detection_streams_ndjson(client, image_path):
+    data = {'threshold': '0.5', 'model_name': 'fake', 'return_total': 'true',
+            'files': [(io.BytesIO(image_path.read_bytes()), 'a.jpg'),
+                      (io.BytesIO(b'not an image'), 'notes.txt'),
+                      (io.BytesIO(image_path.read_bytes()), 'b.jpg')]}
+    response = client.post('/v1/object-count/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.OK
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    items = {line['index']: line for line in lines[:-1]}
+    assert sorted(items) == [0, 1, 2]
+    assert items[0] == {'index': 0, 'filename': 'a.jpg', 'current_objects': [{'object_class': 'cat', 'count': 1}]}
+    assert items[1]['filename'] == 'notes.txt' and 'error' in items[1]
+    summary = lines[-1]['summary']
+    assert summary['current_objects'] == [{'object_class': 'cat', 'count': 2}]
+    assert summary['images'] == 3 and summary['errors'] == 1
+    assert summary['total_objects']
+
+
+def test_batch_object_detection_accepts_zip(client, image_path):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('shelf/1.jpg', image_path.read_bytes())
+        zip_file.writestr('shelf/2.png', image_path.read_bytes())
+    archive.seek(0)
+    data = {'model_name': 'fake', 'files': (archive, 'visit.zip', 'application/zip')}
+    response = client.post('/v1/object-count/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.OK
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert sorted(line['filename'] for line in lines[:-1]) == ['shelf/1.jpg', 'shelf/2.png']
+    assert lines[-1]['summary']['current_objects'] == [{'object_class': 'cat', 'count': 2}]
+
+
+def test_batch_object_detection_errors(client, image_path, monkeypatch):
+    response = client.post('/v1/object-count/batch', data={'model_name': 'fake'}, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    data = {'threshold': '1.9', 'files': (io.BytesIO(image_path.read_bytes()), 'a.jpg')}
+    response = client.post('/v1/object-count/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    monkeypatch.setattr("counter.constants.Constants.MAX_BATCH_IMAGES", 1)
+    data = {'files': [(io.BytesIO(image_path.read_bytes()), 'a.jpg'), (io.BytesIO(image_path.read_bytes()), 'b.jpg')]}
+    response = client.post('/v1/object-count/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_batch_object_detection_checks_all_archives_before_inflating(client, monkeypatch, mocker):
+    def archive(*names):
+        content = io.BytesIO()
+        with zipfile.ZipFile(content, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for name in names:
+                zip_file.writestr(name, bytes(60_000))
+        content.seek(0)
+        return content
+
+    inflate = mocker.spy(zipfile.ZipFile, 'read')
+    monkeypatch.setattr("counter.constants.Constants.MAX_BATCH_IMAGES", 3)
+    data = {'files': [(archive('1.jpg', '2.jpg'), 'a.zip', 'application/zip'),
+                      (archive('3.jpg', '4.jpg'), 'b.zip', 'application/zip')]}
+    response = client.post('/v1/object-count/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    monkeypatch.setattr("counter.constants.Constants.MAX_BATCH_CONTENT_LENGTH", 100_000)
+    data = {'files': [(archive('1.jpg'), 'a.zip', 'application/zip'), (archive('2.jpg'), 'b.zip', 'application/zip')]}
+    response = client.post('/v1/object-count/batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert 'bytes' in json.loads(response.data)['error']
+    inflate.assert_not_called()
+
+
+def test_frames_object_detection(client):
+    # Near-static scene (identical frames would be merged by the GIF encoder), then a scene change
+    frames = [Image.new('RGB', (64, 64), (10 + i, 10, 10)) for i in range(4)] + \
+             [Image.new('RGB', (64, 64), (200 + i, 50, 50)) for i in range(4)]
+    animation = io.BytesIO()
+    frames[0].save(animation, 'GIF', save_all=True, append_images=frames[1:], duration=100)
+    animation.seek(0)
+    data = {'model_name': 'fake', 'return_total': 'true', 'file': (animation, 'clip.gif', 'image/gif')}
+    response = client.post('/v1/object-count/frames', data=data, content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.OK
+    body = json.loads(response.data)
+    assert len(body['frames']) == 8
+    assert body['inferred_frames'] == 2
+    assert body['objects'] == [{'object_class': 'cat', 'max': 1, 'mean': 1.0}]
+    assert body['total_objects']
+
+
+def test_frames_object_detection_too_many_frames(client, image_data, monkeypatch):
+    monkeypatch.setattr("counter.constants.Constants.MAX_FRAMES", 0)
+    response = client.post('/v1/object-count/frames', data={'model_name': 'fake', 'file': (image_data, 'a.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_frames_object_detection_too_large_decoded(client, image_data, monkeypatch):
+    monkeypatch.setattr("counter.constants.Constants.MAX_FRAMES_DECODED_BYTES", 1024)
+    response = client.post('/v1/object-count/frames', data={'model_name': 'fake', 'file': (image_data, 'a.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert 'Decoded frames too large' in json.loads(response.data)['error']
+
+
+def test_metrics_endpoint(client, image_data):
+    client.post('/v1/object-count', data={'model_name': 'fake', 'file': (image_data, 'test.jpg')},
+                content_type='multipart/form-data')
+    client.post('/v1/object-count', data={'model_name': 'fake'}, content_type='multipart/form-data')
+
+    response = client.get('/metrics')
+    assert response.status_code == HTTPStatus.OK
+    assert response.content_type.startswith('text/plain')
+    text = response.data.decode()
+    for stage in ('upload_read', 'decode', 'threshold', 'repo_write'):
+        assert f'counter_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'counter_requests_in_flight{model="fake"} 0' in text
+    assert 'counter_request_errors_total{model="unknown",status="400"}' in text
+
+
+def test_ready_endpoint(client):
+    assert get_model_registry().wait(5)
+
+    response = client.get('/ready')
+    assert response.status_code == HTTPStatus.OK
+    assert response.get_json()['status'] == 'ready'
+    assert response.get_json()['models']['rfcn']['ready']
+
+
+def test_count_history_needs_a_postgres_repo(client):
+    response = client.get('/v1/object-count/history?start=2026-03-02&end=2026-03-03')
+    assert response.status_code == HTTPStatus.NOT_IMPLEMENTED
+
+
+def test_count_history(client, monkeypatch):
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    CountPostgresRepo("user", "pwd", "localhost", "5432", "db", history=True).update_values(
+        [ObjectCount("history-bottle", 3)])
+    history_repo = CountHistoryPostgresRepo("user", "pwd", "localhost", "5432", "db")
+    monkeypatch.setattr("counter.entrypoints.webapp.get_count_history_action", lambda: ReadCountHistory(history_repo))
+
+    response = client.get('/v1/object-count/history', query_string={
+        'start': start.isoformat(), 'end': (start.replace(tzinfo=None) + timedelta(hours=1)).isoformat(),
+        'object_class': 'history-bottle'})
+    assert response.status_code == HTTPStatus.OK
+    body = json.loads(response.data)
+    assert body['granularity'] == 'hour'
+    assert body['buckets'] == [{'bucket_start': start.isoformat().replace('+00:00', 'Z'),
+                                'object_class': 'history-bottle', 'count': 3}]
+    assert body['totals'] == [{'object_class': 'history-bottle', 'count': 3}]
+
+    response = client.get('/v1/object-count/history', query_string={
+        'start': start.isoformat(), 'end': start.isoformat()})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    response = client.get('/v1/object-count/history', query_string={
+        'start': '2020-01-01', 'end': '2026-01-01', 'granularity': 'minute'})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_object_detection_queued_past_the_deadline_gets_429(client, image_data):
+    data = {'model_name': 'fake', 'file': (image_data, 'test.jpg')}
+    response = client.post('/v1/object-count', data=data, content_type='multipart/form-data', buffered=True,
+                           headers={'X-Request-Start': f't={time.time() - 60:.3f}'})
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert response.headers['Retry-After'] == '1'
+    assert 'counter_admission_rejected_total{reason="deadline"}' in client.get('/metrics').text
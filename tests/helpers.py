@@ -0,0 +1,10 @@
+import struct
+import zlib
+
+
+def png_header(width: int, height: int) -> bytes:
+    """A PNG holding only its header: it claims the size but has no pixel data."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr + \
+        struct.pack(">I", zlib.crc32(b"IHDR" + ihdr)) + struct.pack(">I", 0) + b"IDAT" + \
+        struct.pack(">I", zlib.crc32(b"IDAT"))
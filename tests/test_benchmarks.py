@@ -0,0 +1,26 @@
+from benchmarks.imports import package_totals, parse_importtime
+from benchmarks.report import compare_to_baseline, percentile
+
+
+def test_percentile():
+    values = sorted(range(1, 101))
+    assert (percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99)) == (50, 95, 99)
+    assert percentile([7], 0.99) == 7
+
+
+def test_compare_to_baseline():
+    baseline = {"load_p95_ms": 100, "load_rps": 50, "stage_decode_ms": 1, "count_us": 10}
+    results = {"load_p95_ms": 105, "load_rps": 40, "stage_decode_ms": 3, "count_us": 20, "new_us": 1}
+    regressions = compare_to_baseline(results, baseline, tolerance=0.1, informational=("stage_",))
+    assert [regression.split(":")[0] for regression in regressions] == ["count_us", "load_rps"]
+
+
+def test_parse_importtime():
+    output = ("import time: self [us] | cumulative | imported package\n"
+              "import time:       120 |        120 |     numpy.core\n"
+              "import time:        80 |        200 |   numpy\n"
+              "import time:        50 |        250 | counter.config\n")
+    modules = parse_importtime(output)
+    assert [(m.module, m.self_us, m.cumulative_us, m.depth) for m in modules] == [
+        ("numpy.core", 120, 120, 2), ("numpy", 80, 200, 1), ("counter.config", 50, 250, 0)]
+    assert package_totals(modules) == {"numpy": 200, "counter": 50}
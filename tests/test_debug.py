@@ -0,0 +1,60 @@
+import io
+from pathlib import Path
+
+from counter.debug import DebugSink, DEBUG_IMAGES_DROPPED, DEBUG_IMAGES_FAILED, _font
+from tests.domain.helpers import generate_prediction
+
+IMAGE_PATH = Path(__file__).parent.parent / "resources" / "images" / "cat.jpg"
+
+
+def test_sampled_requests_are_rendered_with_unique_names(tmp_path):
+    sink = DebugSink(sample_rate=1.0, directory=str(tmp_path))
+    predictions = [generate_prediction('cat', 0.9), generate_prediction('dog', 0.1)]
+
+    for _ in range(2):
+        assert sink.submit(io.BytesIO(IMAGE_PATH.read_bytes()), predictions, predictions[:1], 0.5)
+    sink.join()
+
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert len(names) == 4
+    assert sum(name.endswith("_all_predictions.jpg") for name in names) == 2
+    assert sum(name.endswith("_valid_predictions_with_threshold_0.5.jpg") for name in names) == 2
+
+
+def test_disabled_sink_renders_nothing(tmp_path):
+    sink = DebugSink(sample_rate=0.0, directory=str(tmp_path))
+    assert not sink.submit(io.BytesIO(IMAGE_PATH.read_bytes()), [], [], 0.5)
+    assert not sink.submit(None, [], [], 0.5)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_full_queue_drops_items(tmp_path):
+    sink = DebugSink(sample_rate=1.0, max_queue_size=1, directory=str(tmp_path))
+    dropped_before = DEBUG_IMAGES_DROPPED.value()
+    results = [sink.submit(io.BytesIO(IMAGE_PATH.read_bytes()), [], [], 0.5) for _ in range(20)]
+    sink.join()
+
+    assert not all(results)
+    assert DEBUG_IMAGES_DROPPED.value() - dropped_before == results.count(False)
+
+
+def test_rendering_does_not_depend_on_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _font.cache_clear()
+    sink = DebugSink(sample_rate=1.0, directory=str(tmp_path / "debug"))
+    failed_before = DEBUG_IMAGES_FAILED.value()
+    assert sink.submit(io.BytesIO(IMAGE_PATH.read_bytes()), [generate_prediction('cat', 0.9)], [], 0.5)
+    sink.join()
+
+    assert DEBUG_IMAGES_FAILED.value() == failed_before
+    assert len(list((tmp_path / "debug").iterdir())) == 2
+
+
+def test_rendering_failures_are_counted_and_logged(tmp_path, caplog):
+    sink = DebugSink(sample_rate=1.0, directory=str(tmp_path))
+    failed_before = DEBUG_IMAGES_FAILED.value()
+    assert sink.submit(io.BytesIO(b"not an image"), [], [], 0.5)
+    sink.join()
+
+    assert DEBUG_IMAGES_FAILED.value() == failed_before + 1
+    assert "debug image rendering failed" in caplog.text
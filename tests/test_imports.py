@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.imports import APP_MODULE, ROOT, cold_import_seconds
+
+# Generous for slow CI machines; lower it locally to catch smaller regressions
+COLD_IMPORT_BUDGET_MS = float(os.environ.get("COLD_IMPORT_BUDGET_MS", "1000"))
+
+UNSELECTED_ADAPTER_PACKAGES = ["sqlalchemy", "pymongo", "requests", "grpc"]
+
+
+def test_cold_import_of_the_app_is_within_budget():
+    cold_import_ms = cold_import_seconds(APP_MODULE, repeat=3) * 1000
+    assert cold_import_ms <= COLD_IMPORT_BUDGET_MS, \
+        f"cold import of {APP_MODULE} took {cold_import_ms:.0f} ms, budget {COLD_IMPORT_BUDGET_MS:.0f} ms " \
+        f"(see python -m benchmarks.imports)"
+
+
+def test_dev_app_does_not_import_unselected_adapters():
+    script = (
+        "import json, sys\n"
+        "from counter.config import get_model_registry\n"
+        "from counter.entrypoints.webapp import create_app\n"
+        "create_app()\n"
+        "assert get_model_registry().wait(10)\n"
+        f"print(json.dumps([name for name in {UNSELECTED_ADAPTER_PACKAGES!r} if name in sys.modules]))\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True, cwd=ROOT,
+                               env={**os.environ, "ENV": "dev", "DEV_COUNT_REPO": "in_memory"})
+    assert json.loads(completed.stdout.splitlines()[-1]) == []
@@ -0,0 +1,14 @@
+import json
+import logging
+
+from counter.logs import JsonFormatter
+
+
+def test_json_formatter_puts_extra_fields_at_the_top_level():
+    record = logging.LogRecord("counter.adapters.object_detector", logging.DEBUG, __file__, 1,
+                               "TFS predict request", (), None)
+    record.batch_size = 4
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "TFS predict request"
+    assert entry["level"] == "DEBUG"
+    assert entry["batch_size"] == 4
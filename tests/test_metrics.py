@@ -0,0 +1,72 @@
+import json
+import os
+
+from counter.metrics import MetricsRegistry, SharedMetrics, render_text
+
+
+def test_render_text_prometheus_format():
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Failed requests", ["model", "status"]).inc(model='a"b', status=400)
+    gauge = registry.gauge("in_flight", "Requests being processed", ["model"])
+    histogram = registry.histogram("stage_seconds", "Stage durations", ["stage"], buckets=(0.1, 1))
+    histogram.observe(0.05, stage="decode")
+    histogram.observe(0.5, stage="decode")
+    with gauge.track_inprogress(model="rfcn"):
+        assert gauge.value(model="rfcn") == 1
+        text = render_text(registry)
+
+    assert text.splitlines() == [
+        "# HELP errors_total Failed requests",
+        "# TYPE errors_total counter",
+        'errors_total{model="a\\"b",status="400"} 1',
+        "# HELP in_flight Requests being processed",
+        "# TYPE in_flight gauge",
+        'in_flight{model="rfcn"} 1',
+        "# HELP stage_seconds Stage durations",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="decode",le="0.1"} 1',
+        'stage_seconds_bucket{stage="decode",le="1"} 2',
+        'stage_seconds_bucket{stage="decode",le="+Inf"} 2',
+        'stage_seconds_sum{stage="decode"} 0.55',
+        'stage_seconds_count{stage="decode"} 2',
+    ]
+    assert gauge.value(model="rfcn") == 0
+
+
+def test_histogram_time():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Stage durations", ["stage"])
+    with histogram.time(stage="parse"):
+        pass
+    assert histogram.count(stage="parse") == 1
+
+
+def _worker_registry(errors: int, in_flight: int, seconds: float) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.counter("errors_total", "Failed requests", ["status"]).inc(errors, status=400)
+    registry.gauge("in_flight", "Requests being processed").set(in_flight)
+    registry.histogram("stage_seconds", "Stage durations", ["stage"], buckets=(0.1, 1)).observe(seconds, stage="io")
+    return registry
+
+
+def test_shared_metrics_sum_the_workers_and_keep_the_counts_of_exited_ones(tmp_path):
+    (tmp_path / "1.json").write_text(json.dumps(_worker_registry(2, 3, 0.5).snapshot()))
+    shared = SharedMetrics(_worker_registry(1, 1, 0.05), str(tmp_path))
+
+    merged = shared.collect()
+    assert merged.get("errors_total").value(status=400) == 3
+    assert merged.get("in_flight").value() == 4
+    assert merged.get("stage_seconds").bucket_counts(stage="io") == [1, 1, 0]
+
+    # The counts of an exited worker stay, its gauges go
+    SharedMetrics.retire(str(tmp_path), 1)
+    assert not (tmp_path / "1.json").exists()
+    merged = shared.collect()
+    assert merged.get("errors_total").value(status=400) == 3
+    assert merged.get("in_flight").value() == 1
+    assert merged.get("stage_seconds").count(stage="io") == 2
+
+    shared.start()
+    shared.stop()
+    snapshot = json.loads((tmp_path / f"{os.getpid()}.json").read_text())
+    assert snapshot["errors_total"]["samples"] == [[["400"], 1]]
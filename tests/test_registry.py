@@ -0,0 +1,146 @@
+import threading
+import time
+
+from counter.adapters.count_repo import CountInMemoryRepo
+from counter.adapters.object_detector import FakeObjectDetector
+from counter.domain.actions import CountDetectedObjects
+from counter.registry import ModelRegistry
+
+
+class CountingDetector(FakeObjectDetector):
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, image):
+        self.calls += 1
+        return super().predict(image)
+
+
+def test_concurrent_first_requests_build_one_action():
+    built = []
+
+    def build_action(model_name, version):
+        time.sleep(0.05)
+        built.append((model_name, version))
+        return CountDetectedObjects(FakeObjectDetector(), CountInMemoryRepo())
+
+    registry = ModelRegistry(build_action, lambda model_name: 2, ["fake"])
+    actions = []
+    threads = [threading.Thread(target=lambda: actions.append(registry.get("fake"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert built == [("fake", 2)]
+    assert all(action is actions[0] for action in actions)
+
+
+def test_start_warms_up_every_model_without_storing_counts():
+    detectors, repo = {}, CountInMemoryRepo()
+
+    def build_action(model_name, version):
+        detectors[model_name] = CountingDetector()
+        return CountDetectedObjects(detectors[model_name], repo)
+
+    registry = ModelRegistry(build_action, lambda model_name: None, ["fake", "rfcn"], warmup_requests=3)
+    assert not registry.ready
+    registry.start(background=True).join()
+
+    assert registry.ready and registry.wait(0)
+    assert {name: detector.calls for name, detector in detectors.items()} == {"fake": 3, "rfcn": 3}
+    assert repo.read_values() == []
+    status = registry.status()
+    assert status["rfcn"]["ready"] and status["rfcn"]["warmup_seconds"] >= 0
+    assert registry.start() is None
+
+
+def test_unresolved_model_is_served_unpinned_but_not_ready():
+    def resolve_version(model_name):
+        raise TimeoutError(f"version 4 of model {model_name} not AVAILABLE after 0s")
+
+    registry = ModelRegistry(lambda model_name, version: CountDetectedObjects(CountingDetector(), CountInMemoryRepo()),
+                             resolve_version, ["rfcn"])
+    registry.start()
+
+    assert not registry.ready
+    assert registry.status()["rfcn"] == {"model_name": "rfcn", "version": None, "ready": False,
+                                         "warmup_seconds": None,
+                                         "error": "version 4 of model rfcn not AVAILABLE after 0s"}
+    assert registry.get("rfcn") is not None
+    registry.stop()
+
+
+def test_unresolved_model_is_retried_and_pinned_once_served():
+    attempts = []
+
+    def resolve_version(model_name):
+        attempts.append(model_name)
+        if len(attempts) < 3:
+            raise TimeoutError(f"model {model_name} not AVAILABLE")
+        return 7
+
+    built = []
+
+    def build_action(model_name, version):
+        built.append(version)
+        return CountDetectedObjects(CountingDetector(), CountInMemoryRepo())
+
+    registry = ModelRegistry(build_action, resolve_version, ["rfcn"], retry_interval=0.01)
+    registry.start()
+    unpinned = registry.get("rfcn")
+    try:
+        deadline = time.monotonic() + 5
+        while not registry.ready and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        registry.stop()
+
+    assert registry.ready
+    assert built == [None, 7]
+    assert registry.get("rfcn") is not unpinned
+    assert registry.status()["rfcn"]["version"] == 7 and registry.status()["rfcn"]["error"] is None
+
+
+def test_building_a_model_does_not_block_the_others():
+    resolving, release = threading.Event(), threading.Event()
+
+    def resolve_version(model_name):
+        if model_name == "slow":
+            resolving.set()
+            release.wait(5)
+        return 1
+
+    registry = ModelRegistry(lambda model_name, version: CountDetectedObjects(FakeObjectDetector(),
+                                                                                CountInMemoryRepo()),
+                             resolve_version, [])
+    slow = threading.Thread(target=registry.get, args=("slow",))
+    slow.start()
+    try:
+        assert resolving.wait(5)
+        started = time.monotonic()
+        assert registry.get("fast") is not None
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        slow.join()
+
+
+def test_close_closes_every_action_built():
+    closed = []
+
+    class ClosingRepo(CountInMemoryRepo):
+        def __init__(self, model_name):
+            super().__init__()
+            self.model_name = model_name
+
+        def close(self):
+            closed.append(self.model_name)
+
+    registry = ModelRegistry(lambda model_name, version: CountDetectedObjects(FakeObjectDetector(),
+                                                                                ClosingRepo(model_name)),
+                             lambda model_name: None, ["fake", "rfcn"])
+    registry.start()
+    registry.close()
+
+    assert sorted(closed) == ["fake", "rfcn"]